@@ -14,6 +14,8 @@ from llama_index.core import (
 )
 import argparse
 from llama_index.core.schema import MetadataMode
+from app.services.phone_routing import resolve_phone_route
+from app.services.agent_cache import start_change_stream_listener
 import os
 import uuid
 import jwt
@@ -39,7 +41,6 @@ livekit_api_secret = os.getenv("LIVEKIT_API_SECRET")
 deepgram_api_key = os.getenv("DEEPGRAM_API_KEY")
 
 database_name = "voice_ai_app_db"
-collection_name = "users"
 
 # Check if all required environment variables are loaded
 if not mongo_user or not mongo_password or not mongo_host:
@@ -102,60 +103,30 @@ def decode_jwt_and_get_room(token):
 
 
 
+_mongo_client = None
+
 def get_mongo_client():
-    connection_string = f"mongodb+srv://{mongo_user}:{mongo_password}@{mongo_host}?retryWrites=true&w=majority"
-    return MongoClient(connection_string)
+    # One client per worker process; agent lookups are then served from the agent cache
+    global _mongo_client
+    if _mongo_client is None:
+        connection_string = f"mongodb+srv://{mongo_user}:{mongo_password}@{mongo_host}?retryWrites=true&w=majority"
+        _mongo_client = MongoClient(connection_string)
+    return _mongo_client
 
 # Function to retrieve assistant data from MongoDB by phone number
 def get_assistant_data(phone_number):
     client = get_mongo_client()
     db = client[database_name]
-    collection = db[collection_name]
-    
-    # Normalize the phone number by stripping any '+' prefix
-    normalized_phone_number = phone_number.lstrip('+')
-    
-    # Create both versions of the phone number (with and without '+')
-    phone_numbers_to_check = [normalized_phone_number, f'+{normalized_phone_number}']
-    
-    # Use the $in operator to check for both versions in the query
-    user_data = collection.find_one({
-        "agents.phone_number": {"$in": phone_numbers_to_check}
-    })
-
-    if user_data:
-        for agent in user_data['agents']:
-            # Normalize the agent's phone number as well
-            agent_phone_number = agent['phone_number'].lstrip('+')
-            if agent_phone_number == normalized_phone_number:
-                # Extract user_id and agent_id for persist directory
-                user_id = user_data['_id']
-                agent_id = agent['id']
-                rag_enabled = agent.get('rag_enabled', False)
-                
-                # If RAG is enabled, use RAG-specific assistant data
-                if rag_enabled:
-                    return get_rag_assistant_data(agent, user_id, agent_id)
-                else:
-                    return agent, None  # No persist directory needed without RAG
+
+    # Exact-match lookup on the canonical E.164 field, shared with log ingestion and campaigns
+    route = resolve_phone_route(db, phone_number)
+    if not route:
         print(f"No agent found with phone number: {phone_number}")
         return None, None
-    else:
-        print(f"No user found with an agent having phone number: {phone_number}")
-        return None, None
 
-# RAG-specific assistant data retrieval
-def get_rag_assistant_data(agent, user_id, agent_id):
-    print("RAG is enabled. Fetching RAG-specific assistant data...")
-    
-    # Define persist directory based on user_id and agent_id
-    persist_dir = f"uploads/{user_id}/{agent_id}/lamadir"
-    
-    # Ensure the directory exists or contains necessary files
-    if not os.path.exists(persist_dir):
-        print(f"Persist directory not found: {persist_dir}")
-    
-    return agent, persist_dir
+    if route.persist_dir:
+        print("RAG is enabled. Fetching RAG-specific assistant data...")
+    return route.agent, route.persist_dir
 
 def create_identity_folder(identity):
     folder_name = f"logs/{identity}"
@@ -164,6 +135,8 @@ def create_identity_folder(identity):
 
 def prewarm_fnc(proc: JobProcess):
     proc.userdata["vad"] = silero.VAD.load()
+    # Invalidate cached agent configs when they are edited through the API on another node
+    start_change_stream_listener(get_mongo_client()[database_name])
 
 # RAG-specific assistant reply synthesis
 async def _will_synthesize_assistant_reply(assistant: VoiceAssistant, chat_ctx: llm.ChatContext, persist_dir):
@@ -9,6 +9,11 @@ def main():
     parser_start = subparsers.add_parser('start', help='Start the AI Studio application')
     parser_start.add_argument('component', nargs='?', default='api', choices=['api', 'agent', 'vision-agent'], help='Component to start: api, agent, or vision-agent')
 
+    # Subcommand 'db'
+    parser_db = subparsers.add_parser('db', help='Database maintenance tasks')
+    parser_db.add_argument('action', choices=['migrate', 'check-indexes', 'rebuild-rollups', 'export-parquet', 'archive-logs'], help='migrate: run data migrations, create indexes and verify them, check-indexes: only verify index coverage, rebuild-rollups: recompute usage rollups from the call and chat logs, export-parquet: incremental Parquet export of the logs, archive-logs: move logs past their retention period to compressed archive segments')
+    parser_db.add_argument('--user-id', help='rebuild-rollups, archive-logs: only this user')
+
     args = parser.parse_args()
 
     if args.command == 'start':
@@ -20,6 +25,17 @@ def main():
             start_vision_agent()
         else:
             parser.error('Invalid component specified.')
+    elif args.command == 'db':
+        if args.action == 'migrate':
+            migrate_db()
+        elif args.action == 'check-indexes':
+            check_indexes()
+        elif args.action == 'rebuild-rollups':
+            rebuild_rollups(args.user_id)
+        elif args.action == 'export-parquet':
+            export_parquet()
+        elif args.action == 'archive-logs':
+            archive_logs(args.user_id)
     else:
         parser.print_help()
 
@@ -38,5 +54,50 @@ def start_vision_agent():
     import subprocess
     subprocess.run(['python', 'app/agents/agent_vision.py', 'start'])
 
+def migrate_db():
+    # Run data migrations, apply the index registry, then make sure every hot query shape uses it
+    from app.db.databases import get_database
+    from app.db.indexes import ensure_indexes
+    from app.db.migrations import run_migrations
+    db = get_database()
+    for name, result in run_migrations(db).items():
+        print(f"migration {name}: {result}")
+    for collection_name, names in ensure_indexes(db).items():
+        print(f"{collection_name}: {', '.join(names)}")
+    check_indexes()
+
+def check_indexes():
+    from app.db.databases import get_database
+    from app.db.indexes import check_index_coverage, IndexCoverageError
+    try:
+        checked = check_index_coverage(get_database())
+    except IndexCoverageError as e:
+        print(e)
+        sys.exit(1)
+    print(f"All {checked} registered query shapes are covered by an index.")
+
+def rebuild_rollups(user_id=None):
+    # Backfill the usage rollups; stop the log processor first so no live increments are lost
+    from app.db.databases import get_database
+    from app.services.usage_rollups import rebuild_usage_rollups
+    written = rebuild_usage_rollups(get_database(), user_id)
+    print(f"Rolled up {written['call_logs']} call logs and {written['chat_logs']} chat logs.")
+
+def export_parquet():
+    # Same job as POST /exports/parquet/, for cron
+    from app.db.databases import get_database
+    from app.services.parquet_export import run_parquet_export
+    results = run_parquet_export(get_database())
+    if results is None:
+        print("A Parquet export is already running.")
+        sys.exit(1)
+
+def archive_logs(user_id=None):
+    # Throttled retention job, meant for cron; run export-parquet first if the logs should be exported
+    from app.db.databases import get_database
+    from app.services.retention import run_archival
+    results = run_archival(get_database(), user_id)
+    print(f"Archived logs for {len(results)} users.")
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,38 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.db.databases import (
+    database_name,
+    get_connection_string,
+    max_pool_size,
+    min_pool_size,
+    max_idle_time_ms,
+)
+
+_async_client = None
+
+
+def init_async_client():
+    """
+    Create the process-wide Motor client. Must be called from the event loop
+    the API runs on (FastAPI startup), since Motor binds to the running loop.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncIOMotorClient(
+            get_connection_string(),
+            serverSelectionTimeoutMS=5000,
+            maxPoolSize=max_pool_size,
+            minPoolSize=min_pool_size,
+            maxIdleTimeMS=max_idle_time_ms,
+        )
+    return _async_client
+
+
+def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        _async_client.close()
+        _async_client = None
+
+
+def get_async_database():
+    return init_async_client()[database_name]
@@ -1,23 +1,136 @@
-from pymongo import MongoClient, errors
+import os
+import threading
+from pymongo import MongoClient, errors, monitoring
 
 mongo_user = "aj"
 mongo_password = "kesavan12"
 mongo_host = "haive.v5q7m.mongodb.net"
 database_name = "voice_ai_app_db"
 
+# Connection pool settings, overridable per deployment
+max_pool_size = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+min_pool_size = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+max_idle_time_ms = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Keeps running counters of connection pool activity for the shared client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {
+            "connections_open": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checked_out": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "pools_cleared": 0,
+        }
+
+    def _inc(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._inc("pools_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._inc("connections_created")
+        self._inc("connections_open")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._inc("connections_closed")
+        self._inc("connections_open", -1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._inc("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._inc("checkouts")
+        self._inc("checked_out")
+
+    def connection_checked_in(self, event):
+        self._inc("checked_out", -1)
+
+
+pool_stats_listener = PoolStatsListener()
+
+
+def get_connection_string():
+    return f"mongodb+srv://{mongo_user}:{mongo_password}@{mongo_host}/?retryWrites=true&w=majority"
+
+
+def init_client():
+    """
+    Create the process-wide MongoClient if it does not exist yet.
+    The connection is verified with a single ping at creation time only.
+    """
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is not None:
+            return _client
+        try:
+            client = MongoClient(
+                get_connection_string(),
+                serverSelectionTimeoutMS=5000,
+                maxPoolSize=max_pool_size,
+                minPoolSize=min_pool_size,
+                maxIdleTimeMS=max_idle_time_ms,
+                event_listeners=[pool_stats_listener],
+            )
+            # Ping the database to check if the connection is successful
+            client.admin.command('ping')
+        except errors.ConfigurationError as config_error:
+            print(f"MongoDB Configuration Error: {config_error}")
+            raise
+        except errors.ServerSelectionTimeoutError as timeout_error:
+            print(f"MongoDB Connection Timeout: {timeout_error}")
+            raise
+        _client = client
+        return _client
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
 def get_database():
-    # Construct the MongoDB connection string
-    connection_string = f"mongodb+srv://{mongo_user}:{mongo_password}@{mongo_host}/?retryWrites=true&w=majority"
-    
-    try:
-        # Establish a connection to MongoDB
-        client = MongoClient(connection_string, serverSelectionTimeoutMS=5000)
-        # Ping the database to check if the connection is successful
-        client.admin.command('ping')
-        return client[database_name]
-    except errors.ConfigurationError as config_error:
-        print(f"MongoDB Configuration Error: {config_error}")
-        raise
-    except errors.ServerSelectionTimeoutError as timeout_error:
-        print(f"MongoDB Connection Timeout: {timeout_error}")
-        raise
+    # Reuse the pooled client; scripts that never call init_client() get it lazily
+    return init_client()[database_name]
+
+
+def get_pool_stats():
+    stats = pool_stats_listener.snapshot()
+    stats["max_pool_size"] = max_pool_size
+    stats["min_pool_size"] = min_pool_size
+    stats["client_initialized"] = _client is not None
+    return stats
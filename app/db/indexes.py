@@ -0,0 +1,153 @@
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+
+# Declarative registry of every index the app relies on, per collection.
+# Index names are fixed so that create_indexes() is idempotent across deploys.
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_1"),
+    ],
+    "agents": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_1"),
+        IndexModel([("phone_e164", ASCENDING)], name="phone_e164_1"),
+        IndexModel([("user_id", ASCENDING), ("phone_e164", ASCENDING)], name="user_id_1_phone_e164_1"),
+    ],
+    "call_logs": [
+        IndexModel([("user_id", ASCENDING), ("start_time", DESCENDING), ("_id", DESCENDING)], name="user_id_1_start_time_-1__id_-1"),
+        IndexModel([("user_id", ASCENDING), ("call_log_id", ASCENDING)], name="user_id_1_call_log_id_1"),
+    ],
+    "call_messages": [
+        # Transcript pages and the migration's idempotent upserts
+        IndexModel([("user_id", ASCENDING), ("call_log_id", ASCENDING), ("seq", ASCENDING), ("_id", ASCENDING)], name="user_id_1_call_log_id_1_seq_1__id_1"),
+        # Transcript search; the user_id prefix keeps each search inside one tenant
+        IndexModel([("user_id", ASCENDING), ("message", TEXT)], name="user_id_1_message_text"),
+    ],
+    "chat_logs": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_id_1_created_at_-1__id_-1"),
+        IndexModel([("chat_id", ASCENDING)], name="chat_id_1"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at_1"),
+        IndexModel([("user_id", ASCENDING), ("chat_data.content", TEXT)], name="user_id_1_chat_data.content_text"),
+    ],
+    "campaigns": [
+        IndexModel([("campaign_id", ASCENDING), ("email", ASCENDING)], name="campaign_id_1_email_1"),
+        IndexModel([("email", ASCENDING)], name="email_1"),
+    ],
+    "logs": [
+        IndexModel([("email", ASCENDING), ("phone_e164", ASCENDING)], name="email_1_phone_e164_1"),
+    ],
+    "dynamic_data": [
+        IndexModel([("user_id", ASCENDING), ("agent_id", ASCENDING), ("_id", DESCENDING)], name="user_id_1_agent_id_1__id_-1"),
+    ],
+    "archived_logs": [
+        # One entry per archived document; a chat resumed after archiving has several
+        IndexModel(
+            [("user_id", ASCENDING), ("kind", ASCENDING), ("log_id", ASCENDING), ("source_id", ASCENDING)],
+            name="user_id_1_kind_1_log_id_1_source_id_1",
+            unique=True,
+        ),
+    ],
+    "usage_rollups": [
+        # Unique bucket key for the $inc upserts; its prefix serves dashboard range reads
+        IndexModel(
+            [("user_id", ASCENDING), ("granularity", ASCENDING), ("bucket_start", ASCENDING), ("agent_id", ASCENDING), ("channel", ASCENDING)],
+            name="user_id_1_granularity_1_bucket_start_1_agent_id_1_channel_1",
+            unique=True,
+        ),
+    ],
+}
+
+# Indexes this registry used to create and that newer entries above supersede
+OBSOLETE_INDEXES = {
+    "call_logs": ["user_id_1_start_time_-1"],
+    "chat_logs": ["user_id_1_created_at_-1"],
+    "dynamic_data": ["user_id_1_agent_id_1"],
+    "archived_logs": ["user_id_1_kind_1_log_id_1"],
+}
+
+# Hot query shapes that must be served by an index. The values are
+# placeholders: only the shape of the filter and sort matters to the planner.
+_SAMPLE = "__index_check__"
+_SAMPLE_TIME = datetime(1970, 1, 1)
+
+QUERY_SHAPES = [
+    {"collection": "users", "filter": {"email": _SAMPLE}},
+    {"collection": "agents", "filter": {"user_id": _SAMPLE}},
+    {"collection": "agents", "filter": {"phone_e164": _SAMPLE}},
+    {"collection": "agents", "filter": {"user_id": _SAMPLE, "phone_e164": _SAMPLE}},
+    {"collection": "call_logs", "filter": {"user_id": _SAMPLE}, "sort": [("start_time", DESCENDING), ("_id", DESCENDING)]},
+    {"collection": "call_logs", "filter": {"user_id": _SAMPLE, "start_time": {"$gte": _SAMPLE_TIME}}},
+    {"collection": "call_logs", "filter": {"user_id": _SAMPLE, "call_log_id": _SAMPLE}},
+    {"collection": "call_messages", "filter": {"user_id": _SAMPLE, "call_log_id": _SAMPLE}, "sort": [("seq", ASCENDING), ("_id", ASCENDING)]},
+    {"collection": "call_messages", "filter": {"user_id": _SAMPLE, "$text": {"$search": _SAMPLE}}},
+    {"collection": "chat_logs", "filter": {"user_id": _SAMPLE}, "sort": [("created_at", DESCENDING), ("_id", DESCENDING)]},
+    {"collection": "chat_logs", "filter": {"user_id": _SAMPLE, "created_at": {"$gte": _SAMPLE_TIME}}},
+    {"collection": "chat_logs", "filter": {"chat_id": _SAMPLE}},
+    {"collection": "chat_logs", "filter": {"user_id": _SAMPLE, "$text": {"$search": _SAMPLE}}},
+    {"collection": "chat_logs", "filter": {"updated_at": {"$gt": _SAMPLE_TIME}}, "sort": [("updated_at", ASCENDING)]},
+    {"collection": "campaigns", "filter": {"campaign_id": _SAMPLE, "email": _SAMPLE}},
+    {"collection": "logs", "filter": {"email": _SAMPLE, "phone_e164": _SAMPLE}},
+    {"collection": "logs", "filter": {"email": _SAMPLE}},
+    {"collection": "dynamic_data", "filter": {"user_id": _SAMPLE, "agent_id": _SAMPLE}, "sort": [("_id", DESCENDING)]},
+    {"collection": "archived_logs", "filter": {"user_id": _SAMPLE, "kind": "call", "log_id": _SAMPLE}, "sort": [("source_id", DESCENDING)]},
+    {"collection": "usage_rollups", "filter": {"user_id": _SAMPLE, "granularity": "hour", "bucket_start": {"$gte": _SAMPLE_TIME}}},
+]
+
+
+class IndexCoverageError(RuntimeError):
+    pass
+
+
+def ensure_indexes(db):
+    """
+    Create every registered index and drop the superseded ones. Existing
+    indexes with the same spec are left untouched.
+    """
+    created = {}
+    for collection_name, models in INDEXES.items():
+        created[collection_name] = db[collection_name].create_indexes(models)
+    for collection_name, names in OBSOLETE_INDEXES.items():
+        existing = db[collection_name].index_information()
+        for name in names:
+            if name in existing:
+                db[collection_name].drop_index(name)
+    return created
+
+
+def _plan_stages(plan):
+    # Walk a winning plan tree and yield every stage name in it
+    if not isinstance(plan, dict):
+        return
+    stage = plan.get("stage")
+    if stage:
+        yield stage
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+def explain_query_shape(db, shape):
+    cursor = db[shape["collection"]].find(shape["filter"])
+    if shape.get("sort"):
+        cursor = cursor.sort(shape["sort"])
+    explanation = cursor.explain()
+    winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+    return list(_plan_stages(winning_plan))
+
+
+def check_index_coverage(db, shapes=None):
+    """
+    Explain every registered query shape and raise IndexCoverageError if any
+    of them would scan the collection or sort in memory.
+    """
+    failures = []
+    for shape in shapes or QUERY_SHAPES:
+        stages = explain_query_shape(db, shape)
+        if "COLLSCAN" in stages:
+            failures.append(f"{shape['collection']} {shape['filter']}: collection scan")
+        elif shape.get("sort") and "SORT" in stages:
+            failures.append(f"{shape['collection']} {shape['filter']} sort {shape['sort']}: in-memory sort")
+    if failures:
+        raise IndexCoverageError("Query shapes not covered by an index:\n" + "\n".join(failures))
+    return len(shapes or QUERY_SHAPES)
@@ -0,0 +1,85 @@
+from pymongo import ReplaceOne, UpdateOne
+from app.services.phone_routing import normalize_e164
+from app.services.call_transcripts import save_call_messages
+
+# One-shot data migrations, run with `aistudio db migrate`. Each one is
+# idempotent so re-running it on every deploy is harmless once done.
+
+
+def migrate_embedded_agents(db, batch_size: int = 500):
+    """
+    Move agents from the embedded `users.agents` array into the `agents`
+    collection, keyed by agent id, then drop the array from the user document.
+    """
+    migrated_users = 0
+    migrated_agents = 0
+    cursor = db.users.find({"agents": {"$exists": True}}, {"agents": 1})
+    for user in cursor:
+        agents = user.get("agents") or []
+        operations = []
+        for agent in agents:
+            agent_doc = dict(agent)
+            agent_doc["_id"] = agent["id"]
+            agent_doc["user_id"] = user["_id"]
+            operations.append(ReplaceOne({"_id": agent_doc["_id"]}, agent_doc, upsert=True))
+        for start in range(0, len(operations), batch_size):
+            db.agents.bulk_write(operations[start:start + batch_size], ordered=False)
+        # Only unset once the agents are safely written to their own collection
+        db.users.update_one({"_id": user["_id"]}, {"$unset": {"agents": ""}})
+        migrated_users += 1
+        migrated_agents += len(operations)
+    return {"users": migrated_users, "agents": migrated_agents}
+
+
+def migrate_phone_e164(db, batch_size: int = 500):
+    """Backfill the canonical `phone_e164` routing field on agents and SIP trunks."""
+    results = {}
+    for collection_name in ("agents", "logs"):
+        collection = db[collection_name]
+        operations = []
+        updated = 0
+        cursor = collection.find({"phone_e164": {"$exists": False}}, {"phone_number": 1})
+        for doc in cursor:
+            phone_e164 = normalize_e164(doc.get("phone_number"))
+            operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"phone_e164": phone_e164}}))
+            if len(operations) >= batch_size:
+                updated += collection.bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            updated += collection.bulk_write(operations, ordered=False).modified_count
+        results[collection_name] = updated
+    return results
+
+
+def migrate_call_messages(db):
+    """
+    Move embedded `call_logs.messages` arrays into `call_messages`, then
+    replace the array with a `message_count` on the call log.
+    """
+    migrated_calls = 0
+    migrated_messages = 0
+    cursor = db.call_logs.find({"messages": {"$exists": True}}, {"call_log_id": 1, "user_id": 1, "agent_id": 1, "messages": 1})
+    for call_log in cursor:
+        messages = call_log.get("messages") or []
+        migrated_messages += save_call_messages(db, call_log, messages)
+        # Only unset once the transcript is safely written to its own collection
+        db.call_logs.update_one(
+            {"_id": call_log["_id"]},
+            {"$unset": {"messages": ""}, "$set": {"message_count": len(messages)}},
+        )
+        migrated_calls += 1
+    return {"call_logs": migrated_calls, "messages": migrated_messages}
+
+
+MIGRATIONS = [
+    ("embedded_agents", migrate_embedded_agents),
+    ("phone_e164", migrate_phone_e164),
+    ("call_messages", migrate_call_messages),
+]
+
+
+def run_migrations(db):
+    results = {}
+    for name, migration in MIGRATIONS:
+        results[name] = migration(db)
+    return results
@@ -0,0 +1,79 @@
+import base64
+from typing import Any, Dict, List, Optional, Tuple
+from bson import json_util
+from pymongo import ASCENDING, DESCENDING
+
+# Keyset (seek) pagination: pages are addressed by the sort key of the last
+# row returned rather than by an offset, so every page is an index range scan
+# no matter how deep into the result set the client is.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(values: List[Any]) -> str:
+    # Extended JSON keeps datetimes and ObjectIds round-trippable
+    raw = json_util.dumps(values).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _after_filter(sort_field: Optional[str], values: List[Any], descending: bool) -> Dict[str, Any]:
+    op = "$lt" if descending else "$gt"
+    if sort_field is None:
+        return {"_id": {op: values[0]}}
+    sort_value, last_id = values
+    return {"$or": [
+        {sort_field: {op: sort_value}},
+        {sort_field: sort_value, "_id": {op: last_id}},
+    ]}
+
+
+def keyset_page(
+    collection,
+    query: Dict[str, Any],
+    sort_field: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    descending: bool = True,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Fetch one page ordered by (sort_field, _id), or by _id alone when
+    sort_field is None. Returns the documents and the cursor for the next
+    page, which is None on the last page. A projection must keep `_id` and
+    `sort_field`, since the next cursor is built from them.
+    """
+    if after:
+        query = {"$and": [query, _after_filter(sort_field, decode_cursor(after), descending)]}
+    direction = DESCENDING if descending else ASCENDING
+    sort = [("_id", direction)] if sort_field is None else [(sort_field, direction), ("_id", direction)]
+
+    # One extra row tells us whether there is a next page without a count query
+    docs = list(collection.find(query, projection).sort(sort).limit(limit + 1))
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        values = [last["_id"]] if sort_field is None else [last.get(sort_field), last["_id"]]
+        next_cursor = encode_cursor(values)
+    return docs, next_cursor
+
+
+def date_range(field: str, start=None, end=None) -> Dict[str, Any]:
+    """Query fragment for an optional [start, end) window on `field`."""
+    bounds = {}
+    if start:
+        bounds["$gte"] = start
+    if end:
+        bounds["$lt"] = end
+    return {field: bounds} if bounds else {}
@@ -0,0 +1,29 @@
+from typing import Dict, Iterable, List, Optional
+
+# Fields returned by the `summary` mode of the listing endpoints: enough for a
+# dashboard row, without system prompts or knowledge-base file lists.
+AGENT_SUMMARY_FIELDS = ["id", "agent_name", "phone_number", "agent_type"]
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """
+    Parse a comma-separated `fields=` query value. Returns None when no
+    selection was requested and raises ValueError on unknown field names.
+    """
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = sorted(set(requested) - set(allowed))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+
+def build_projection(field_list: Optional[List[str]], always: Iterable[str] = ("id",)) -> Optional[Dict[str, int]]:
+    """Turn a field list into a Mongo inclusion projection; None means the whole document."""
+    if field_list is None:
+        return None
+    projection = {"_id": 0}
+    for field in list(always) + list(field_list):
+        projection[field] = 1
+    return projection
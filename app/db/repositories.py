@@ -0,0 +1,117 @@
+from typing import Any, Dict, List, Optional
+from app.services.phone_routing import normalize_e164
+
+# Async data-access layer used by the `async def` endpoints. Each repository
+# wraps one Motor collection so handlers never block the event loop on I/O.
+# Sync `def` endpoints keep using the pooled pymongo client from databases.py,
+# which is thread-safe and runs in FastAPI's threadpool.
+
+
+class Repository:
+    collection_name: str = ""
+
+    def __init__(self, db):
+        self.collection = db[self.collection_name]
+
+    async def find_one(self, query: Dict[str, Any], projection: Optional[Dict[str, Any]] = None):
+        return await self.collection.find_one(query, projection)
+
+    async def find(
+        self,
+        query: Dict[str, Any],
+        projection: Optional[Dict[str, Any]] = None,
+        sort: Optional[List] = None,
+        limit: int = 0,
+    ) -> List[Dict[str, Any]]:
+        cursor = self.collection.find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
+
+    async def insert_one(self, document: Dict[str, Any]):
+        return await self.collection.insert_one(document)
+
+    async def update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        return await self.collection.update_one(query, update, upsert=upsert)
+
+    async def delete_one(self, query: Dict[str, Any]):
+        return await self.collection.delete_one(query)
+
+
+class UsersRepository(Repository):
+    collection_name = "users"
+
+    async def get_user(self, user_id: str, projection: Optional[Dict[str, Any]] = None):
+        return await self.find_one({"_id": user_id}, projection)
+
+    async def exists(self, user_id: str) -> bool:
+        return await self.find_one({"_id": user_id}, {"_id": 1}) is not None
+
+
+class AgentsRepository(Repository):
+    collection_name = "agents"
+
+    async def get_agent(self, user_id: str, agent_id: str, projection: Optional[Dict[str, Any]] = None):
+        return await self.find_one({"_id": agent_id, "user_id": user_id}, projection)
+
+    async def set_fields(self, user_id: str, agent_id: str, fields: Dict[str, Any]):
+        return await self.update_one({"_id": agent_id, "user_id": user_id}, {"$set": fields})
+
+
+class SipTrunksRepository(Repository):
+    # SIP trunk configurations live in the historically named `logs` collection
+    collection_name = "logs"
+
+    async def find_by_email(self, email: str):
+        return await self.find({"email": email})
+
+    # Trunks are matched on the canonical E.164 field so '+1555…' and '1555…' agree
+    async def find_trunk(self, email: str, phone_number: str):
+        return await self.find_one({"email": email, "phone_e164": normalize_e164(phone_number)})
+
+    async def update_trunk(self, email: str, phone_number: str, fields: Dict[str, Any]):
+        return await self.update_one({"email": email, "phone_e164": normalize_e164(phone_number)}, {"$set": fields})
+
+    async def delete_trunk(self, email: str, phone_number: str):
+        return await self.delete_one({"email": email, "phone_e164": normalize_e164(phone_number)})
+
+
+class CallLogsRepository(Repository):
+    collection_name = "call_logs"
+
+
+class ChatLogsRepository(Repository):
+    collection_name = "chat_logs"
+
+
+class DynamicDataRepository(Repository):
+    collection_name = "dynamic_data"
+
+
+class CampaignsRepository(Repository):
+    collection_name = "campaigns"
+
+    async def get_campaign(self, campaign_id: str, email: str):
+        return await self.find_one({"campaign_id": campaign_id, "email": email})
+
+
+class Repositories:
+    """Bundle of repositories bound to one async database handle."""
+
+    def __init__(self, db):
+        self.users = UsersRepository(db)
+        self.agents = AgentsRepository(db)
+        self.sip_trunks = SipTrunksRepository(db)
+        self.call_logs = CallLogsRepository(db)
+        self.chat_logs = ChatLogsRepository(db)
+        self.dynamic_data = DynamicDataRepository(db)
+        self.campaigns = CampaignsRepository(db)
+
+    async def find_user_agent(self, user_id: str, agent_id: str):
+        """Return (user_exists, agent); the user is only looked up when the agent is missing."""
+        agent = await self.agents.get_agent(user_id, agent_id)
+        if agent:
+            return True, agent
+        return await self.users.exists(user_id), None
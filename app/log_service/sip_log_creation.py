@@ -8,6 +8,10 @@ from openai import OpenAI
 import asyncio  # For handling asynchronous operations
 from tenacity import retry, stop_after_attempt, wait_random_exponential  # For retrying API calls
 from dotenv import load_dotenv
+from app.services.phone_routing import resolve_phone_route
+from app.services.agent_cache import get_agent_by_id, start_change_stream_listener
+from app.services.usage_rollups import record_call
+from app.services.call_transcripts import save_call_messages
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,7 +22,6 @@ mongo_password = os.getenv("MONGO_PASSWORD")
 mongo_host = os.getenv("MONGO_HOST")
 database_name = "voice_ai_app_db"
 call_logs_collection_name = "call_logs"
-users_collection_name = "users"
 
 # Build the MongoDB connection URI
 mongo_uri = (
@@ -30,7 +33,6 @@ mongo_uri = (
 client = pymongo.MongoClient(mongo_uri)
 db = client[database_name]
 call_logs_collection = db[call_logs_collection_name]
-users_collection = db[users_collection_name]
 
 # Define the path to the logs directory
 logs_dir = '/root/backend/Phone-Call-Agent-backend/logs'  # Use the default folder as specified
@@ -110,25 +112,22 @@ def process_log_file(file_path):
 
     return timestamps, messages, total_tokens_llm, total_tokens_stt, total_tokens_tts
 
-# Function to find agent information from the users collection
+# Function to find agent information from the agents collection
 def find_agent_info(agent_identifier, identifier_type):
     if identifier_type == 'phone_number':
-        # Normalize phone number by removing '+' and any non-digit characters
-        normalized_number = re.sub(r'\D', '', agent_identifier)
-        # Build query to match phone numbers ending with the normalized number
-        query = {'agents.phone_number': {'$regex': f'{normalized_number}$'}}
-        projection = {'agents.$': 1, '_id': 1}
+        # Indexed exact match on the canonical E.164 field
+        route = resolve_phone_route(db, agent_identifier)
+        if route:
+            return route.agent, route.user_id
+        return None, None
     elif identifier_type == 'agent_id':
         # For web calls, match agent_id
-        query = {'agents.id': agent_identifier}
-        projection = {'agents.$': 1, '_id': 1}
+        agent_info = get_agent_by_id(db, agent_identifier)
     else:
         return None, None
 
-    user_doc = users_collection.find_one(query, projection)
-    if user_doc and 'agents' in user_doc:
-        agent_info = user_doc['agents'][0]
-        user_id = str(user_doc['_id'])  # Convert ObjectId to string
+    if agent_info:
+        user_id = str(agent_info['user_id'])
         return agent_info, user_id
     else:
         return None, None
@@ -229,7 +228,7 @@ async def process_logs():
                                 'start_time': start_time,
                                 'end_time': end_time,
                                 'duration': duration,
-                                'messages': messages,
+                                'message_count': len(messages),
                                 'tts_name': tts_name,
                                 'stt_name': stt_name,
                                 'llm_name': llm_name,
@@ -244,9 +243,13 @@ async def process_logs():
                                 'conversation_analysis': conversation_analysis
                             }
 
-                            # Insert into MongoDB
+                            # Store the transcript first, then the call metadata that points to it
+                            save_call_messages(db, call_log, messages)
                             call_logs_collection.insert_one(call_log)
 
+                            # Add the call to the hourly and daily usage rollups
+                            record_call(db, call_log)
+
                             # Delete the log file after processing
                             os.remove(file_path)
 
@@ -259,4 +262,5 @@ async def process_logs():
 
 # Run the main processing function
 if __name__ == "__main__":
+    start_change_stream_listener(db)
     asyncio.run(process_logs())
@@ -1,7 +1,7 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Query, BackgroundTasks, Body,Request
 from livekit import api
 from typing import List, Optional
-from app.models.model import User, AI_Agent,CallLog,Message,DashboardData
+from app.models.model import User, AI_Agent,CallLogSummary,Message,DashboardData,AgentSummary,UserSummary,CallLogPage,CallMessagePage,ChatLogPage,DynamicDataPage
 from app.models.schemas import (
     UserCreate,
     UserUpdate,
@@ -14,35 +14,67 @@ from app.models.schemas import (
     DynamicDataRequest,
     CampaignUpdate,
     CampaignCreate,
+    RetentionUpdate,
     Campaign,
     PhoneNumberDeleteRequest,
     PhoneNumberUpdateRequest
 )
-import io
 import csv
 
 
-from app.db.databases import get_database
-from app.services.utils import extract_text_from_file, delete_directory
-from app.services.llama_index_integration import process_files_with_llama_index, load_index_and_query
+from app.db.databases import get_database, init_client, close_client, get_pool_stats
+from app.db.async_databases import get_async_database, init_async_client, close_async_client
+from app.db.repositories import Repositories
+from app.db.projections import AGENT_SUMMARY_FIELDS, parse_fields, build_projection
+from app.db.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_page, date_range
+from bson import ObjectId
+from app.db.indexes import ensure_indexes, check_index_coverage
+from app.services.utils import delete_directory
+from app.services.llama_index_integration import load_index_and_query
 import os
 import uuid
 import asyncio
 from pydantic import BaseModel, Field, constr
 import subprocess
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from app.services.llm import openai_LLM
 import csv
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 import tempfile
 import shutil
 from app.services.campaign_helper import process_campaign_calls_sync
+from app.services.phone_routing import normalize_e164
+from app.services.ndjson_export import EXPORT_BATCH_SIZE, stream_ndjson, wants_gzip
+from app.services.dashboard import get_time_filter, to_naive_utc, compute_dashboard, compute_distribution, compute_timeseries
+from app.services.usage_rollups import chat_usage, chat_turn, record_usage
+from app.services.dashboard_cache import get_cached_dashboard, get_dashboard_cache_stats
+from app.services.call_transcripts import CALL_MESSAGES_COLLECTION, with_messages
+from app.services.transcript_search import search_transcripts
+from app.services.retention import find_archived_log
+from app.services.ingest_jobs import submit_ingest_job, get_ingest_job, fail_interrupted_jobs
+from app.services.knowledge_base import is_supported_file, agent_paths, sync_knowledge_base
+from app.services.uploads import request_body_limit, save_uploads, read_csv_phone_numbers
+from app.services.embedding_cache import get_embedding_cache_stats
+from app.services.parquet_export import EXPORTS, run_parquet_export, export_running, list_user_exports, resolve_export_path
+from app.services.agent_cache import get_agent_by_id, invalidate_agent, get_agent_cache_stats, start_change_stream_listener
 import pymongo
 load_dotenv()
 
 app = FastAPI()
+
+# Refuse oversized uploads from Content-Length, before Starlette spools the
+# body to disk. Registered before CORS so the 413 still carries CORS headers.
+# Chunked bodies without a length are caught by save_uploads' limits instead.
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    limit = request_body_limit(request.url.path)
+    content_length = request.headers.get("content-length", "")
+    if limit is not None and content_length.isdigit() and int(content_length) > limit:
+        return JSONResponse(status_code=413, content={"detail": f"Request body is larger than {limit} bytes"})
+    return await call_next(request)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -50,40 +82,131 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+@app.on_event("startup")
+async def startup_db_client():
+    # One pooled MongoClient per worker process, shared by every sync endpoint
+    await asyncio.to_thread(init_client)
+    # Apply the index registry; the explain() self-check is opt-in because it
+    # is meant to fail the deploy loudly rather than run on every boot
+    await asyncio.to_thread(ensure_indexes, get_database())
+    if os.getenv("DB_INDEX_SELF_CHECK", "").lower() in ("1", "true", "yes"):
+        await asyncio.to_thread(check_index_coverage, get_database())
+    # Ingestion jobs queued before a restart will never run
+    await asyncio.to_thread(fail_interrupted_jobs, get_database())
+    # Motor client for the async endpoints, bound to the server's event loop
+    init_async_client()
+    # Follow agent changes made by other API workers (opt-in, needs a replica set)
+    start_change_stream_listener(get_database())
+
+@app.on_event("shutdown")
+async def shutdown_db_client():
+    close_async_client()
+    close_client()
+
 # Dependency to get the database
 def get_db():
-    db = get_database()
+    # The client is process-wide, so there is nothing to close per request
+    return get_database()
+
+# Dependency for async endpoints: repositories backed by the Motor client
+def get_repos():
+    return Repositories(get_async_database())
+
+# Run a keyset page query, turning a malformed cursor into a 400
+def fetch_page(collection, query, sort_field, limit, after, projection=None, descending=True):
     try:
-        yield db
-    finally:
-        db.client.close()
+        return keyset_page(collection, query, sort_field, limit, after, projection, descending)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 api_key = os.getenv("LIVEKIT_API_KEY")
 api_secret = os.getenv("LIVEKIT_API_SECRET")
 # Directory to save CSV files
 CSV_DIR = "./csv_files"
 os.makedirs(CSV_DIR, exist_ok=True)
+# ------------------- Metrics -------------------
+
+@app.get("/metrics/")
+def get_metrics():
+    return {
+        "db_pool": get_pool_stats(),
+        "agent_cache": get_agent_cache_stats(),
+        "dashboard_cache": get_dashboard_cache_stats(),
+        "embedding_cache": get_embedding_cache_stats(),
+    }
+
 # ------------------- User Endpoints -------------------
 
+# Agents live in their own collection; attach them to user documents with one
+# query for the whole batch of users
+def attach_agents(db, users, agent_projection=None):
+    user_ids = [user["_id"] for user in users]
+    agents_by_user = {user_id: [] for user_id in user_ids}
+    projection = dict(agent_projection, user_id=1) if agent_projection else None
+    for agent in db.agents.find({"user_id": {"$in": user_ids}}, projection):
+        agents_by_user[agent["user_id"]].append(agent)
+        if projection and "user_id" not in agent_projection:
+            del agent["user_id"]
+    for user in users:
+        user["agents"] = agents_by_user.get(user["_id"], [])
+    return users
+
+# Validate a `fields=` selection against the agent model
+def agent_projection_for(fields: Optional[str], summary: bool = False):
+    if summary:
+        return build_projection(AGENT_SUMMARY_FIELDS)
+    try:
+        return build_projection(parse_fields(fields, AI_Agent.model_fields.keys()))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/users/", response_model=User)
 def create_user(user: UserCreate, db=Depends(get_db)):
     if db.users.find_one({"email": user.email}):
         raise HTTPException(status_code=400, detail="Email already registered")
     user_dict = user.dict()
     user_dict["_id"] = str(uuid.uuid4())
-    user_dict["agents"] = []
     db.users.insert_one(user_dict)
     return User(**user_dict)
 
-@app.get("/users/", response_model=List[User])
-def get_all_users(db=Depends(get_db)):
-    users = list(db.users.find())
-    return [User(**user) for user in users]
+# Serialized here rather than through a Union response_model, which would
+# coerce `fields=` rows into UserSummary
+def build_users_response(db, users, summary: bool, agent_projection):
+    users = attach_agents(db, users, agent_projection)
+    if summary:
+        return [UserSummary(**user).model_dump(by_alias=True) for user in users]
+    if agent_projection:
+        return users
+    return [User(**user).model_dump(by_alias=True) for user in users]
+
+@app.get("/users/", response_model=None)
+def get_all_users(
+    summary: bool = Query(False, description="Only return id/name/phone/type for each agent"),
+    fields: Optional[str] = Query(None, description="Comma-separated agent fields to return"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Cursor returned as next_cursor by the previous page"),
+    db=Depends(get_db)
+):
+    agent_projection = agent_projection_for(fields, summary)
+    users, next_cursor = fetch_page(db.users, {}, None, limit, after, {"_id": 1, "email": 1})
+    return {"items": build_users_response(db, users, summary, agent_projection), "next_cursor": next_cursor}
+
+# Unbounded listing of every user; kept only as an explicit export path
+@app.get("/users/export", response_model=None)
+def export_users(
+    summary: bool = Query(False, description="Only return id/name/phone/type for each agent"),
+    fields: Optional[str] = Query(None, description="Comma-separated agent fields to return"),
+    db=Depends(get_db)
+):
+    agent_projection = agent_projection_for(fields, summary)
+    users = list(db.users.find({}, {"_id": 1, "email": 1}))
+    return build_users_response(db, users, summary, agent_projection)
 
 @app.get("/users/{user_id}", response_model=User)
 def get_user(user_id: str, db=Depends(get_db)):
     user = db.users.find_one({"_id": user_id})
     if user:
-        return User(**user)
+        return User(**attach_agents(db, [user])[0])
     else:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -92,14 +215,26 @@ def update_user(user_id: str, user_update: UserUpdate, db=Depends(get_db)):
     db.users.update_one({"_id": user_id}, {"$set": user_update.dict(exclude_unset=True)})
     user = db.users.find_one({"_id": user_id})
     if user:
-        return User(**user)
+        return User(**attach_agents(db, [user])[0])
     else:
         raise HTTPException(status_code=404, detail="User not found")
 
+# Set how long this user's call and chat logs stay in Mongo before they are archived
+@app.put("/users/{user_id}/retention")
+def update_retention(user_id: str, retention_update: RetentionUpdate, db=Depends(get_db)):
+    if retention_update.retention_days is None:
+        result = db.users.update_one({"_id": user_id}, {"$unset": {"retention_days": ""}})
+    else:
+        result = db.users.update_one({"_id": user_id}, {"$set": {"retention_days": retention_update.retention_days}})
+    if not result.matched_count:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"user_id": user_id, "retention_days": retention_update.retention_days}
+
 @app.delete("/users/{user_id}")
 def delete_user(user_id: str, db=Depends(get_db)):
     result = db.users.delete_one({"_id": user_id})
     if result.deleted_count:
+        db.agents.delete_many({"user_id": user_id})
         user_dir = f"uploads/{user_id}"
         if os.path.exists(user_dir):
             delete_directory(user_dir)
@@ -109,13 +244,25 @@ def delete_user(user_id: str, db=Depends(get_db)):
 
 # ------------------- Agent Endpoints -------------------
 
+def user_exists(db, user_id: str) -> bool:
+    return db.users.find_one({"_id": user_id}, {"_id": 1}) is not None
+
+# Point read of a single agent, distinguishing a missing user from a missing agent
+def find_user_agent(db, user_id: str, agent_id: str, projection=None):
+    agent = db.agents.find_one({"_id": agent_id, "user_id": user_id}, projection)
+    if not agent and not user_exists(db, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return agent
+
 @app.post("/users/{user_id}/agents/", response_model=AI_Agent)
 def create_agent(user_id: str, agent: AgentCreate, db=Depends(get_db)):
-    user = db.users.find_one({"_id": user_id})
-    if not user:
+    if not user_exists(db, user_id):
         raise HTTPException(status_code=404, detail="User not found")
 
-    if any(a["phone_number"] == agent.phone_number for a in user.get("agents", [])):
+    phone_e164 = normalize_e164(agent.phone_number)
+    if db.agents.find_one({"user_id": user_id, "phone_e164": phone_e164}, {"_id": 1}):
         raise HTTPException(status_code=400, detail="Phone number already exists for this user")
 
     # Build the agent data with user-provided and default values
@@ -142,64 +289,80 @@ def create_agent(user_id: str, agent: AgentCreate, db=Depends(get_db)):
         "knowledge_base": {"files": []}
     }
 
-    db.users.update_one({"_id": user_id}, {"$push": {"agents": agent_dict}})
+    db.agents.insert_one({"_id": agent_dict["id"], "user_id": user_id, "phone_e164": phone_e164, **agent_dict})
+    invalidate_agent(agent_dict["id"], phone_e164)
     return AI_Agent(**agent_dict)
 
 
-@app.get("/users/{user_id}/agents/", response_model=List[AI_Agent])
-def get_all_agents(user_id: str, db=Depends(get_db)):
-    user = db.users.find_one({"_id": user_id})
-    if user:
-        agents = user.get("agents", [])
-        return [AI_Agent(**agent) for agent in agents]
-    else:
-        return []
-
-@app.get("/users/{user_id}/agents/{agent_id}", response_model=AI_Agent)
-def get_agent(user_id: str, agent_id: str, db=Depends(get_db)):
-    user = db.users.find_one({"_id": user_id})
-    if user:
-        agent = next((a for a in user.get("agents", []) if a["id"] == agent_id), None)
-        if agent:
-            # Provide default values if tts_speed or interrupt_speech_duration is missing
-            agent.setdefault('tts_speed', 1.0)
-            agent.setdefault('interrupt_speech_duration', 0.0)
-            return AI_Agent(**agent)
+# No response_model: a Union would coerce `fields=` rows into AgentSummary, so each path serializes its own shape
+@app.get("/users/{user_id}/agents/", response_model=None)
+def get_all_agents(
+    user_id: str,
+    summary: bool = Query(False, description="Only return id/name/phone/type for each agent"),
+    fields: Optional[str] = Query(None, description="Comma-separated agent fields to return"),
+    db=Depends(get_db)
+):
+    projection = agent_projection_for(fields, summary)
+    agents = db.agents.find({"user_id": user_id}, projection)
+    if summary:
+        return [AgentSummary(**agent).model_dump() for agent in agents]
+    if projection:
+        return list(agents)
+    return [AI_Agent(**agent).model_dump() for agent in agents]
+
+@app.get("/users/{user_id}/agents/{agent_id}", response_model=None)
+def get_agent(
+    user_id: str,
+    agent_id: str,
+    fields: Optional[str] = Query(None, description="Comma-separated agent fields to return"),
+    db=Depends(get_db)
+):
+    projection = agent_projection_for(fields)
+    agent = db.agents.find_one({"_id": agent_id, "user_id": user_id}, projection)
+    if agent and projection:
+        return agent
+    if agent:
+        # Provide default values if tts_speed or interrupt_speech_duration is missing
+        agent.setdefault('tts_speed', 1.0)
+        agent.setdefault('interrupt_speech_duration', 0.0)
+        return AI_Agent(**agent)
     raise HTTPException(status_code=404, detail="Agent not found")
 
 
 @app.put("/users/{user_id}/agents/{agent_id}", response_model=AI_Agent)
 def update_agent(user_id: str, agent_id: str, agent_update: AgentUpdate, db=Depends(get_db)):
-    user = db.users.find_one({"_id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    agents = user.get("agents", [])
-    for idx, agent in enumerate(agents):
-        if agent["id"] == agent_id:
-            updated_fields = agent_update.dict(exclude_unset=True)
-
-            # If tts_speed and interrupt_speech_duration are not in the update, retain the original or default values
-            if 'tts_speed' not in updated_fields:
-                updated_fields['tts_speed'] = agent.get('tts_speed', 1.0)  # Default to 1.0 if missing
-            if 'interrupt_speech_duration' not in updated_fields:
-                updated_fields['interrupt_speech_duration'] = agent.get('interrupt_speech_duration', 0.0)  # Default to 0.0 if missing
-
-            # Update the agent with the new fields
-            agents[idx].update(updated_fields)
+    updated_fields = agent_update.dict(exclude_unset=True)
+    if "phone_number" in updated_fields:
+        # Keep the canonical routing field in step with the display number
+        updated_fields["phone_e164"] = normalize_e164(updated_fields["phone_number"])
+
+    # Targeted $set of the changed fields only; concurrent edits to other fields are preserved
+    if updated_fields:
+        agent = db.agents.find_one_and_update(
+            {"_id": agent_id, "user_id": user_id},
+            {"$set": updated_fields},
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+        # Drops both the id entry and whatever phone entry the old config was cached under
+        invalidate_agent(agent_id, updated_fields.get("phone_e164"))
+    else:
+        agent = db.agents.find_one({"_id": agent_id, "user_id": user_id})
 
-            db.users.update_one({"_id": user_id}, {"$set": {"agents": agents}})
-            return AI_Agent(**agents[idx])
+    if not agent:
+        if not user_exists(db, user_id):
+            raise HTTPException(status_code=404, detail="User not found")
+        raise HTTPException(status_code=404, detail="Agent not found")
 
-    raise HTTPException(status_code=404, detail="Agent not found")
+    # Retain default values for agents created before these fields existed
+    agent.setdefault('tts_speed', 1.0)
+    agent.setdefault('interrupt_speech_duration', 0.0)
+    return AI_Agent(**agent)
 
 @app.delete("/users/{user_id}/agents/{agent_id}")
 def delete_agent(user_id: str, agent_id: str, db=Depends(get_db)):
-    user = db.users.find_one({"_id": user_id})
-    if user:
-        agents = user.get("agents", [])
-        agents = [a for a in agents if a["id"] != agent_id]
-        db.users.update_one({"_id": user_id}, {"$set": {"agents": agents}})
+    result = db.agents.delete_one({"_id": agent_id, "user_id": user_id})
+    invalidate_agent(agent_id)
+    if result.deleted_count or user_exists(db, user_id):
         agent_dir = f"uploads/{user_id}/{agent_id}"
         if os.path.exists(agent_dir):
             delete_directory(agent_dir)
@@ -213,74 +376,53 @@ async def upload_files(
     user_id: str,
     agent_id: str,
     files: List[UploadFile] = File(...),
-    db=Depends(get_db)
+    repos: Repositories = Depends(get_repos)
 ):
-    user = db.users.find_one({"_id": user_id})
-    if not user:
+    user_found, agent = await repos.find_user_agent(user_id, agent_id)
+    if not user_found:
         raise HTTPException(status_code=404, detail="User not found")
-
-    agents = user.get("agents", [])
-    agent = next((a for a in agents if a["id"] == agent_id), None)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
 
-    lamma_dir = "lamadir"
-    agent_dir = f"uploads/{user_id}/{agent_id}/{lamma_dir}"
-    file_dir = f"uploads/{user_id}/{agent_id}"
-
-    # Create directories if they don't exist
-    if os.path.exists(agent_dir):
-        delete_directory(agent_dir)
-    os.makedirs(agent_dir, exist_ok=True)
-    os.makedirs(file_dir, exist_ok=True)
+    # Reject unsupported files before anything is written
+    for file in files:
+        if not is_supported_file(file.filename):
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.filename}")
 
-    files_dir = os.path.join(file_dir, "files")
-    os.makedirs(files_dir, exist_ok=True)
+    _, files_dir, _ = agent_paths(user_id, agent_id)
 
-    # Save the uploaded files to files_dir
-    for file in files:
-        file_path = os.path.join(files_dir, file.filename)
-        content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
-
-    # Initialize variables for file processing
-    combined_text = ""
-    filenames = []
-
-    # Read and process all files inside files_dir
-    for filename in os.listdir(files_dir):
-        file_path = os.path.join(files_dir, filename)
-        with open(file_path, "rb") as f:
-            content = f.read()
-            text = extract_text_from_file(filename, content)
-            if not text:
-                raise HTTPException(status_code=400, detail=f"Unsupported file type: {filename}")
-            combined_text += text + "\n"
-            filenames.append(filename)
-
-    # Save the combined text to raw_data.txt in agent_dir
-    raw_data_file = os.path.join(agent_dir, "raw_data.txt")
-    with open(raw_data_file, "w") as f:
-        f.write(combined_text)
+    # Stream the uploaded files to files_dir in chunks, within the size limits
+    saved = await save_uploads(files, files_dir)
 
-    # Process the files using the updated LlamaIndex logic
-    process_files_with_llama_index(files_dir, agent_dir)
+    # Extraction and indexing run in the ingestion queue, one job at a time per agent
+    response = await asyncio.to_thread(queue_knowledge_base_rebuild, user_id, agent_id, "upload", [entry["filename"] for entry in saved])
+    response["files"] = saved
+    return response
 
-    # Update the agent's knowledge base with the processed filenames
-    agent["knowledge_base"] = {"files": filenames}
-    db.users.update_one({"_id": user_id}, {"$set": {"agents": agents}})
+def queue_knowledge_base_rebuild(user_id: str, agent_id: str, kind: str, filenames: List[str]):
+    db = get_database()
+    job_id = submit_ingest_job(
+        db, user_id, agent_id, kind,
+        lambda report: sync_knowledge_base(db, user_id, agent_id, report),
+        files=filenames,
+    )
+    return {
+        "detail": "Files queued for processing",
+        "job_id": job_id,
+        "status_url": f"/users/{user_id}/agents/{agent_id}/ingest_jobs/{job_id}",
+    }
 
-    return {"detail": "Files uploaded and processed successfully"}
+@app.get("/users/{user_id}/agents/{agent_id}/ingest_jobs/{job_id}")
+def get_ingest_job_status(user_id: str, agent_id: str, job_id: str, db=Depends(get_db)):
+    job = get_ingest_job(db, user_id, agent_id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    job["job_id"] = job.pop("_id")
+    return job
 
 @app.get("/users/{user_id}/agents/{agent_id}/files/", response_model=FileListResponse)
 def get_uploaded_files(user_id: str, agent_id: str, db=Depends(get_db)):
-    user = db.users.find_one({"_id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    agent = next((a for a in user.get("agents", []) if a["id"] == agent_id), None)
-    if not agent:
-        raise HTTPException(status_code=404, detail="Agent not found")
+    agent = find_user_agent(db, user_id, agent_id, {"knowledge_base": 1})
     knowledge_base = agent.get("knowledge_base", {})
     files = knowledge_base.get("files", [])
     return FileListResponse(files=files)
@@ -290,21 +432,15 @@ async def delete_file(
     user_id: str,
     agent_id: str,
     filename: str = Query(..., description="Name of the file to delete"),
-    db=Depends(get_db)
+    repos: Repositories = Depends(get_repos)
 ):
-    user = db.users.find_one({"_id": user_id})
-    if not user:
+    user_found, agent = await repos.find_user_agent(user_id, agent_id)
+    if not user_found:
         raise HTTPException(status_code=404, detail="User not found")
-
-    agents = user.get("agents", [])
-    agent = next((a for a in agents if a["id"] == agent_id), None)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
 
-    lamma_dir = "lamadir"
-    agent_dir = f"uploads/{user_id}/{agent_id}/{lamma_dir}"
-    file_dir = f"uploads/{user_id}/{agent_id}"
-    files_dir = os.path.join(file_dir, "files")
+    _, files_dir, _ = agent_paths(user_id, agent_id)
     file_path = os.path.join(files_dir, filename)
 
     # Check if the file exists before attempting to delete it
@@ -316,57 +452,22 @@ async def delete_file(
     print(f"Deleted file: {file_path}")
 
     # Remove the filename from the agent's knowledge_base
-    agent["knowledge_base"]["files"].remove(filename)
-    db.users.update_one({"_id": user_id}, {"$set": {"agents": agents}})
-
-    # If `lamma_dir` exists, delete it to clean up old data
-    if os.path.exists(agent_dir):
-        delete_directory(agent_dir)
-        print(f"Deleted directory: {agent_dir}")
-
-    # Retry creating a fresh `lamma_dir` after deletion
-    os.makedirs(agent_dir, exist_ok=True)
-    print(f"Re-created directory: {agent_dir}")
-
-    # Re-create embeddings with the remaining files in `files_dir`
-    combined_text = ""
-    remaining_files = os.listdir(files_dir)
-
-    # If there are no remaining files, return a message indicating empty state
-    if not remaining_files:
-        return {"detail": f"File '{filename}' deleted. No more files to process."}
-
-    # Process each remaining file to extract text and create embeddings
-    for remaining_file in remaining_files:
-        remaining_file_path = os.path.join(files_dir, remaining_file)
-        with open(remaining_file_path, "rb") as f:
-            content = f.read()
-            text = extract_text_from_file(remaining_file, content)
-            if not text:
-                raise HTTPException(status_code=400, detail=f"Unsupported file type: {remaining_file}")
-            combined_text += text + "\n"
-
-    # Save the combined text from remaining files to `raw_data.txt` in `agent_dir`
-    raw_data_file = os.path.join(agent_dir, "raw_data.txt")
-    with open(raw_data_file, "w") as f:
-        f.write(combined_text)
-
-    # Process the remaining files using the updated LlamaIndex logic
-    process_files_with_llama_index(files_dir, agent_dir)
+    await repos.agents.update_one(
+        {"_id": agent_id, "user_id": user_id},
+        {"$pull": {"knowledge_base.files": filename}}
+    )
+    invalidate_agent(agent_id)
 
-    return {"detail": f"File '{filename}' deleted, remaining files reprocessed, and embeddings updated."}
+    # Re-create embeddings with the remaining files in the ingestion queue
+    response = await asyncio.to_thread(queue_knowledge_base_rebuild, user_id, agent_id, "delete", [filename])
+    response["detail"] = f"File '{filename}' deleted; remaining files queued for reprocessing"
+    return response
 
 # ------------------- Knowledge Base Info -------------------
 
 @app.get("/users/{user_id}/agents/{agent_id}/knowledge_base/", response_model=KnowledgeBaseResponse)
 def get_knowledge_base_info(user_id: str, agent_id: str, db=Depends(get_db)):
-    user = db.users.find_one({"_id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    agent = next((a for a in user.get("agents", []) if a["id"] == agent_id), None)
-    if not agent:
-        raise HTTPException(status_code=404, detail="Agent not found")
+    agent = find_user_agent(db, user_id, agent_id, {"knowledge_base": 1})
 
     agent_dir = f"uploads/{user_id}/{agent_id}"
     raw_data_file = os.path.join(agent_dir, "raw_data.txt")
@@ -389,17 +490,16 @@ async def retrieve_documents(
     agent_id: str,
     query: str = Query(..., description="The query to retrieve documents."),
     retrieval_len: int = Query(5, description="The number of documents to retrieve."),
-    db=Depends(get_db)
+    repos: Repositories = Depends(get_repos)
 ):
     """
     API to retrieve documents based on a query and retrieval length.
     Handles concurrent requests.
     """
-    user = db.users.find_one({"_id": user_id})
-    if not user:
+    user_found, agent = await repos.find_user_agent(user_id, agent_id)
+    if not user_found:
         raise HTTPException(status_code=404, detail="User not found")
     
-    agent = next((a for a in user.get("agents", []) if a["id"] == agent_id), None)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
@@ -443,11 +543,12 @@ async def run_command(command: str) -> str:
     return stdout.decode()
 
 # Helper function to store request logs into MongoDB
-async def log_request_to_db(db, request: SIPRequest, inbound_trunk_id: str, dispatch_rule_id: str, outbound_trunk_id: str):
+async def log_request_to_db(repos: Repositories, request: SIPRequest, inbound_trunk_id: str, dispatch_rule_id: str, outbound_trunk_id: str):
     try:
-        db.logs.insert_one({
+        await repos.sip_trunks.insert_one({
             "email": request.email,
             "phone_number": request.phone_number,
+            "phone_e164": normalize_e164(request.phone_number),
             "provider": request.provider,
             "inbound_trunk_id": inbound_trunk_id,
             "outbound_trunk_id": outbound_trunk_id,
@@ -466,8 +567,7 @@ async def log_request_to_db(db, request: SIPRequest, inbound_trunk_id: str, disp
 
 
 @app.post("/configure_sip/")
-async def configure_sip(request: SIPRequest):
-    db = get_database()  # Get the MongoDB database connection
+async def configure_sip(request: SIPRequest, repos: Repositories = Depends(get_repos)):
 
     phone_number = request.phone_number
     provider = request.provider
@@ -600,7 +700,7 @@ async def configure_sip(request: SIPRequest):
             raise Exception("Failed to retrieve Outbound Trunk ID")
 
         # Step 7: Log the request into MongoDB
-        await log_request_to_db(db, request, inbound_trunk_id, dispatch_rule_id, outbound_trunk_id)
+        await log_request_to_db(repos, request, inbound_trunk_id, dispatch_rule_id, outbound_trunk_id)
 
         return {
             "message": "SIP trunks and dispatch rule created successfully.",
@@ -617,14 +717,9 @@ async def configure_sip(request: SIPRequest):
         # shutil.rmtree(temp_dir)
 # Endpoint to get all phone numbers and details associated with an email
 @app.get("/get_phone_numbers/{email}")
-async def get_phone_numbers(email: str):
-    db = get_database()
-
+async def get_phone_numbers(email: str, repos: Repositories = Depends(get_repos)):
     # Search for all records associated with the email
-    results = db.logs.find({"email": email})
-
-    # Convert cursor to a list and ensure it's not empty
-    details = list(results)
+    details = await repos.sip_trunks.find_by_email(email)
     
     if not details:
         return {"email": email, "details": []}  # Return empty array if no records found
@@ -654,22 +749,18 @@ async def get_phone_numbers(email: str):
 async def map_agent(
     phone_number: str = Body(..., embed=True),
     email: str = Body(..., embed=True),
-    agent_name: str = Body(..., embed=True)
+    agent_name: str = Body(..., embed=True),
+    repos: Repositories = Depends(get_repos)
 ):
-    db = get_database()
-
     # Find the record to update based on phone number and email
-    trunk_entry = db.logs.find_one({"phone_number": phone_number, "email": email})
+    trunk_entry = await repos.sip_trunks.find_trunk(email, phone_number)
 
     if not trunk_entry:
         raise HTTPException(status_code=404, detail="Phone number not found for the given email")
 
     # Update the mapped agent
     try:
-        db.logs.update_one(
-            {"phone_number": phone_number, "email": email},
-            {"$set": {"mapped_agent_name": agent_name}}
-        )
+        await repos.sip_trunks.update_trunk(email, phone_number, {"mapped_agent_name": agent_name})
         return {"message": f"Agent '{agent_name}' mapped successfully to phone number {phone_number}."}
 
     except Exception as e:
@@ -677,11 +768,9 @@ async def map_agent(
 
 # Endpoint to delete the inbound trunk and dispatch rule by phone number
 @app.delete("/delete_sip/{phone_number}")
-async def delete_sip(phone_number: str, email: str):
-    db = get_database()  # Get the MongoDB database connection
-
+async def delete_sip(phone_number: str, email: str, repos: Repositories = Depends(get_repos)):
     # Search for the trunk entry in MongoDB using the phone number and email
-    trunk_entry = db.logs.find_one({"phone_number": phone_number, "email": email})
+    trunk_entry = await repos.sip_trunks.find_trunk(email, phone_number)
 
     if not trunk_entry:
         raise HTTPException(status_code=404, detail="Trunk not found for the given email and phone number")
@@ -704,7 +793,7 @@ async def delete_sip(phone_number: str, email: str):
         await run_command(delete_outbound_trunk_cmd)
 
         # Step 4: Remove the trunk entry from MongoDB
-        db.logs.delete_one({"phone_number": phone_number, "email": email})
+        await repos.sip_trunks.delete_trunk(email, phone_number)
 
         return {
             "message": f"SIP trunks and dispatch rule for {phone_number} deleted successfully."
@@ -718,12 +807,11 @@ async def delete_sip(phone_number: str, email: str):
 async def update_sip(
     phone_number: str,
     email: str = Body(..., embed=True),
-    request: SIPRequest = Body(...)
+    request: SIPRequest = Body(...),
+    repos: Repositories = Depends(get_repos)
 ):
-    db = get_database()
-
     # Find the record to update
-    trunk_entry = db.logs.find_one({"phone_number": phone_number, "email": email})
+    trunk_entry = await repos.sip_trunks.find_trunk(email, phone_number)
 
     if not trunk_entry:
         raise HTTPException(status_code=404, detail="Trunk not found")
@@ -889,10 +977,7 @@ async def update_sip(
             "dispatch_rule_id": new_dispatch_rule_id
         }
 
-        db.logs.update_one(
-            {"phone_number": phone_number, "email": email},
-            {"$set": update_data}
-        )
+        await repos.sip_trunks.update_trunk(email, phone_number, update_data)
 
         return {
             "message": f"SIP configuration for phone number {phone_number} updated successfully.",
@@ -912,12 +997,11 @@ async def update_sip(
 async def test_outgoing_call(
     email: str = Body(..., embed=True),
     agent_phone_number: str = Body(..., embed=True),
-    phone_number_to_dial: str = Body(..., embed=True)
+    phone_number_to_dial: str = Body(..., embed=True),
+    repos: Repositories = Depends(get_repos)
 ):
-    db = get_database()  # Use your method to connect to MongoDB here
-
     # Find the agent using their phone number and email
-    log_entry = db.logs.find_one({"email": email, "phone_number": agent_phone_number})
+    log_entry = await repos.sip_trunks.find_trunk(email, agent_phone_number)
     
     if not log_entry:
         raise HTTPException(status_code=404, detail="Agent not found for the given email and phone number")
@@ -960,305 +1044,79 @@ async def test_outgoing_call(
 
     return {"detail": f"Outgoing call to {phone_number_to_dial} initiated successfully."}
 
-def get_call_logs(user_id: str):
-    # Get the database connection
-    db = get_database()
+# Convert MongoDB-specific fields of a call log for the FastAPI response
+def serialize_call_log(call_log):
+    if '_id' in call_log:
+        call_log['_id'] = str(call_log['_id'])  # Convert ObjectId to string
 
-    # Access the collection
-    call_logs_collection = db["call_logs"]
+    # Ensure the called_number is correctly formatted
+    call_log['called_number'] = call_log.get('called_number', 'N/A')  # Default to 'N/A' if not present
 
-    # Query the database for logs by user_id
-    query = {'user_id': user_id}
-    call_logs = list(call_logs_collection.find(query))
-    
-    if not call_logs:
-        return []
-    
-    # Convert MongoDB-specific fields for FastAPI response
-    for call_log in call_logs:
-        if '_id' in call_log:
-            call_log['_id'] = str(call_log['_id'])  # Convert ObjectId to string
-        # Convert datetime fields to ISO format
-        call_log['start_time'] = call_log['start_time'].isoformat() if 'start_time' in call_log else None
-        call_log['end_time'] = call_log['end_time'].isoformat() if 'end_time' in call_log else None
-        # Convert messages' timestamps
-        if 'messages' in call_log:
-            for message in call_log['messages']:
-                if 'timestamp' in message:
-                    message['timestamp'] = message['timestamp'].isoformat()
-    
-    return call_logs
-
-# Helper function to get the time period filter
-def get_time_filter(filter_type: str):
-    now = datetime.now()
-    if filter_type == "day":
-        start_time = now - timedelta(days=1)
-        previous_start_time = start_time - timedelta(days=1)
-    elif filter_type == "week":
-        start_time = now - timedelta(weeks=1)
-        previous_start_time = start_time - timedelta(weeks=1)
-    elif filter_type == "month":
-        start_time = now - timedelta(days=30)
-        previous_start_time = start_time - timedelta(days=30)
-    else:
-        start_time = None  # No time filter for overall
-        previous_start_time = None
-    return start_time, previous_start_time
-
-# Helper function to calculate percentage change
-def calculate_percentage_change(current, previous):
-    if previous == 0:
-        return 100 if current > 0 else 0
-    return ((current - previous) / previous) * 100
-
-# Helper function to fetch and aggregate data for a period
-def fetch_combined_aggregated_data(user_id: str, start_time: datetime):
-    db = get_database()
+    # Ensure the call_direction is set, default to 'unknown' if not present
+    call_log['call_direction'] = call_log.get('call_direction', 'unknown')  # Default to 'unknown' if not present
 
-    # Access the collections
-    call_logs_collection = db["call_logs"]
-    chat_logs_collection = db["chat_logs"]
+    # Convert datetime fields to ISO format
+    call_log['start_time'] = call_log['start_time'].isoformat() if 'start_time' in call_log else None
+    call_log['end_time'] = call_log['end_time'].isoformat() if 'end_time' in call_log else None
 
-    # Build queries
-    query = {'user_id': user_id}
-    call_query = query.copy()
-    chat_query = query.copy()
-    if start_time:
-        call_query['start_time'] = {'$gte': start_time}
-        chat_query['created_at'] = {'$gte': start_time}
-
-    # Fetch call logs and chat logs
-    call_logs = list(call_logs_collection.find(call_query))
-    chat_logs = list(chat_logs_collection.find(chat_query))
-
-    # Initialize aggregated data
-    total_conversation_minutes = 0
-    total_spent = 0
-    number_of_calls = len(call_logs)
-    number_of_chats = len(chat_logs)
-    total_tokens_llm = 0
-    total_tokens_stt = 0
-    total_tokens_tts = 0
-
-    # Process call logs
-    for log in call_logs:
-        total_conversation_minutes += log['duration'] / 60  # Convert duration to minutes
-        total_spent += log['total_cost']
-        total_tokens_llm += log.get('total_tokens_llm', 0)
-        total_tokens_stt += log.get('total_tokens_stt', 0)
-        total_tokens_tts += log.get('total_tokens_tts', 0)
-
-    # Process chat logs
-    for log in chat_logs:
-        # Estimate chat duration based on tokens (assuming 100 tokens ~ 1 minute)
-        chat_tokens = log['total_tokens']
-        chat_duration_minutes = chat_tokens / 100  # Adjust the divisor based on your estimation
-        total_conversation_minutes += chat_duration_minutes
-        total_spent += log['cost_llm']
-        total_tokens_llm += chat_tokens
-        # No STT or TTS tokens for chat logs
-
-    # Compute average cost per conversation
-    total_conversations = number_of_calls + number_of_chats
-    avg_cost_per_conversation = total_spent / total_conversations if total_conversations > 0 else 0
+    # Convert messages' timestamps
+    if 'messages' in call_log:
+        for message in call_log['messages']:
+            if 'timestamp' in message:
+                message['timestamp'] = message['timestamp'].isoformat()
+    return call_log
 
-    return {
-        'total_conversation_minutes': total_conversation_minutes,
-        'total_spent': total_spent,
-        'number_of_calls': number_of_calls,
-        'number_of_chats': number_of_chats,
-        'total_conversations': total_conversations,
-        'average_cost_per_conversation': avg_cost_per_conversation,
-        'total_tokens_llm': total_tokens_llm,
-        'total_tokens_stt': total_tokens_stt,
-        'total_tokens_tts': total_tokens_tts
-    }
+# Percentiles of duration, tokens and cost over any window, from the rollup sketches.
+# Declared (like /timeseries) before /dashboard/{user_id}/{filter_type} so the name is not taken for a filter.
+@app.get("/dashboard/{user_id}/distribution")
+def get_dashboard_distribution(
+    user_id: str,
+    start: Optional[datetime] = Query(None, description="Window start (inclusive)"),
+    end: Optional[datetime] = Query(None, description="Window end (exclusive)"),
+    agent_id: Optional[str] = Query(None, description="Only this agent"),
+    channel: Optional[str] = Query(None, description="web, sip, call or chat"),
+):
+    start, end = to_naive_utc(start), to_naive_utc(end)
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return compute_distribution(get_database(), user_id, start, end, agent_id, channel)
+
+# Zero-filled usage series per hour or day, for charting trends
+@app.get("/dashboard/{user_id}/timeseries")
+def get_dashboard_timeseries(
+    user_id: str,
+    interval: str = Query("day", description="hour or day"),
+    start: Optional[datetime] = Query(None, alias="from", description="Series start (inclusive)"),
+    end: Optional[datetime] = Query(None, alias="to", description="Series end (exclusive)"),
+    agent_id: Optional[str] = Query(None, description="Only this agent"),
+):
+    start, end = to_naive_utc(start), to_naive_utc(end)
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="from must be before to")
+    try:
+        return compute_timeseries(get_database(), user_id, interval, start, end, agent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # Dashboard API
 @app.get("/dashboard/{user_id}/{filter_type}")
 def get_dashboard(user_id: str, filter_type: str):
-    db = get_database()
-
     # Validate filter_type
     if filter_type not in ["day", "week", "month", "overall"]:
         raise HTTPException(status_code=400, detail="Invalid filter type")
 
-    # Get the time filter for the current and previous period
-    start_time, previous_start_time = get_time_filter(filter_type)
-
-    # Fetch current period data
-    current_data = fetch_combined_aggregated_data(user_id, start_time)
-
-    # Fetch previous period data for comparison
-    if previous_start_time:
-        previous_data = fetch_combined_aggregated_data(user_id, previous_start_time)
-    else:
-        previous_data = {
-            'total_conversation_minutes': 0,
-            'total_spent': 0,
-            'number_of_calls': 0,
-            'number_of_chats': 0,
-            'total_conversations': 0,
-            'average_cost_per_conversation': 0,
-            'total_tokens_llm': 0,
-            'total_tokens_stt': 0,
-            'total_tokens_tts': 0
-        }
-
-    # Calculate percentage changes
-    percentage_changes = {
-        "total_conversation_minutes": calculate_percentage_change(current_data['total_conversation_minutes'], previous_data['total_conversation_minutes']),
-        "number_of_conversations": calculate_percentage_change(current_data['total_conversations'], previous_data['total_conversations']),
-        "total_spent": calculate_percentage_change(current_data['total_spent'], previous_data['total_spent']),
-        "average_cost_per_conversation": calculate_percentage_change(current_data['average_cost_per_conversation'], previous_data['average_cost_per_conversation']),
-    }
-
-    # Fetch logs for the current period
-    call_logs_collection = db["call_logs"]
-    chat_logs_collection = db["chat_logs"]
+    db = get_database()
 
-    call_query = {'user_id': user_id}
-    chat_query = {'user_id': user_id}
-    if start_time:
-        call_query['start_time'] = {'$gte': start_time}
-        chat_query['created_at'] = {'$gte': start_time}
-
-    call_logs = list(call_logs_collection.find(call_query))
-    chat_logs = list(chat_logs_collection.find(chat_query))
-
-    # Initialize variables for other statistics
-    call_end_reasons = {}
-    assistants_table = {}
-    call_breakdown_by_category = {
-        "call_counts": {"web": 0, "sip": 0},
-        "call_durations": {"web": 0.0, "sip": 0.0},
-        "total_spent": {"web": 0.0, "sip": 0.0}
-    }
-    cost_per_provider = {}
-    cost_breakdown_by_agent = {}
-    total_conversations_per_agent = {}
-    average_call_duration_per_category = {"web": 0.0, "sip": 0.0}
-
-    # Process call logs
-    for log in call_logs:
-        duration_minutes = log['duration'] / 60
-        # Call end reason handling
-        call_end_reason = log.get('call_end_reason', 'Completed')
-        call_end_reasons[call_end_reason] = call_end_reasons.get(call_end_reason, 0) + 1
-
-        # Assistant statistics
-        assistant_name = log.get('agent_name', 'Unknown')
-        if assistant_name not in assistants_table:
-            assistants_table[assistant_name] = {
-                "conversation_count": 0,
-                "total_duration": 0.0,
-                "total_cost": 0.0
-            }
-        assistants_table[assistant_name]['conversation_count'] += 1
-        assistants_table[assistant_name]['total_duration'] += duration_minutes
-        assistants_table[assistant_name]['total_cost'] += log['total_cost']
-
-        # Category (web or sip) breakdown
-        call_type = log['call_type']
-        call_breakdown_by_category['call_counts'][call_type] += 1
-        call_breakdown_by_category['call_durations'][call_type] += duration_minutes
-        call_breakdown_by_category['total_spent'][call_type] += log['total_cost']
-
-        # Provider cost breakdown
-        provider = log.get('llm_name', 'Unknown')
-        if provider not in cost_per_provider:
-            cost_per_provider[provider] = 0.0
-        cost_per_provider[provider] += log['total_cost']
-
-        # Cost per agent
-        if assistant_name not in cost_breakdown_by_agent:
-            cost_breakdown_by_agent[assistant_name] = 0.0
-        cost_breakdown_by_agent[assistant_name] += log['total_cost']
-
-        # Conversations per agent
-        if assistant_name not in total_conversations_per_agent:
-            total_conversations_per_agent[assistant_name] = 0
-        total_conversations_per_agent[assistant_name] += 1
-
-    # Process chat logs
-    for log in chat_logs:
-        # Estimate duration based on tokens (assuming 100 tokens ~ 1 minute)
-        chat_tokens = log['total_tokens']
-        chat_duration_minutes = chat_tokens / 100
-        assistant_name = log.get('agent_name', 'Unknown')
-        if assistant_name not in assistants_table:
-            assistants_table[assistant_name] = {
-                "conversation_count": 0,
-                "total_duration": 0.0,
-                "total_cost": 0.0
-            }
-        assistants_table[assistant_name]['conversation_count'] += 1
-        assistants_table[assistant_name]['total_duration'] += chat_duration_minutes
-        assistants_table[assistant_name]['total_cost'] += log['cost_llm']
-
-        # Provider cost breakdown
-        provider = 'LLM'  # Assuming chat uses LLM
-        if provider not in cost_per_provider:
-            cost_per_provider[provider] = 0.0
-        cost_per_provider[provider] += log['cost_llm']
-
-        # Cost per agent
-        if assistant_name not in cost_breakdown_by_agent:
-            cost_breakdown_by_agent[assistant_name] = 0.0
-        cost_breakdown_by_agent[assistant_name] += log['cost_llm']
-
-        # Conversations per agent
-        if assistant_name not in total_conversations_per_agent:
-            total_conversations_per_agent[assistant_name] = 0
-        total_conversations_per_agent[assistant_name] += 1
-
-    # Calculate average call duration per category
-    for category in average_call_duration_per_category.keys():
-        call_count = call_breakdown_by_category['call_counts'][category]
-        if call_count > 0:
-            average_call_duration_per_category[category] = call_breakdown_by_category['call_durations'][category] / call_count
-
-    # Calculate the final structure for the assistants table
-    assistants_table_final = []
-    for assistant_name, stats in assistants_table.items():
-        avg_duration = stats['total_duration'] / stats['conversation_count'] if stats['conversation_count'] > 0 else 0
-        assistants_table_final.append({
-            "assistant_name": assistant_name,
-            "conversation_count": stats['conversation_count'],
-            "avg_duration": avg_duration,
-            "total_cost": stats['total_cost']
-        })
+    def compute():
+        # Get the time filter for the current and previous period
+        start_time, previous_start_time = get_time_filter(filter_type)
+        # Totals, previous-period comparison and breakdowns in one $facet
+        return compute_dashboard(db, user_id, start_time, previous_start_time)
 
-    # Calculate overall average cost per conversation
-    average_cost_per_conversation = current_data['total_spent'] / current_data['total_conversations'] if current_data['total_conversations'] > 0 else 0
+    # Served from cache while fresh; stale entries are refreshed in the background
+    return get_cached_dashboard(db, user_id, filter_type, compute)
 
-    # Return the final result
-    return {
-        "total_conversation_minutes": current_data['total_conversation_minutes'],
-        "number_of_calls": current_data['number_of_calls'],
-        "number_of_chats": current_data['number_of_chats'],
-        "total_conversations": current_data['total_conversations'],
-        "total_spent": current_data['total_spent'],
-        "average_cost_per_conversation": average_cost_per_conversation,
-        "percentage_changes": percentage_changes,
-        "call_end_reasons": call_end_reasons,
-        "average_call_duration_by_assistant": {
-            name: stats['total_duration'] / stats['conversation_count'] if stats['conversation_count'] > 0 else 0
-            for name, stats in assistants_table.items()
-        },
-        "cost_per_provider": cost_per_provider,
-        "assistants_table": assistants_table_final,
-        "total_conversations_per_agent": total_conversations_per_agent,
-        "call_breakdown_by_category": call_breakdown_by_category,
-        "total_tokens_used": {
-            "total_tokens_llm": current_data['total_tokens_llm'],
-            "total_tokens_stt": current_data['total_tokens_stt'],
-            "total_tokens_tts": current_data['total_tokens_tts']
-        },
-        "cost_breakdown_by_agent": cost_breakdown_by_agent,
-        "average_call_duration_per_category": average_call_duration_per_category
-    }#---------jwt token------
+#---------jwt token------
 @app.get("/generate-token")
 async def generate_token(request: Request):
     try:
@@ -1296,11 +1154,8 @@ async def generate_token(request: Request):
 
 # Function to get agent name from agent_id
 def get_agent_name(agent_id):
-    db = get_database()
-    users_collection = db["users"] 
-    user = users_collection.find_one({"agents.id": agent_id}, {"agents.$": 1})
-    if user and 'agents' in user and len(user['agents']) > 0:
-        agent = user['agents'][0]
+    agent = get_agent_by_id(get_database(), agent_id)
+    if agent:
         return agent.get('agent_name', None)
     return None
 # POST API for chat interaction
@@ -1329,6 +1184,8 @@ def chat_interaction(chat_request: ChatRequest):
 
         # Get agent name
         agent_name = get_agent_name(chat_request.agent_id)
+        now = datetime.utcnow()
+        turn = chat_turn(now, total_tokens, cost_llm)
 
         # Prepare the log data
         log_data = {
@@ -1340,16 +1197,18 @@ def chat_interaction(chat_request: ChatRequest):
             "agent_id": chat_request.agent_id,
             "agent_name": agent_name,
             "user_id": chat_request.user_id,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow(),
+            "turns": [turn],
+            "created_at": now,
+            "updated_at": now,
         }
 
         if chat_request.chat_id:
             # Update existing chat log
             existing_log = chat_logs_collection.find_one({"chat_id": chat_request.chat_id})
             if existing_log:
-                # Append new messages
+                # Append new messages; only this turn's usage goes to the rollups
                 updated_chat_data = existing_log['chat_data'] + chat_data
+                usage_delta = chat_usage(now, total_tokens, cost_llm, new_conversation=False)
                 total_tokens += existing_log.get('total_tokens', 0)
                 cost_llm += existing_log.get('cost_llm', 0.0)
                 chat_logs_collection.update_one(
@@ -1361,8 +1220,9 @@ def chat_interaction(chat_request: ChatRequest):
                             "usage": usage,
                             "total_tokens": total_tokens,
                             "cost_llm": cost_llm,
-                            "updated_at": datetime.utcnow()
-                        }
+                            "updated_at": now
+                        },
+                        "$push": {"turns": turn},
                     }
                 )
                 chat_id = chat_request.chat_id
@@ -1371,11 +1231,15 @@ def chat_interaction(chat_request: ChatRequest):
                 log_data["chat_id"] = chat_request.chat_id
                 chat_logs_collection.insert_one(log_data)
                 chat_id = chat_request.chat_id
+                usage_delta = chat_usage(log_data["created_at"], total_tokens, cost_llm)
         else:
             # Create new chat log
             chat_id = str(uuid.uuid4())
             log_data["chat_id"] = chat_id
             chat_logs_collection.insert_one(log_data)
+            usage_delta = chat_usage(log_data["created_at"], total_tokens, cost_llm)
+
+        record_usage(db, chat_request.user_id, chat_request.agent_id, agent_name, usage_delta)
 
         # Return the response including agent name
         return {
@@ -1388,70 +1252,140 @@ def chat_interaction(chat_request: ChatRequest):
     
 
     
-@app.get("/call_logs/{user_id}", response_model=List[CallLog])
-def get_call_logs(user_id: str):
-    # Get the database connection
+@app.get("/call_logs/{user_id}", response_model=CallLogPage)
+def get_call_logs(
+    user_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Cursor returned as next_cursor by the previous page"),
+    start: Optional[datetime] = Query(None, description="Only calls that started at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only calls that started before this time"),
+):
     db = get_database()
 
-    # Access the collection
-    call_logs_collection = db["call_logs"]
-    
-    # Query the database for logs by user_id
-    query = {'user_id': user_id}
-    call_logs = list(call_logs_collection.find(query))
-    if not call_logs:
-        return []
-    
-    # Convert MongoDB-specific fields for FastAPI response
-    for call_log in call_logs:
-        if '_id' in call_log:
-            call_log['_id'] = str(call_log['_id'])  # Convert ObjectId to string
-        
-        # Ensure the called_number is correctly formatted
-        call_log['called_number'] = call_log.get('called_number', 'N/A')  # Default to 'N/A' if not present
-        
-        # Ensure the call_direction is set, default to 'unknown' if not present
-        call_log['call_direction'] = call_log.get('call_direction', 'unknown')  # Default to 'unknown' if not present
+    # Newest first, served by the (user_id, start_time, _id) index. Summaries only:
+    # transcripts are paged separately from /call_logs/{user_id}/{call_log_id}/messages
+    query = {'user_id': user_id, **date_range('start_time', start, end)}
+    call_logs, next_cursor = fetch_page(db["call_logs"], query, 'start_time', limit, after, {'messages': 0})
+    return {"items": [serialize_call_log(call_log) for call_log in call_logs], "next_cursor": next_cursor}
 
-        # Convert datetime fields to ISO format
-        call_log['start_time'] = call_log['start_time'].isoformat() if 'start_time' in call_log else None
-        call_log['end_time'] = call_log['end_time'].isoformat() if 'end_time' in call_log else None
+@app.get("/call_logs/{user_id}/{call_log_id}/messages", response_model=CallMessagePage)
+def get_call_messages(
+    user_id: str,
+    call_log_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Cursor returned as next_cursor by the previous page"),
+):
+    db = get_database()
+    query = {'user_id': user_id, 'call_log_id': call_log_id}
+    # Transcript order, served by the (user_id, call_log_id, seq, _id) index
+    messages, next_cursor = fetch_page(db[CALL_MESSAGES_COLLECTION], query, 'seq', limit, after, descending=False)
+    if not messages and not after and not db["call_logs"].find_one(query, {'_id': 1}):
+        # Archived calls keep their transcript inline and come back in a single page
+        archived = find_archived_log(db, user_id, "call", call_log_id)
+        if not archived:
+            raise HTTPException(status_code=404, detail="Call log not found")
+        return {"items": archived.get("messages", []), "next_cursor": None}
+    return {"items": messages, "next_cursor": next_cursor}
+
+def ndjson_response(cursor, filename: str, request: Request, gzip: Optional[bool]):
+    use_gzip = wants_gzip(request.headers.get("accept-encoding", ""), gzip)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(stream_ndjson(cursor, use_gzip), media_type="application/x-ndjson", headers=headers)
+
+# Bulk export of every call log as NDJSON, streamed straight from the cursor
+@app.get("/call_logs/{user_id}/export")
+def export_call_logs(
+    user_id: str,
+    request: Request,
+    start: Optional[datetime] = Query(None, description="Only calls that started at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only calls that started before this time"),
+    gzip: Optional[bool] = Query(None, description="Force gzip on or off; defaults to the Accept-Encoding header"),
+):
+    db = get_database()
+    query = {'user_id': user_id, **date_range('start_time', start, end)}
+    cursor = db["call_logs"].find(query).sort([('start_time', pymongo.ASCENDING), ('_id', pymongo.ASCENDING)]).batch_size(EXPORT_BATCH_SIZE)
+    # Transcripts live in call_messages; join them back in a batch of calls at a time
+    call_logs = with_messages(db, cursor, EXPORT_BATCH_SIZE)
+    return ndjson_response(call_logs, f"call_logs_{user_id}.ndjson", request, gzip)
+
+# Fetch one call by id, falling back to the cold archive once it has aged out of Mongo
+@app.get("/call_logs/{user_id}/{call_log_id}", response_model=CallLogSummary)
+def get_call_log(user_id: str, call_log_id: str):
+    db = get_database()
+    call_log = db["call_logs"].find_one({'user_id': user_id, 'call_log_id': call_log_id}, {'messages': 0})
+    if not call_log:
+        call_log = find_archived_log(db, user_id, "call", call_log_id)
+        if not call_log:
+            raise HTTPException(status_code=404, detail="Call log not found")
+        call_log.pop('messages', None)
+        call_log['archived'] = True
+    return serialize_call_log(call_log)
+
+# Full-text search over call transcripts and chat messages, best match first
+@app.get("/search/transcripts")
+def search_transcript_messages(
+    user_id: str,
+    q: str = Query(..., min_length=1, description="Words or \"quoted phrases\" to search for"),
+    agent_id: Optional[str] = Query(None, description="Only this agent"),
+    speaker: Optional[str] = Query(None, description="USER or AGENT (user or assistant for chats)"),
+    start: Optional[datetime] = Query(None, description="Only messages at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only messages before this time"),
+    source: str = Query("all", description="all, calls or chats"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+):
+    try:
+        return search_transcripts(get_database(), user_id, q, agent_id, speaker, start, end, source, offset, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Convert messages' timestamps
-        if 'messages' in call_log:
-            for message in call_log['messages']:
-                if 'timestamp' in message:
-                    message['timestamp'] = message['timestamp'].isoformat()
-    return call_logs
+def chat_logs_query(user_id: str, agent_id: Optional[str], chat_id: Optional[str], start=None, end=None):
+    query = {"user_id": user_id, **date_range("created_at", start, end)}
+    if agent_id:
+        query["agent_id"] = agent_id
+    if chat_id:
+        query["chat_id"] = chat_id
+    return query
 
 # GET API to fetch chat logs
-@app.get("/chat_logs/")
+@app.get("/chat_logs/", response_model=ChatLogPage)
 def get_chat_logs(
     user_id: str = Query(..., description="User ID"),
     agent_id: Optional[str] = Query(None, description="Agent ID"),
-    chat_id: Optional[str] = Query(None, description="Chat ID")
+    chat_id: Optional[str] = Query(None, description="Chat ID"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Cursor returned as next_cursor by the previous page"),
+    start: Optional[datetime] = Query(None, description="Only chats created at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only chats created before this time"),
 ):
-    db = get_database()
-    chat_logs_collection = db["chat_logs"]
- # To fetch agent name
     """API to fetch chat logs from MongoDB"""
-    query = {"user_id": user_id}
-    if agent_id:
-        query["agent_id"] = agent_id
-    if chat_id:
-        query["chat_id"] = chat_id
-
-    logs = list(chat_logs_collection.find(query))
-    if not logs:
+    db = get_database()
+    query = chat_logs_query(user_id, agent_id, chat_id, start, end)
+    logs, next_cursor = fetch_page(db["chat_logs"], query, "created_at", limit, after)
+    if not logs and not after:
         raise HTTPException(status_code=404, detail="No logs found")
 
-    # Prepare the response
-    response_logs = []
     for log in logs:
         log["_id"] = str(log["_id"])
-        response_logs.append(log)
+    return {"items": logs, "next_cursor": next_cursor}
 
-    return response_logs
+# Bulk export of every matching chat log as NDJSON, streamed straight from the cursor
+@app.get("/chat_logs/export")
+def export_chat_logs(
+    request: Request,
+    user_id: str = Query(..., description="User ID"),
+    agent_id: Optional[str] = Query(None, description="Agent ID"),
+    chat_id: Optional[str] = Query(None, description="Chat ID"),
+    start: Optional[datetime] = Query(None, description="Only chats created at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only chats created before this time"),
+    gzip: Optional[bool] = Query(None, description="Force gzip on or off; defaults to the Accept-Encoding header"),
+):
+    db = get_database()
+    query = chat_logs_query(user_id, agent_id, chat_id, start, end)
+    cursor = db["chat_logs"].find(query).sort([("created_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]).batch_size(EXPORT_BATCH_SIZE)
+    return ndjson_response(cursor, f"chat_logs_{user_id}.ndjson", request, gzip)
 
 @app.post("/save_data/")
 def save_dynamic_data(request: DynamicDataRequest):
@@ -1462,7 +1396,8 @@ def save_dynamic_data(request: DynamicDataRequest):
         data_to_save = {
             "user_id": request.user_id,
             "agent_id": request.agent_id,
-            "data": request.data
+            "data": request.data,
+            "created_at": datetime.utcnow()
         }
         
         # Insert the data into MongoDB
@@ -1472,24 +1407,47 @@ def save_dynamic_data(request: DynamicDataRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving data: {e}")
 
-# GET API: Retrieve all dynamic data for a specific user and agent
-@app.get("/get_data/")
-def get_all_dynamic_data(user_id: str, agent_id: str):
+# GET API: Retrieve dynamic data for a specific user and agent, one page at a time
+@app.get("/get_data/", response_model=DynamicDataPage)
+def get_all_dynamic_data(
+    user_id: str,
+    agent_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Cursor returned as next_cursor by the previous page"),
+    start: Optional[datetime] = Query(None, description="Only data saved at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only data saved before this time"),
+):
+    db = get_database()
+    # ObjectIds embed their creation time, so the date range works on documents
+    # saved before created_at was recorded and stays on the (user_id, agent_id, _id) index
+    query = {"user_id": user_id, "agent_id": agent_id}
+    id_range = {}
+    if start:
+        id_range["$gte"] = ObjectId.from_datetime(start)
+    if end:
+        id_range["$lt"] = ObjectId.from_datetime(end)
+    if id_range:
+        query["_id"] = id_range
+
+    try:
+        results, next_cursor = fetch_page(db["dynamic_data"], query, None, limit, after, {"_id": 1, "data": 1})
+        if not results and not after:
+            raise HTTPException(status_code=404, detail="No data found")
+        return {"data": [{"data": doc["data"]} for doc in results], "next_cursor": next_cursor}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving data: {e}")
+
+# Unbounded listing of every dynamic data entry; kept only as an explicit export path
+@app.get("/get_data/export")
+def export_dynamic_data(user_id: str, agent_id: str):
     try:
         db = get_database()
-        dynamic_data_collection = db["dynamic_data"]
-        # Query MongoDB to retrieve all documents for the user and agent
-        results = dynamic_data_collection.find(
+        results = db["dynamic_data"].find(
             {"user_id": user_id, "agent_id": agent_id}, {"_id": 0, "data": 1}
         )
-        
-        # Convert the cursor to a list
-        data_list = list(results)
-
-        if not data_list:
-            raise HTTPException(status_code=404, detail="No data found")
-        
-        return {"data": data_list}
+        return {"data": list(results)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving data: {e}")
 
@@ -1546,6 +1504,38 @@ def download_csv(csv_filename: str):
     
     return FileResponse(csv_filepath, media_type="text/csv", filename=csv_filename)
 
+# ------------------- Parquet Export Endpoints -------------------
+
+# Start an incremental Parquet export of call logs, chat logs and dynamic data
+@app.post("/exports/parquet/")
+def start_parquet_export(background_tasks: BackgroundTasks):
+    if export_running():
+        raise HTTPException(status_code=409, detail="A Parquet export is already running")
+    background_tasks.add_task(run_parquet_export, get_database())
+    return {"detail": "Parquet export started"}
+
+# List the Parquet files exported for a user
+@app.get("/exports/parquet/{user_id}")
+def list_parquet_exports(
+    user_id: str,
+    table: Optional[str] = Query(None, description="call_logs, call_messages, chat_logs, chat_messages or dynamic_data"),
+):
+    tables = {name for export in EXPORTS.values() for name in export[:2] if name}
+    if table and table not in tables:
+        raise HTTPException(status_code=400, detail=f"Unknown table: {table}")
+    files = list_user_exports(user_id, table)
+    return {"user_id": user_id, "files": [{"path": path, "link": f"/download_parquet/{path}"} for path in files]}
+
+# API to download an exported Parquet file
+@app.get("/download_parquet/{file_path:path}")
+def download_parquet(file_path: str):
+    parquet_filepath = resolve_export_path(file_path)
+
+    if not parquet_filepath:
+        raise HTTPException(status_code=404, detail="Parquet file not found")
+
+    return FileResponse(parquet_filepath, media_type="application/vnd.apache.parquet", filename=os.path.basename(parquet_filepath))
+
 # ------------------- Campaign Endpoints -------------------
 
 # 1. Create a Campaign
@@ -1625,23 +1615,19 @@ async def import_csv_for_campaign(
     campaign_id: str,
     email: str = Query(...),
     file: UploadFile = File(...),
-    db=Depends(get_db)
+    repos: Repositories = Depends(get_repos)
 ):
-    campaign = db.campaigns.find_one({"campaign_id": campaign_id, "email": email})
+    campaign = await repos.campaigns.get_campaign(campaign_id, email)
     if not campaign:
         raise HTTPException(status_code=404, detail="Campaign not found or does not belong to user")
 
-    content = await file.read()
-    decoded_content = content.decode('utf-8')
-    reader = csv.DictReader(io.StringIO(decoded_content))
-
-    phone_numbers = []
-    for row in reader:
-        phone_number = row.get('phone_number')
-        if phone_number:
-            phone_numbers.append(phone_number.strip())
+    # Parse the spooled upload line by line in a worker thread
+    try:
+        phone_numbers = await asyncio.to_thread(read_csv_phone_numbers, file)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV file must be UTF-8 encoded")
 
-    db.campaigns.update_one(
+    await repos.campaigns.update_one(
         {"campaign_id": campaign_id, "email": email},
         {"$addToSet": {"phone_numbers": {"$each": phone_numbers}}, "$set": {"updated_at": datetime.utcnow()}}
     )
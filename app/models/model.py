@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
 
@@ -38,7 +38,7 @@ class Message(BaseModel):
     message: str
     tokens: int
 
-class CallLog(BaseModel):
+class CallLogSummary(BaseModel):
     call_log_id: str
     agent_id: Optional[str]
     agent_name: Optional[str]
@@ -49,7 +49,6 @@ class CallLog(BaseModel):
     start_time: datetime
     end_time: datetime
     duration: float
-    messages: List[Message]
     tts_name: Optional[str]
     stt_name: Optional[str]
     llm_name: Optional[str]
@@ -63,7 +62,12 @@ class CallLog(BaseModel):
     total_cost: float
     conversation_analysis: Optional[str]
     called_number: Optional[str]  
-    call_direction: Optional[str] 
+    call_direction: Optional[str]
+    message_count: Optional[int] = None  # Transcript lives in call_messages
+    archived: bool = False  # Served from a cold archive segment
+
+class CallLog(CallLogSummary):
+    messages: List[Message]
 
 class DashboardData(BaseModel):
     total_call_minutes: float
@@ -79,4 +83,31 @@ class DashboardData(BaseModel):
     call_breakdown_by_category: dict
     total_tokens_used: dict
     cost_breakdown_by_agent: dict
-    average_call_duration_per_category: dict
\ No newline at end of file
+    average_call_duration_per_category: dict
+
+class AgentSummary(BaseModel):
+    id: str
+    agent_name: Optional[str] = None
+    phone_number: Optional[str] = None
+    agent_type: Optional[str] = None
+
+class UserSummary(BaseModel):
+    id: str = Field(alias="_id")
+    email: str
+    agents: List[AgentSummary] = []
+
+class CallLogPage(BaseModel):
+    items: List[CallLogSummary]
+    next_cursor: Optional[str] = None
+
+class CallMessagePage(BaseModel):
+    items: List[Message]
+    next_cursor: Optional[str] = None
+
+class ChatLogPage(BaseModel):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+class DynamicDataPage(BaseModel):
+    data: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
@@ -8,6 +8,9 @@ class UserCreate(BaseModel):
 class UserUpdate(BaseModel):
     email: Optional[str] = None
 
+class RetentionUpdate(BaseModel):
+    retention_days: Optional[int] = Field(None, ge=1, description="Archive logs older than this many days; null restores the default policy.")
+
 class AgentCreate(BaseModel):
     agent_name: Optional[str] = "Ava"  # Default agent name if not provided
     phone_number: str
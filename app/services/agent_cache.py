@@ -0,0 +1,93 @@
+import copy
+import os
+import threading
+import time
+from app.services.cache import TTLCache
+
+# Agent configs are read on every call and chat turn but change rarely, so
+# they are cached per process by canonical phone number and by agent id.
+# Writers call invalidate_agent(); other nodes can follow the agents change
+# stream (AGENT_CACHE_CHANGE_STREAM=1) to drop their copies as well.
+AGENT_CACHE_MAX_SIZE = int(os.getenv("AGENT_CACHE_MAX_SIZE", "2048"))
+AGENT_CACHE_TTL = float(os.getenv("AGENT_CACHE_TTL", "60"))
+
+agent_cache = TTLCache(maxsize=AGENT_CACHE_MAX_SIZE, ttl=AGENT_CACHE_TTL)
+
+# agent id -> cache keys holding that agent, so invalidation by id also drops the phone entry
+_keys_by_agent = {}
+_keys_lock = threading.Lock()
+
+
+def _remember(agent):
+    keys = [("id", agent["id"])]
+    if agent.get("phone_e164"):
+        keys.append(("phone", agent["phone_e164"]))
+    with _keys_lock:
+        _keys_by_agent.setdefault(agent["id"], set()).update(keys)
+    for key in keys:
+        agent_cache.set(key, agent)
+
+
+def _cached(key, load):
+    agent = agent_cache.get(key)
+    if agent is None:
+        agent = load()
+        if agent is None:
+            return None
+        _remember(agent)
+    # Callers may mutate what they get back (e.g. setdefault), never the cached copy
+    return copy.deepcopy(agent)
+
+
+def get_agent_by_phone(db, phone_e164: str):
+    return _cached(("phone", phone_e164), lambda: db["agents"].find_one({"phone_e164": phone_e164}))
+
+
+def get_agent_by_id(db, agent_id: str):
+    return _cached(("id", agent_id), lambda: db["agents"].find_one({"_id": agent_id}))
+
+
+def invalidate_agent(agent_id: str, phone_e164: str = None):
+    with _keys_lock:
+        keys = _keys_by_agent.pop(agent_id, set())
+    keys.add(("id", agent_id))
+    if phone_e164:
+        keys.add(("phone", phone_e164))
+    for key in keys:
+        agent_cache.pop(key)
+
+
+def get_agent_cache_stats():
+    return agent_cache.stats()
+
+
+def _watch_agents(db, stop_event: threading.Event):
+    while not stop_event.is_set():
+        try:
+            with db["agents"].watch(full_document="updateLookup") as stream:
+                for change in stream:
+                    agent_id = change.get("documentKey", {}).get("_id")
+                    full_document = change.get("fullDocument") or {}
+                    if agent_id:
+                        invalidate_agent(agent_id, full_document.get("phone_e164"))
+                    if stop_event.is_set():
+                        break
+        except Exception as e:
+            # Events may have been missed while disconnected, so start from a clean cache
+            print(f"Agent cache change stream error: {e}")
+            agent_cache.clear()
+            time.sleep(5)
+
+
+def start_change_stream_listener(db):
+    """
+    Start a daemon thread that invalidates cached agents on any change to the
+    agents collection (requires a replica set, e.g. Atlas). Returns a stop event,
+    or None when AGENT_CACHE_CHANGE_STREAM is not enabled.
+    """
+    if os.getenv("AGENT_CACHE_CHANGE_STREAM", "").lower() not in ("1", "true", "yes"):
+        return None
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_watch_agents, args=(db, stop_event), daemon=True, name="agent-cache-invalidation")
+    thread.start()
+    return stop_event
@@ -0,0 +1,70 @@
+from pymongo import ReplaceOne
+
+# Call transcripts are stored one message per document in `call_messages`,
+# apart from the call metadata in `call_logs`, so list and dashboard reads
+# never pull transcripts they do not show. `seq` is the message's position in
+# the call, which is also its timestamp order.
+
+CALL_MESSAGES_COLLECTION = "call_messages"
+CALL_MESSAGE_FIELDS = ("timestamp", "speaker", "message", "tokens")
+
+
+def message_documents(call_log, messages):
+    return [
+        {
+            "user_id": call_log.get("user_id"),
+            "agent_id": call_log.get("agent_id"),
+            "call_log_id": call_log["call_log_id"],
+            "seq": seq,
+            **{field: message.get(field) for field in CALL_MESSAGE_FIELDS},
+        }
+        for seq, message in enumerate(messages)
+    ]
+
+
+def save_call_messages(db, call_log, messages, batch_size: int = 500):
+    """
+    Write a call's transcript. Messages are upserted on (user_id,
+    call_log_id, seq), so re-processing the same call does not duplicate them.
+    """
+    operations = [
+        ReplaceOne({"user_id": doc["user_id"], "call_log_id": doc["call_log_id"], "seq": doc["seq"]}, doc, upsert=True)
+        for doc in message_documents(call_log, messages)
+    ]
+    for start in range(0, len(operations), batch_size):
+        db[CALL_MESSAGES_COLLECTION].bulk_write(operations[start:start + batch_size], ordered=False)
+    return len(operations)
+
+
+def with_messages(db, call_logs, batch_size: int = 500):
+    """
+    Yield call logs with their transcript back in `messages`, fetching the
+    messages of each batch of calls in one query. Call logs that still carry
+    their messages inline are passed through unchanged.
+    """
+    def joined(batch):
+        ids = [call_log["call_log_id"] for call_log in batch if "messages" not in call_log]
+        by_call = {call_log_id: [] for call_log_id in ids}
+        if ids:
+            user_ids = list({call_log.get("user_id") for call_log in batch})
+            cursor = db[CALL_MESSAGES_COLLECTION].find(
+                {"user_id": {"$in": user_ids}, "call_log_id": {"$in": ids}},
+                {"_id": 0, "call_log_id": 1, **{field: 1 for field in CALL_MESSAGE_FIELDS}},
+            ).sort([("call_log_id", 1), ("seq", 1)])
+            for message in cursor:
+                by_call[message.pop("call_log_id")].append(message)
+        for call_log in batch:
+            if "messages" not in call_log:
+                call_log["messages"] = by_call.get(call_log["call_log_id"], [])
+            yield call_log
+
+    batch = []
+    try:
+        for call_log in call_logs:
+            batch.append(call_log)
+            if len(batch) >= batch_size:
+                yield from joined(batch)
+                batch = []
+        yield from joined(batch)
+    finally:
+        call_logs.close()
@@ -1,4 +1,5 @@
 from app.db.databases import *
+from app.services.phone_routing import normalize_e164, resolve_phone_route
 from threading import Semaphore, Thread
 import os
 import uuid
@@ -23,15 +24,6 @@ def run_command_sync(cmd):
         return result.stdout
     except Exception as e:
         raise Exception(f"Failed to run command: {cmd} -> {e}")
-def normalize_phone_number(phone_number: str) -> str:
-    """
-    Normalize phone numbers by ensuring they include the '+' sign, 
-    and removing spaces or special characters.
-    """
-    phone_number = phone_number.strip().replace(' ', '').replace('-', '')
-    if not phone_number.startswith('+'):
-        phone_number = '+' + phone_number
-    return phone_number
 
 # Process the calls in the background
 def process_campaign_calls_sync(campaign_id: str, email: str):
@@ -46,11 +38,15 @@ def process_campaign_calls_sync(campaign_id: str, email: str):
         print(f"Campaign not found: {campaign_id}")
         return
 
-    # Normalize the agent phone number
-    agent_phone_number = normalize_phone_number(campaign['agent_phone_number'])
-    
+    # Normalize the agent phone number to the canonical E.164 routing form
+    agent_phone_number = normalize_e164(campaign['agent_phone_number'])
+
+    # Same routing used by the voice agent, so calls only go out if an agent will answer them
+    if not resolve_phone_route(db, agent_phone_number):
+        print(f"Warning: no agent is routed to {agent_phone_number} for campaign {campaign_id}")
+
     # Retrieve the outbound_trunk_id from the logs collection using normalized phone number
-    log_entry = db.logs.find_one({"email": email, "phone_number": agent_phone_number})
+    log_entry = db.logs.find_one({"email": email, "phone_e164": agent_phone_number})
     if not log_entry:
         print(f"No trunk entry found for email: {email}, agent_phone_number: {agent_phone_number}")
         db.campaigns.update_one(
@@ -139,7 +135,7 @@ def process_campaign_calls_sync(campaign_id: str, email: str):
     # Start the calls concurrently using threads
     threads = []
     for phone_number in remaining_numbers:
-        t = Thread(target=make_call, args=(normalize_phone_number(phone_number),))
+        t = Thread(target=make_call, args=(normalize_e164(phone_number),))
         threads.append(t)
         t.start()
 
@@ -0,0 +1,484 @@
+from datetime import datetime, timedelta, timezone
+from app.services.sketches import sketch_quantiles, sketch_count
+from app.services.usage_rollups import ROLLUPS_COLLECTION, CHAT_CHANNEL, CHAT_TOKENS_PER_MINUTE, bucket_start, rollups_ready, unescape_key
+
+# Dashboard statistics computed server-side with one $facet aggregation over
+# the usage rollups (or over the raw log collections until the rollups have
+# been built). Only grouped numbers come back from Mongo; transcripts and
+# per-call documents never leave the database.
+
+CALL_CATEGORIES = ("web", "sip")
+
+# Per call, then per chat turn; see app.services.usage_rollups
+DISTRIBUTION_METRICS = ("duration", "tokens", "cost", "chat_turn_tokens", "chat_turn_cost")
+TIMESERIES_INTERVALS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+# Window used when the caller gives no start, per interval
+TIMESERIES_DEFAULT_SPAN = {"hour": timedelta(days=2), "day": timedelta(days=90)}
+MAX_TIMESERIES_POINTS = 10000
+TIMESERIES_FIELDS = ("conversations", "calls", "chats", "minutes", "tokens", "cost")
+
+# Distribution windows up to this long are read from hourly buckets, longer ones from daily buckets
+HOURLY_WINDOW_LIMIT = timedelta(days=31)
+
+
+def to_naive_utc(value):
+    """Rollup buckets are naive UTC (as pymongo returns them); bring query bounds to match."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+# Helper function to get the time period filter
+def get_time_filter(filter_type: str):
+    now = datetime.now()
+    if filter_type == "day":
+        start_time = now - timedelta(days=1)
+        previous_start_time = start_time - timedelta(days=1)
+    elif filter_type == "week":
+        start_time = now - timedelta(weeks=1)
+        previous_start_time = start_time - timedelta(weeks=1)
+    elif filter_type == "month":
+        start_time = now - timedelta(days=30)
+        previous_start_time = start_time - timedelta(days=30)
+    else:
+        start_time = None  # No time filter for overall
+        previous_start_time = None
+    return start_time, previous_start_time
+
+
+# Helper function to calculate percentage change
+def calculate_percentage_change(current, previous):
+    if previous == 0:
+        return 100 if current > 0 else 0
+    return ((current - previous) / previous) * 100
+
+
+def _sum(field):
+    return {"$sum": {"$ifNull": [f"${field}", 0]}}
+
+
+def _facet_pipeline(time_field, user_id, start_time, previous_start_time, projection, totals, breakdowns):
+    match = {"user_id": user_id}
+    lower_bound = previous_start_time or start_time
+    if lower_bound:
+        match[time_field] = {"$gte": lower_bound}
+    current = [{"$match": {time_field: {"$gte": start_time}}}] if start_time else []
+
+    facets = {"current": current + [{"$group": dict(totals, _id=None)}]}
+    if previous_start_time:
+        facets["previous"] = [
+            {"$match": {time_field: {"$lt": start_time}}},
+            {"$group": dict(totals, _id=None)},
+        ]
+    for name, group in breakdowns.items():
+        facets[name] = current + [{"$group": group}]
+
+    return [
+        {"$match": match},
+        {"$project": dict(projection, **{time_field: 1})},
+        {"$facet": facets},
+    ]
+
+
+def call_logs_pipeline(user_id, start_time, previous_start_time):
+    totals = {
+        "count": {"$sum": 1},
+        "duration": _sum("duration"),
+        "cost": _sum("total_cost"),
+        "tokens_llm": _sum("total_tokens_llm"),
+        "tokens_stt": _sum("total_tokens_stt"),
+        "tokens_tts": _sum("total_tokens_tts"),
+    }
+    breakdowns = {
+        "by_agent": {
+            "_id": {"$ifNull": ["$agent_name", "Unknown"]},
+            "count": {"$sum": 1},
+            "duration": _sum("duration"),
+            "cost": _sum("total_cost"),
+        },
+        "by_provider": {"_id": {"$ifNull": ["$llm_name", "Unknown"]}, "cost": _sum("total_cost")},
+        "end_reasons": {"_id": {"$ifNull": ["$call_end_reason", "Completed"]}, "count": {"$sum": 1}},
+        "by_call_type": {
+            "_id": "$call_type",
+            "count": {"$sum": 1},
+            "duration": _sum("duration"),
+            "cost": _sum("total_cost"),
+        },
+    }
+    projection = {
+        "_id": 0, "duration": 1, "total_cost": 1, "total_tokens_llm": 1, "total_tokens_stt": 1,
+        "total_tokens_tts": 1, "agent_name": 1, "llm_name": 1, "call_end_reason": 1, "call_type": 1,
+    }
+    return _facet_pipeline("start_time", user_id, start_time, previous_start_time, projection, totals, breakdowns)
+
+
+def chat_logs_pipeline(user_id, start_time, previous_start_time):
+    totals = {"count": {"$sum": 1}, "tokens": _sum("total_tokens"), "cost": _sum("cost_llm")}
+    breakdowns = {
+        "by_agent": {
+            "_id": {"$ifNull": ["$agent_name", "Unknown"]},
+            "count": {"$sum": 1},
+            "tokens": _sum("total_tokens"),
+            "cost": _sum("cost_llm"),
+        },
+    }
+    projection = {"_id": 0, "total_tokens": 1, "cost_llm": 1, "agent_name": 1}
+    return _facet_pipeline("created_at", user_id, start_time, previous_start_time, projection, totals, breakdowns)
+
+
+def _map_breakdown(field, stages):
+    # Sum a {key: number} map field across buckets into [{_id: key, value: n}]
+    return stages + [
+        {"$project": {"pairs": {"$objectToArray": {"$ifNull": [f"${field}", {}]}}}},
+        {"$unwind": "$pairs"},
+        {"$group": {"_id": "$pairs.k", "value": {"$sum": "$pairs.v"}}},
+    ]
+
+
+def rollups_pipeline(user_id, start_time, previous_start_time):
+    """
+    The same facets as call_logs_pipeline/chat_logs_pipeline, read from the
+    usage rollups: hourly buckets for bounded windows, daily ones for "overall".
+    """
+    granularity = "hour" if start_time else "day"
+    start = bucket_start(start_time, granularity) if start_time else None
+    previous_start = bucket_start(previous_start_time, granularity) if previous_start_time else None
+
+    match = {"user_id": user_id, "granularity": granularity}
+    if previous_start or start:
+        match["bucket_start"] = {"$gte": previous_start or start}
+    in_window = {"bucket_start": {"$gte": start}} if start else {}
+    calls = [{"$match": dict(in_window, channel={"$ne": CHAT_CHANNEL})}]
+    chats = [{"$match": dict(in_window, channel=CHAT_CHANNEL)}]
+
+    call_totals = {
+        "_id": None,
+        "count": {"$sum": "$conversations"},
+        "duration": _sum("duration"),
+        "cost": _sum("cost"),
+        "tokens_llm": _sum("tokens_llm"),
+        "tokens_stt": _sum("tokens_stt"),
+        "tokens_tts": _sum("tokens_tts"),
+    }
+    chat_totals = {"_id": None, "count": {"$sum": "$conversations"}, "tokens": _sum("tokens_llm"), "cost": _sum("cost")}
+    facets = {
+        "calls_current": calls + [{"$group": call_totals}],
+        "chats_current": chats + [{"$group": chat_totals}],
+        "calls_by_agent": calls + [{"$group": {
+            "_id": {"$ifNull": ["$agent_name", "Unknown"]},
+            "count": {"$sum": "$conversations"},
+            "duration": _sum("duration"),
+            "cost": _sum("cost"),
+        }}],
+        "chats_by_agent": chats + [{"$group": {
+            "_id": {"$ifNull": ["$agent_name", "Unknown"]},
+            "count": {"$sum": "$conversations"},
+            "tokens": _sum("tokens_llm"),
+            "cost": _sum("cost"),
+        }}],
+        "calls_by_provider": _map_breakdown("cost_by_provider", calls),
+        "calls_end_reasons": _map_breakdown("end_reasons", calls),
+        "calls_by_call_type": calls + [{"$group": {
+            "_id": "$channel",
+            "count": {"$sum": "$conversations"},
+            "duration": _sum("duration"),
+            "cost": _sum("cost"),
+        }}],
+    }
+    if previous_start:
+        before = {"$match": {"bucket_start": {"$lt": start}}}
+        facets["calls_previous"] = [before, {"$match": {"channel": {"$ne": CHAT_CHANNEL}}}, {"$group": call_totals}]
+        facets["chats_previous"] = [before, {"$match": {"channel": CHAT_CHANNEL}}, {"$group": chat_totals}]
+    return [{"$match": match}, {"$facet": facets}]
+
+
+def _split_rollup_facets(facets):
+    call_facets = {
+        "current": facets.get("calls_current", []),
+        "previous": facets.get("calls_previous", []),
+        "by_agent": facets.get("calls_by_agent", []),
+        "by_provider": [{"_id": unescape_key(row["_id"]), "cost": row["value"]} for row in facets.get("calls_by_provider", [])],
+        "end_reasons": [{"_id": unescape_key(row["_id"]), "count": row["value"]} for row in facets.get("calls_end_reasons", [])],
+        "by_call_type": facets.get("calls_by_call_type", []),
+    }
+    chat_facets = {
+        "current": facets.get("chats_current", []),
+        "previous": facets.get("chats_previous", []),
+        "by_agent": facets.get("chats_by_agent", []),
+    }
+    return call_facets, chat_facets
+
+
+def _first(rows):
+    return rows[0] if rows else {}
+
+
+def combine_totals(call_totals, chat_totals):
+    number_of_calls = call_totals.get("count", 0)
+    number_of_chats = chat_totals.get("count", 0)
+    chat_tokens = chat_totals.get("tokens", 0)
+    total_spent = call_totals.get("cost", 0) + chat_totals.get("cost", 0)
+    total_conversations = number_of_calls + number_of_chats
+    return {
+        'total_conversation_minutes': call_totals.get("duration", 0) / 60 + chat_tokens / CHAT_TOKENS_PER_MINUTE,
+        'total_spent': total_spent,
+        'number_of_calls': number_of_calls,
+        'number_of_chats': number_of_chats,
+        'total_conversations': total_conversations,
+        'average_cost_per_conversation': total_spent / total_conversations if total_conversations > 0 else 0,
+        'total_tokens_llm': call_totals.get("tokens_llm", 0) + chat_tokens,
+        'total_tokens_stt': call_totals.get("tokens_stt", 0),
+        'total_tokens_tts': call_totals.get("tokens_tts", 0),
+    }
+
+
+def build_dashboard(current_data, previous_data, call_facets, chat_facets):
+    """Shape grouped numbers into the response returned by GET /dashboard."""
+    percentage_changes = {
+        "total_conversation_minutes": calculate_percentage_change(current_data['total_conversation_minutes'], previous_data['total_conversation_minutes']),
+        "number_of_conversations": calculate_percentage_change(current_data['total_conversations'], previous_data['total_conversations']),
+        "total_spent": calculate_percentage_change(current_data['total_spent'], previous_data['total_spent']),
+        "average_cost_per_conversation": calculate_percentage_change(current_data['average_cost_per_conversation'], previous_data['average_cost_per_conversation']),
+    }
+
+    call_end_reasons = {row["_id"]: row["count"] for row in call_facets.get("end_reasons", [])}
+
+    cost_per_provider = {row["_id"]: row["cost"] for row in call_facets.get("by_provider", [])}
+    chat_cost = sum(row["cost"] for row in chat_facets.get("by_agent", []))
+    if chat_facets.get("by_agent"):
+        # Chat uses the LLM only
+        cost_per_provider["LLM"] = cost_per_provider.get("LLM", 0.0) + chat_cost
+
+    assistants_table = {}
+    for row in call_facets.get("by_agent", []):
+        stats = assistants_table.setdefault(row["_id"], {"conversation_count": 0, "total_duration": 0.0, "total_cost": 0.0})
+        stats["conversation_count"] += row["count"]
+        stats["total_duration"] += row["duration"] / 60
+        stats["total_cost"] += row["cost"]
+    for row in chat_facets.get("by_agent", []):
+        stats = assistants_table.setdefault(row["_id"], {"conversation_count": 0, "total_duration": 0.0, "total_cost": 0.0})
+        stats["conversation_count"] += row["count"]
+        stats["total_duration"] += row["tokens"] / CHAT_TOKENS_PER_MINUTE
+        stats["total_cost"] += row["cost"]
+
+    call_breakdown_by_category = {
+        "call_counts": {category: 0 for category in CALL_CATEGORIES},
+        "call_durations": {category: 0.0 for category in CALL_CATEGORIES},
+        "total_spent": {category: 0.0 for category in CALL_CATEGORIES},
+    }
+    for row in call_facets.get("by_call_type", []):
+        if row["_id"] in CALL_CATEGORIES:
+            call_breakdown_by_category["call_counts"][row["_id"]] += row["count"]
+            call_breakdown_by_category["call_durations"][row["_id"]] += row["duration"] / 60
+            call_breakdown_by_category["total_spent"][row["_id"]] += row["cost"]
+
+    average_call_duration_per_category = {}
+    for category in CALL_CATEGORIES:
+        call_count = call_breakdown_by_category['call_counts'][category]
+        average_call_duration_per_category[category] = (
+            call_breakdown_by_category['call_durations'][category] / call_count if call_count > 0 else 0.0
+        )
+
+    def avg_duration(stats):
+        return stats['total_duration'] / stats['conversation_count'] if stats['conversation_count'] > 0 else 0
+
+    return {
+        "total_conversation_minutes": current_data['total_conversation_minutes'],
+        "number_of_calls": current_data['number_of_calls'],
+        "number_of_chats": current_data['number_of_chats'],
+        "total_conversations": current_data['total_conversations'],
+        "total_spent": current_data['total_spent'],
+        "average_cost_per_conversation": current_data['average_cost_per_conversation'],
+        "percentage_changes": percentage_changes,
+        "call_end_reasons": call_end_reasons,
+        "average_call_duration_by_assistant": {name: avg_duration(stats) for name, stats in assistants_table.items()},
+        "cost_per_provider": cost_per_provider,
+        "assistants_table": [
+            {
+                "assistant_name": name,
+                "conversation_count": stats['conversation_count'],
+                "avg_duration": avg_duration(stats),
+                "total_cost": stats['total_cost'],
+            }
+            for name, stats in assistants_table.items()
+        ],
+        "total_conversations_per_agent": {name: stats['conversation_count'] for name, stats in assistants_table.items()},
+        "call_breakdown_by_category": call_breakdown_by_category,
+        "total_tokens_used": {
+            "total_tokens_llm": current_data['total_tokens_llm'],
+            "total_tokens_stt": current_data['total_tokens_stt'],
+            "total_tokens_tts": current_data['total_tokens_tts'],
+        },
+        "cost_breakdown_by_agent": {name: stats['total_cost'] for name, stats in assistants_table.items()},
+        "average_call_duration_per_category": average_call_duration_per_category,
+    }
+
+
+def compute_dashboard(db, user_id: str, start_time, previous_start_time):
+    """
+    Reads the usage rollups once they have been built, otherwise one
+    aggregation round trip per log collection. The previous period is the
+    window of the same length immediately before start_time.
+    """
+    if rollups_ready(db):
+        facets = _first(list(db[ROLLUPS_COLLECTION].aggregate(rollups_pipeline(user_id, start_time, previous_start_time))))
+        call_facets, chat_facets = _split_rollup_facets(facets)
+    else:
+        call_facets = _first(list(db["call_logs"].aggregate(call_logs_pipeline(user_id, start_time, previous_start_time))))
+        chat_facets = _first(list(db["chat_logs"].aggregate(chat_logs_pipeline(user_id, start_time, previous_start_time))))
+
+    current_data = combine_totals(_first(call_facets.get("current", [])), _first(chat_facets.get("current", [])))
+    previous_data = combine_totals(_first(call_facets.get("previous", [])), _first(chat_facets.get("previous", [])))
+    return build_dashboard(current_data, previous_data, call_facets, chat_facets)
+
+
+def distribution_pipeline(user_id, start_time=None, end_time=None, agent_id=None, channel=None):
+    start_time, end_time = to_naive_utc(start_time), to_naive_utc(end_time)
+    if start_time and (end_time or datetime.utcnow()) - start_time <= HOURLY_WINDOW_LIMIT:
+        granularity = "hour"
+    else:
+        granularity = "day"
+    match = {"user_id": user_id, "granularity": granularity}
+    bounds = {}
+    if start_time:
+        bounds["$gte"] = bucket_start(start_time, granularity)
+    if end_time:
+        bounds["$lt"] = end_time
+    if bounds:
+        match["bucket_start"] = bounds
+    if agent_id:
+        match["agent_id"] = agent_id
+    if channel:
+        match["channel"] = channel
+    pipeline = [
+        {"$match": match},
+        {"$project": {"_id": 0, "metrics": {"$objectToArray": {"$ifNull": ["$sketches", {}]}}}},
+        {"$unwind": "$metrics"},
+        {"$project": {"metric": "$metrics.k", "buckets": {"$objectToArray": "$metrics.v"}}},
+        {"$unwind": "$buckets"},
+        {"$group": {"_id": {"metric": "$metric", "key": "$buckets.k"}, "count": {"$sum": "$buckets.v"}}},
+    ]
+    return pipeline, granularity
+
+
+def compute_distribution(db, user_id: str, start_time=None, end_time=None, agent_id=None, channel=None):
+    """
+    Percentiles of duration (seconds), tokens and cost per call, and of
+    tokens and cost per chat turn, merged from the sketches in the usage rollups. Bucket counts are summed
+    server-side, so at most a few hundred rows per metric come back.
+    """
+    pipeline, granularity = distribution_pipeline(user_id, start_time, end_time, agent_id, channel)
+    sketches = {metric: {} for metric in DISTRIBUTION_METRICS}
+    for row in db[ROLLUPS_COLLECTION].aggregate(pipeline):
+        sketch = sketches.setdefault(row["_id"]["metric"], {})
+        sketch[row["_id"]["key"]] = row["count"]
+
+    distribution = {"granularity": granularity}
+    for metric, sketch in sketches.items():
+        distribution[metric] = dict(count=sketch_count(sketch), **sketch_quantiles(sketch))
+    return distribution
+
+
+def timeseries_window(interval: str, start_time=None, end_time=None):
+    """Align [start, end) to whole intervals, filling in the default span."""
+    end_time = to_naive_utc(end_time) or datetime.utcnow()
+    start_time = to_naive_utc(start_time) or end_time - TIMESERIES_DEFAULT_SPAN[interval]
+    start = bucket_start(start_time, interval)
+    end = bucket_start(end_time, interval)
+    if end < end_time:
+        end += TIMESERIES_INTERVALS[interval]
+    return start, end
+
+
+def timeseries_pipeline(user_id, interval, start, end, agent_id=None):
+    match = {"user_id": user_id, "granularity": interval, "bucket_start": {"$gte": start, "$lt": end}}
+    if agent_id:
+        match["agent_id"] = agent_id
+    is_chat = {"$eq": ["$channel", CHAT_CHANNEL]}
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {"$dateTrunc": {"date": "$bucket_start", "unit": interval}},
+            "conversations": {"$sum": "$conversations"},
+            "calls": {"$sum": {"$cond": [is_chat, 0, "$conversations"]}},
+            "chats": {"$sum": {"$cond": [is_chat, "$conversations", 0]}},
+            "minutes": _sum("minutes"),
+            "tokens": {"$sum": {"$add": [
+                {"$ifNull": ["$tokens_llm", 0]}, {"$ifNull": ["$tokens_stt", 0]}, {"$ifNull": ["$tokens_tts", 0]},
+            ]}},
+            "cost": _sum("cost"),
+        }},
+    ]
+
+
+def _raw_timeseries_pipeline(time_field, user_id, interval, start, end, agent_id, group):
+    match = {"user_id": user_id, time_field: {"$gte": start, "$lt": end}}
+    if agent_id:
+        match["agent_id"] = agent_id
+    return [
+        {"$match": match},
+        {"$group": dict(group, _id={"$dateTrunc": {"date": f"${time_field}", "unit": interval}})},
+    ]
+
+
+def call_logs_timeseries_pipeline(user_id, interval, start, end, agent_id=None):
+    return _raw_timeseries_pipeline("start_time", user_id, interval, start, end, agent_id, {
+        "conversations": {"$sum": 1},
+        "calls": {"$sum": 1},
+        "minutes": {"$sum": {"$divide": [{"$ifNull": ["$duration", 0]}, 60]}},
+        "tokens": {"$sum": {"$add": [
+            {"$ifNull": ["$total_tokens_llm", 0]}, {"$ifNull": ["$total_tokens_stt", 0]}, {"$ifNull": ["$total_tokens_tts", 0]},
+        ]}},
+        "cost": _sum("total_cost"),
+    })
+
+
+def chat_logs_timeseries_pipeline(user_id, interval, start, end, agent_id=None):
+    # Without rollups a chat's whole usage lands in the interval it was created in
+    return _raw_timeseries_pipeline("created_at", user_id, interval, start, end, agent_id, {
+        "conversations": {"$sum": 1},
+        "chats": {"$sum": 1},
+        "minutes": {"$sum": {"$divide": [{"$ifNull": ["$total_tokens", 0]}, CHAT_TOKENS_PER_MINUTE]}},
+        "tokens": _sum("total_tokens"),
+        "cost": _sum("cost_llm"),
+    })
+
+
+def compute_timeseries(db, user_id: str, interval: str, start_time=None, end_time=None, agent_id=None):
+    """
+    Dense, zero-filled series of conversations, minutes, tokens and cost per
+    interval, grouped from the usage rollup buckets once they have been built,
+    otherwise from the raw log collections. Raises ValueError when the window
+    holds more than MAX_TIMESERIES_POINTS intervals.
+    """
+    if interval not in TIMESERIES_INTERVALS:
+        raise ValueError("interval must be 'hour' or 'day'")
+    start, end = timeseries_window(interval, start_time, end_time)
+    step = TIMESERIES_INTERVALS[interval]
+    if (end - start) / step > MAX_TIMESERIES_POINTS:
+        raise ValueError(f"Window too large for interval '{interval}' (max {MAX_TIMESERIES_POINTS} points)")
+
+    if rollups_ready(db):
+        rows = {row["_id"]: row for row in db[ROLLUPS_COLLECTION].aggregate(timeseries_pipeline(user_id, interval, start, end, agent_id))}
+    else:
+        rows = {}
+        for collection_name, pipeline in (
+            ("call_logs", call_logs_timeseries_pipeline(user_id, interval, start, end, agent_id)),
+            ("chat_logs", chat_logs_timeseries_pipeline(user_id, interval, start, end, agent_id)),
+        ):
+            for row in db[collection_name].aggregate(pipeline):
+                merged = rows.setdefault(row["_id"], {})
+                for field in TIMESERIES_FIELDS:
+                    merged[field] = merged.get(field, 0) + row.get(field, 0)
+
+    series = {"interval": interval, "from": start, "to": end, "timestamps": []}
+    for field in TIMESERIES_FIELDS:
+        series[field] = []
+    point = start
+    while point < end:
+        row = rows.get(point, {})
+        series["timestamps"].append(point)
+        for field in TIMESERIES_FIELDS:
+            series[field].append(row.get(field, 0))
+        point += step
+    return series
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.services.cache import TTLCache
+from app.services.usage_rollups import get_usage_version
+
+# Cached get_dashboard results keyed by (user_id, filter_type). An entry is
+# fresh while it is younger than its window's TTL and the user's usage
+# version (bumped whenever a call or chat is rolled up) has not moved. Stale
+# entries are still served while one background refresh recomputes them, so
+# only a cold miss waits for the aggregation.
+
+# Fresh-TTL in seconds, proportional to how much a new log moves each window
+DASHBOARD_TTLS = {
+    "day": float(os.getenv("DASHBOARD_TTL_DAY", "30")),
+    "week": float(os.getenv("DASHBOARD_TTL_WEEK", "120")),
+    "month": float(os.getenv("DASHBOARD_TTL_MONTH", "300")),
+    "overall": float(os.getenv("DASHBOARD_TTL_OVERALL", "600")),
+}
+# Stale entries are served for at most this many TTLs before a refresh is forced inline
+DASHBOARD_MAX_STALE_FACTOR = float(os.getenv("DASHBOARD_MAX_STALE_FACTOR", "10"))
+DASHBOARD_CACHE_MAX_SIZE = int(os.getenv("DASHBOARD_CACHE_MAX_SIZE", "4096"))
+
+dashboard_cache = TTLCache(
+    maxsize=DASHBOARD_CACHE_MAX_SIZE,
+    ttl=max(DASHBOARD_TTLS.values()) * DASHBOARD_MAX_STALE_FACTOR,
+)
+
+_refresh_executor = ThreadPoolExecutor(max_workers=int(os.getenv("DASHBOARD_REFRESH_WORKERS", "2")))
+_refreshing = set()
+_lock = threading.Lock()
+_counters = {"fresh_hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def _compute(db, key, compute):
+    # Read the version first: a log landing mid-compute leaves the entry stale, not wrongly fresh
+    version = get_usage_version(db, key[0])
+    result = compute()
+    dashboard_cache.set(key, (result, time.monotonic(), version))
+    return result
+
+
+def _refresh(db, key, compute):
+    try:
+        _compute(db, key, compute)
+        _count("refreshes")
+    except Exception as e:
+        _count("refresh_errors")
+        print(f"Error refreshing dashboard cache for {key}: {e}")
+    finally:
+        with _lock:
+            _refreshing.discard(key)
+
+
+def _schedule_refresh(db, key, compute):
+    with _lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    _refresh_executor.submit(_refresh, db, key, compute)
+
+
+def get_cached_dashboard(db, user_id: str, filter_type: str, compute):
+    """Return compute()'s dashboard for (user_id, filter_type), serving from cache when possible."""
+    key = (user_id, filter_type)
+    entry = dashboard_cache.get(key)
+    if entry is None:
+        _count("misses")
+        return _compute(db, key, compute)
+
+    result, computed_at, version = entry
+    ttl = DASHBOARD_TTLS.get(filter_type, DASHBOARD_TTLS["overall"])
+    age = time.monotonic() - computed_at
+    if age < ttl and version == get_usage_version(db, user_id):
+        _count("fresh_hits")
+        return result
+    if age >= ttl * DASHBOARD_MAX_STALE_FACTOR:
+        _count("misses")
+        return _compute(db, key, compute)
+
+    _count("stale_hits")
+    _schedule_refresh(db, key, compute)
+    return result
+
+
+def get_dashboard_cache_stats():
+    with _lock:
+        counters = dict(_counters)
+        refreshing = len(_refreshing)
+    lookups = counters["fresh_hits"] + counters["stale_hits"] + counters["misses"]
+    return dict(
+        counters,
+        size=len(dashboard_cache),
+        maxsize=dashboard_cache.maxsize,
+        refreshing=refreshing,
+        hit_rate=(counters["fresh_hits"] + counters["stale_hits"]) / lookups if lookups else 0.0,
+        fresh_hit_rate=counters["fresh_hits"] / lookups if lookups else 0.0,
+    )
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+# Embeddings keyed by (model, dimensions, sha256(text)), kept in SQLite under
+# uploads/ so every agent and every rebuild shares them: a paragraph is only
+# ever sent to the embeddings API once per model. Vectors are stored as
+# float32 blobs. When the stored vectors pass EMBEDDING_CACHE_MAX_BYTES the
+# least recently used are evicted down to EMBEDDING_CACHE_EVICT_TO of it.
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join("uploads", "embedding_cache.sqlite3"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+EMBEDDING_CACHE_EVICT_TO = float(os.getenv("EMBEDDING_CACHE_EVICT_TO", "0.9"))
+# SQLite caps the number of bound parameters per statement
+_LOOKUP_CHUNK = 500
+
+_local = threading.local()
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+
+def _count(name, n=1):
+    with _lock:
+        _counters[name] += n
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _connect():
+    # One connection per thread; WAL lets API workers and ingestion jobs read while one writes
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        directory = os.path.dirname(EMBEDDING_CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(EMBEDDING_CACHE_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, dimensions, sha256)
+            );
+            CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO meta (key, value)
+                SELECT 'bytes', COALESCE(SUM(LENGTH(embedding)), 0) FROM embeddings;
+            """
+        )
+        _local.conn = conn
+    return conn
+
+
+def get_cached_embeddings(model: str, dimensions, digests):
+    """sha256 -> embedding for the digests already in the cache. Errors count as misses."""
+    digests = list(dict.fromkeys(digests))
+    found = {}
+    try:
+        conn = _connect()
+        now = time.time()
+        with conn:
+            for start in range(0, len(digests), _LOOKUP_CHUNK):
+                chunk = digests[start:start + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                params = [model, dimensions or 0, *chunk]
+                rows = conn.execute(
+                    f"SELECT sha256, embedding FROM embeddings WHERE model = ? AND dimensions = ? AND sha256 IN ({placeholders})",
+                    params,
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = array("f", blob).tolist()
+                if rows:
+                    conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE model = ? AND dimensions = ? AND sha256 IN ({placeholders})",
+                        [now, *params],
+                    )
+    except sqlite3.Error as e:
+        _count("errors")
+        print(f"Error reading embedding cache: {e}")
+    _count("hits", len(found))
+    _count("misses", len(digests) - len(found))
+    return found
+
+
+def store_embeddings(model: str, dimensions, items):
+    """Cache (sha256, embedding) pairs, then evict down to the size bound if it was passed."""
+    try:
+        conn = _connect()
+        now = time.time()
+        added_bytes = added = 0
+        with conn:
+            for digest, vector in items:
+                blob = array("f", vector).tobytes()
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO embeddings (model, dimensions, sha256, embedding, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (model, dimensions or 0, digest, blob, now),
+                )
+                if cursor.rowcount:
+                    added += 1
+                    added_bytes += len(blob)
+            conn.execute("UPDATE meta SET value = value + ? WHERE key = 'bytes'", (added_bytes,))
+        _count("stores", added)
+        _evict(conn)
+    except sqlite3.Error as e:
+        _count("errors")
+        print(f"Error writing embedding cache: {e}")
+
+
+def _evict(conn):
+    total = conn.execute("SELECT value FROM meta WHERE key = 'bytes'").fetchone()[0]
+    if total <= EMBEDDING_CACHE_MAX_BYTES:
+        return
+    target = EMBEDDING_CACHE_MAX_BYTES * EMBEDDING_CACHE_EVICT_TO
+    with conn:
+        # Re-read inside the write transaction; another process may have evicted already
+        total = conn.execute("SELECT value FROM meta WHERE key = 'bytes'").fetchone()[0]
+        evicted = freed = 0
+        while total - freed > target:
+            rows = conn.execute(
+                "SELECT rowid, LENGTH(embedding) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            batch = []
+            for rowid, size in rows:
+                if total - freed <= target:
+                    break
+                batch.append((rowid,))
+                freed += size
+            conn.executemany("DELETE FROM embeddings WHERE rowid = ?", batch)
+            evicted += len(batch)
+        conn.execute("UPDATE meta SET value = value - ? WHERE key = 'bytes'", (freed,))
+    _count("evictions", evicted)
+
+
+def get_embedding_cache_stats():
+    with _lock:
+        counters = dict(_counters)
+    lookups = counters["hits"] + counters["misses"]
+    stats = dict(counters, hit_rate=counters["hits"] / lookups if lookups else 0.0, max_bytes=EMBEDDING_CACHE_MAX_BYTES)
+    try:
+        conn = _connect()
+        stats["entries"] = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        stats["bytes"] = conn.execute("SELECT value FROM meta WHERE key = 'bytes'").fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"Error reading embedding cache stats: {e}")
+    return stats
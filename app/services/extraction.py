@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Text extraction fanned out over a process pool: PDFs are split into page
+# ranges so one large PDF uses every core, and every file gets a time budget.
+# Page and file texts are collected in lists and joined once.
+
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+EXTRACT_FILE_TIMEOUT = float(os.getenv("EXTRACT_FILE_TIMEOUT", "300"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "20"))
+# The pool is started from a worker thread of a process that already runs
+# other threads (Mongo clients, executors); forking such a process can copy
+# held locks into the children, so workers come from a fork server instead.
+EXTRACT_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+@dataclass
+class ExtractionResult:
+    texts: Dict[str, str] = field(default_factory=dict)
+    # filename -> {"seconds": worker time, "wall_seconds": submit to done, "parts": tasks}
+    timings: Dict[str, dict] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+# Worker functions run in child processes, so they take paths rather than open files
+
+def _extract_pdf_pages(path: str, start: int, end: int) -> Tuple[str, float]:
+    from PyPDF2 import PdfReader
+    started = time.monotonic()
+    reader = PdfReader(path)
+    text = "".join(reader.pages[i].extract_text() or "" for i in range(start, end))
+    return text, time.monotonic() - started
+
+
+def _extract_file(filename: str, path: str) -> Tuple[Optional[str], float]:
+    from app.services.utils import extract_text_from_file
+    started = time.monotonic()
+    with open(path, "rb") as f:
+        text = extract_text_from_file(filename, f.read())
+    return text, time.monotonic() - started
+
+
+def _pdf_page_count(path: str) -> int:
+    from PyPDF2 import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def _submit(pool, filename: str, path: str):
+    if filename.lower().endswith(".pdf"):
+        pages = _pdf_page_count(path)
+        return [
+            pool.submit(_extract_pdf_pages, path, start, min(start + PDF_PAGES_PER_TASK, pages))
+            for start in range(0, pages, PDF_PAGES_PER_TASK)
+        ]
+    return [pool.submit(_extract_file, filename, path)]
+
+
+def extract_files(files: List[Tuple[str, str]], progress=None, workers: int = None, timeout: float = None) -> ExtractionResult:
+    """
+    Extract text from (filename, path) pairs in parallel. A file that fails,
+    is unsupported or exceeds `timeout` seconds lands in `errors` instead of
+    `texts`. progress(done, total) is called as files complete.
+    """
+    workers = workers or EXTRACT_WORKERS
+    timeout = timeout or EXTRACT_FILE_TIMEOUT
+    result = ExtractionResult()
+    if not files:
+        return result
+
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(EXTRACT_START_METHOD))
+    timed_out = False
+    try:
+        submitted = []
+        for filename, path in files:
+            try:
+                submitted.append((filename, time.monotonic(), _submit(pool, filename, path)))
+            except Exception as e:
+                result.errors[filename] = f"Could not read file: {e}"
+
+        for done, (filename, submitted_at, futures) in enumerate(submitted, start=1):
+            # Each file's budget starts once the files before it are collected
+            deadline = time.monotonic() + timeout
+            parts, seconds = [], 0.0
+            try:
+                for future in futures:
+                    text, part_seconds = future.result(timeout=max(deadline - time.monotonic(), 0))
+                    if text is None:
+                        raise ValueError("Unsupported file type")
+                    parts.append(text)
+                    seconds += part_seconds
+            except FutureTimeoutError:
+                timed_out = True
+                for future in futures:
+                    future.cancel()
+                result.errors[filename] = f"Extraction timed out after {timeout:g}s"
+            except Exception as e:
+                result.errors[filename] = str(e)
+            else:
+                result.texts[filename] = "".join(parts)
+                result.timings[filename] = {
+                    "seconds": round(seconds, 3),
+                    "wall_seconds": round(time.monotonic() - submitted_at, 3),
+                    "parts": len(futures),
+                }
+            if progress:
+                progress(done, len(files))
+    finally:
+        # shutdown() drops the pool's process table, so take it first
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=not timed_out, cancel_futures=True)
+        if timed_out:
+            # A page stuck in the parser never returns; do not let it hold a core
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+    return result
@@ -0,0 +1,165 @@
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import psutil
+
+# Background knowledge-base ingestion. Uploads and deletions enqueue a job
+# and return its id straight away; a worker pool runs the jobs, one at a time
+# per agent. Jobs queued in different API workers are serialized by the
+# agent's file lock (see app.services.knowledge_base.agent_lock).
+# Job state, progress, errors and timings are kept in `ingest_jobs` for the
+# status endpoint. Every job records the process that owns it (host, pid and
+# the pid's start time), since its queue only exists in that process's memory.
+
+INGEST_JOBS_COLLECTION = "ingest_jobs"
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+# (user_id, agent_id) -> jobs waiting behind the one currently running for that agent
+_pending = {}
+_lock = threading.Lock()
+
+OWNER = {"host": socket.gethostname(), "pid": os.getpid(), "started": psutil.Process().create_time()}
+
+
+class JobReporter:
+    """Handed to a job's function to record its progress and stage timings."""
+
+    def __init__(self, db, job_id: str):
+        self.db = db
+        self.job_id = job_id
+        self.timings = {}
+        self._stage = None
+        self._stage_started = None
+
+    def _set(self, fields):
+        self.db[INGEST_JOBS_COLLECTION].update_one({"_id": self.job_id}, {"$set": fields})
+
+    def _close_stage(self):
+        if self._stage:
+            self.timings[f"{self._stage}_seconds"] = round(time.monotonic() - self._stage_started, 3)
+
+    def stage(self, name: str, **progress):
+        """Start a named stage (e.g. extract, index); the previous one is timed."""
+        self._close_stage()
+        self._stage = name
+        self._stage_started = time.monotonic()
+        self._set({"stage": name, "timings": self.timings, **{f"progress.{k}": v for k, v in progress.items()}})
+
+    def progress(self, **progress):
+        self._set({f"progress.{k}": v for k, v in progress.items()})
+
+    def finish(self):
+        self._close_stage()
+        self._stage = None
+        return self.timings
+
+
+def submit_ingest_job(db, user_id: str, agent_id: str, kind: str, run, files=None) -> str:
+    """
+    Queue run(reporter) for the agent and return the job id. run's return
+    value is stored as the job's result.
+    """
+    job_id = str(uuid.uuid4())
+    db[INGEST_JOBS_COLLECTION].insert_one({
+        "_id": job_id,
+        "user_id": user_id,
+        "agent_id": agent_id,
+        "kind": kind,
+        "files": files or [],
+        "status": QUEUED,
+        "stage": None,
+        "progress": {},
+        "timings": {},
+        "error": None,
+        "owner": OWNER,
+        "created_at": datetime.utcnow(),
+    })
+    key = (user_id, agent_id)
+    with _lock:
+        queue = _pending.get(key)
+        start_worker = queue is None
+        if start_worker:
+            queue = _pending[key] = deque()
+        queue.append((job_id, run))
+    if start_worker:
+        _executor.submit(_drain, db, key)
+    return job_id
+
+
+def _drain(db, key):
+    # Runs the agent's jobs in submission order, then lets the worker go
+    while True:
+        with _lock:
+            queue = _pending[key]
+            if not queue:
+                del _pending[key]
+                return
+            job_id, run = queue.popleft()
+        _run_job(db, job_id, run)
+
+
+def _run_job(db, job_id, run):
+    jobs = db[INGEST_JOBS_COLLECTION]
+    started = time.monotonic()
+    jobs.update_one({"_id": job_id}, {"$set": {"status": RUNNING, "started_at": datetime.utcnow()}})
+    reporter = JobReporter(db, job_id)
+    try:
+        result = run(reporter)
+        status, error = SUCCEEDED, None
+    except Exception as e:
+        traceback.print_exc()
+        result, status, error = None, FAILED, str(e)
+    timings = reporter.finish()
+    timings["total_seconds"] = round(time.monotonic() - started, 3)
+    jobs.update_one({"_id": job_id}, {"$set": {
+        "status": status,
+        "stage": None,
+        "error": error,
+        "result": result,
+        "timings": timings,
+        "finished_at": datetime.utcnow(),
+    }})
+
+
+def get_ingest_job(db, user_id: str, agent_id: str, job_id: str):
+    return db[INGEST_JOBS_COLLECTION].find_one({"_id": job_id, "user_id": user_id, "agent_id": agent_id})
+
+
+def _owner_alive(owner) -> bool:
+    # A reused pid has a different start time
+    try:
+        return psutil.Process(owner["pid"]).create_time() == owner["started"]
+    except (psutil.NoSuchProcess, KeyError):
+        return False
+
+
+def fail_interrupted_jobs(db):
+    """
+    Mark queued and running jobs whose owning process on this host has exited
+    as failed. Jobs of other live workers, and of other hosts, are left alone.
+    Jobs from before owners were recorded count as interrupted.
+    """
+    jobs = db[INGEST_JOBS_COLLECTION]
+    active = {"status": {"$in": [QUEUED, RUNNING]}}
+    dead_owners = [
+        owner for owner in jobs.distinct("owner", dict(active, **{"owner.host": OWNER["host"]}))
+        if not _owner_alive(owner)
+    ]
+    query = dict(active, **{"$or": [{"owner": {"$exists": False}}, {"owner": {"$in": dead_owners}}]})
+    result = jobs.update_many(
+        query,
+        {"$set": {"status": FAILED, "error": "Interrupted by a server restart", "finished_at": datetime.utcnow()}},
+    )
+    return result.modified_count
@@ -0,0 +1,234 @@
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from llama_index.core import Document
+from app.services.utils import delete_directory
+from app.services.extraction import extract_files
+from app.services.llama_index_integration import load_or_create_index
+from app.services.agent_cache import invalidate_agent
+
+# Building an agent's knowledge base from its uploaded files. Runs inside an
+# ingestion job (see app.services.ingest_jobs), never on the event loop.
+#
+# The index is maintained incrementally. lamadir/manifest.json maps every
+# indexed file to its content hash, the id of its document in the index and
+# that document's node ids; a sync only embeds files whose hash is new and
+# removes the nodes of deleted or replaced files with delete_ref_doc.
+#
+# Each file is parsed once: its text is kept as a sidecar,
+# extracted/<sha256>.txt, which both the index and lamadir/raw_data.txt are
+# built from.
+#
+# Syncs of one agent hold an exclusive lock on uploads/<user>/<agent>/.ingest.lock
+# for their whole run, so they are serialized across every API worker on the
+# host, not only within the process whose queue they came from.
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".docx")
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+LOCK_FILE = ".ingest.lock"
+
+
+def is_supported_file(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() in SUPPORTED_EXTENSIONS
+
+
+def agent_paths(user_id: str, agent_id: str):
+    """(agent upload dir, uploaded files dir, index dir)"""
+    file_dir = f"uploads/{user_id}/{agent_id}"
+    return file_dir, os.path.join(file_dir, "files"), os.path.join(file_dir, "lamadir")
+
+
+def sidecar_dir(user_id: str, agent_id: str) -> str:
+    return os.path.join(agent_paths(user_id, agent_id)[0], "extracted")
+
+
+def sidecar_path(user_id: str, agent_id: str, sha256: str) -> str:
+    return os.path.join(sidecar_dir(user_id, agent_id), f"{sha256}.txt")
+
+
+def read_sidecar(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def write_sidecar(path: str, text: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def ensure_sidecars(user_id: str, agent_id: str, hashes, report):
+    """Extract, in the process pool, every file whose content has no sidecar yet."""
+    _, files_dir, _ = agent_paths(user_id, agent_id)
+    missing = [name for name, sha256 in sorted(hashes.items()) if not os.path.exists(sidecar_path(user_id, agent_id, sha256))]
+    report.progress(files_to_extract=len(missing), files_extracted=0)
+    if not missing:
+        return
+    extracted = extract_files(
+        [(filename, os.path.join(files_dir, filename)) for filename in missing],
+        progress=lambda done, total: report.progress(files_extracted=done),
+    )
+    for filename, text in extracted.texts.items():
+        write_sidecar(sidecar_path(user_id, agent_id, hashes[filename]), text)
+    report.progress(file_timings=extracted.timings)
+    if extracted.errors:
+        raise ValueError("; ".join(f"{name}: {error}" for name, error in sorted(extracted.errors.items())))
+
+
+def prune_sidecars(user_id: str, agent_id: str, hashes):
+    directory = sidecar_dir(user_id, agent_id)
+    if not os.path.isdir(directory):
+        return
+    keep = {f"{sha256}.txt" for sha256 in hashes.values()}
+    for name in os.listdir(directory):
+        if name not in keep:
+            os.remove(os.path.join(directory, name))
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(index_dir: str):
+    """The manifest's file map, or None when the index predates manifests (or is missing)."""
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest["files"]
+
+
+def save_manifest(index_dir: str, files):
+    with open(os.path.join(index_dir, MANIFEST_FILE), "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, f, indent=2, sort_keys=True)
+
+
+def plan_changes(manifest, hashes):
+    """Split files into (to add, to remove) from the manifest and the current content hashes."""
+    to_add = sorted(name for name, sha256 in hashes.items() if manifest.get(name, {}).get("sha256") != sha256)
+    to_remove = sorted(name for name in manifest if name not in hashes or name in to_add)
+    return to_add, to_remove
+
+
+@contextmanager
+def agent_lock(user_id: str, agent_id: str):
+    """Exclusive, cross-process lock on the agent's knowledge base; blocks until it is free."""
+    file_dir = agent_paths(user_id, agent_id)[0]
+    os.makedirs(file_dir, exist_ok=True)
+    with open(os.path.join(file_dir, LOCK_FILE), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def sync_knowledge_base(db, user_id: str, agent_id: str, report):
+    """
+    Bring the agent's index in line with its uploaded files, embedding only
+    what changed. Work happens on a copy of the index that is swapped in at
+    the end, so retrieval never sees a half-updated index.
+    """
+    report.stage("lock")
+    with agent_lock(user_id, agent_id):
+        return _sync_locked(db, user_id, agent_id, report)
+
+
+def _sync_locked(db, user_id: str, agent_id: str, report):
+    _, files_dir, agent_dir = agent_paths(user_id, agent_id)
+    # Holding the lock, any build or old copy left behind is from a run that died
+    for stale_dir in glob.glob(glob.escape(agent_dir) + ".building-*") + glob.glob(glob.escape(agent_dir) + ".old-*"):
+        delete_directory(stale_dir)
+    # Uploads still being streamed in sit under hidden .part names; leave them out
+    filenames = sorted(
+        name for name in os.listdir(files_dir) if is_supported_file(name) and not name.startswith(".")
+    ) if os.path.isdir(files_dir) else []
+
+    report.stage("hash", files_total=len(filenames))
+    hashes = {filename: file_sha256(os.path.join(files_dir, filename)) for filename in filenames}
+    manifest = load_manifest(agent_dir)
+    if manifest is None:
+        # No manifest (first upload, or an index built before manifests): start over
+        manifest = {}
+        build_from = None
+    else:
+        build_from = agent_dir
+    to_add, to_remove = plan_changes(manifest, hashes)
+    report.progress(files_added=len(to_add), files_removed=len(to_remove), files_unchanged=len(filenames) - len(to_add))
+
+    # Only files never seen before are parsed; everything after reads sidecars
+    report.stage("extract")
+    ensure_sidecars(user_id, agent_id, hashes, report)
+
+    if to_add or to_remove or build_from is None:
+        # A name of its own per run, so no other run can delete or swap in this build
+        run_suffix = uuid.uuid4().hex[:12]
+        build_dir = f"{agent_dir}.building-{run_suffix}"
+        try:
+            _build_index(user_id, agent_id, build_dir, build_from, manifest, hashes, filenames, to_add, to_remove, report)
+        except BaseException:
+            delete_directory(build_dir)
+            raise
+        # Two renames instead of delete-then-rename, so lamadir is only missing for an instant
+        old_dir = f"{agent_dir}.old-{run_suffix}"
+        if os.path.exists(agent_dir):
+            os.replace(agent_dir, old_dir)
+        os.replace(build_dir, agent_dir)
+        delete_directory(old_dir)
+
+    prune_sidecars(user_id, agent_id, hashes)
+
+    report.stage("save")
+    db.agents.update_one({"_id": agent_id, "user_id": user_id}, {"$set": {"knowledge_base": {"files": filenames}}})
+    invalidate_agent(agent_id)
+    return {"files": filenames, "added": to_add, "removed": [name for name in to_remove if name not in to_add]}
+
+
+def _build_index(user_id, agent_id, build_dir, build_from, manifest, hashes, filenames, to_add, to_remove, report):
+    """Apply the planned changes to a copy of the index in build_dir and persist it there."""
+    if build_from:
+        shutil.copytree(build_from, build_dir)
+    else:
+        os.makedirs(build_dir, exist_ok=True)
+    index = load_or_create_index(build_dir)
+
+    report.stage("remove")
+    for filename in to_remove:
+        index.delete_ref_doc(manifest.pop(filename)["ref_doc_id"], delete_from_docstore=True)
+
+    report.stage("embed", files_embedded=0)
+    for done, filename in enumerate(to_add, start=1):
+        text = read_sidecar(sidecar_path(user_id, agent_id, hashes[filename]))
+        # The content hash in the id keeps a replaced file's old and new nodes apart
+        ref_doc_id = f"{filename}:{hashes[filename]}"
+        index.insert(Document(text=text, id_=ref_doc_id, metadata={"filename": filename}))
+        ref_doc_info = index.docstore.get_ref_doc_info(ref_doc_id)
+        manifest[filename] = {
+            "sha256": hashes[filename],
+            "ref_doc_id": ref_doc_id,
+            "node_ids": list(ref_doc_info.node_ids) if ref_doc_info else [],
+        }
+        report.progress(files_embedded=done)
+
+    report.stage("persist")
+    index.storage_context.persist(build_dir)
+    save_manifest(build_dir, manifest)
+    with open(os.path.join(build_dir, "raw_data.txt"), "w", encoding="utf-8") as f:
+        for filename in filenames:
+            f.write(read_sidecar(sidecar_path(user_id, agent_id, hashes[filename])))
+            f.write("\n")
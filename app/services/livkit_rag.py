@@ -1,27 +1,172 @@
 import asyncio
+import json
 import pickle
 import uuid
+from functools import lru_cache
 import aiohttp
+import tiktoken
 from livekit.agents import tokenize
-from livekit.plugins import openai, rag
+from livekit.plugins import rag
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
 from tqdm import tqdm
 import os
+from app.services.embedding_cache import get_cached_embeddings, store_embeddings, text_sha256
 
 embeddings_dimension = 1536  # Set according to your model
+embeddings_model = "text-embedding-3-small"
+
+# Paragraphs are embedded in multi-input requests packed up to a token budget,
+# several requests in flight at once. Every finished batch is appended to a
+# checkpoint file in the output dir, so a build that fails partway picks up
+# where it stopped on the next run instead of paying for those batches again.
+# Paragraphs already in the shared embedding cache are never sent at all.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "50000"))
+EMBED_BATCH_MAX_INPUTS = int(os.getenv("EMBED_BATCH_MAX_INPUTS", "512"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_ATTEMPTS = int(os.getenv("EMBED_MAX_ATTEMPTS", "6"))
+CHECKPOINT_FILE = "embeddings_checkpoint.jsonl"
+
+
+class EmbeddingRequestError(Exception):
+    def __init__(self, status: int, detail: str):
+        super().__init__(f"Embedding request failed with {status}: {detail}")
+        self.status = status
+
+
+def _is_retryable(error: BaseException) -> bool:
+    if isinstance(error, EmbeddingRequestError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    return len(_encoding().encode(text, disallowed_special=()))
+
+
+def make_batches(texts, max_tokens: int = None, max_inputs: int = None):
+    """Group texts into lists whose token total stays within max_tokens (an oversized text goes alone)."""
+    max_tokens = max_tokens or EMBED_BATCH_TOKENS
+    max_inputs = max_inputs or EMBED_BATCH_MAX_INPUTS
+    batches, batch, batch_tokens = [], [], 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_inputs):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def _create_embeddings(inputs, http_session: aiohttp.ClientSession, base_url: str = None):
+    """One embeddings request for a list of inputs; returns the vectors in input order."""
+    async with http_session.post(
+        f"{(base_url or OPENAI_BASE_URL).rstrip('/')}/embeddings",
+        headers={"Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY', '')}"},
+        json={"model": embeddings_model, "input": inputs, "dimensions": embeddings_dimension},
+    ) as resp:
+        if resp.status != 200:
+            raise EmbeddingRequestError(resp.status, (await resp.text())[:500])
+        body = await resp.json()
+    return [item["embedding"] for item in sorted(body["data"], key=lambda item: item["index"])]
+
+
+def load_checkpoint(path: str):
+    """sha256(text) -> embedding for batches finished by an earlier, interrupted build."""
+    embeddings = {}
+    if not path or not os.path.exists(path):
+        return embeddings
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash; the batch is simply embedded again
+                continue
+            if entry.get("model") == embeddings_model and entry.get("dimensions") == embeddings_dimension:
+                embeddings.update(zip(entry["sha256"], entry["embeddings"]))
+    return embeddings
+
+
+def _append_checkpoint(path: str, texts, vectors):
+    with open(path, "a") as f:
+        f.write(json.dumps({
+            "model": embeddings_model,
+            "dimensions": embeddings_dimension,
+            "sha256": [text_sha256(text) for text in texts],
+            "embeddings": vectors,
+        }) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+async def embed_paragraphs(
+    paragraphs,
+    http_session: aiohttp.ClientSession,
+    checkpoint_path: str = None,
+    max_tokens: int = None,
+    max_inputs: int = None,
+    concurrency: int = None,
+    base_url: str = None,
+    show_progress: bool = True,
+):
+    """
+    Embed paragraphs in token-budgeted batches, `concurrency` requests at a
+    time, retrying rate limits and server errors with jittered backoff.
+    Returns sha256(text) -> embedding for every distinct paragraph.
+    """
+    embeddings = load_checkpoint(checkpoint_path)
+    pending, seen = [], set(embeddings)
+    for paragraph in paragraphs:
+        digest = text_sha256(paragraph)
+        if digest not in seen:
+            seen.add(digest)
+            pending.append(paragraph)
+    if pending:
+        embeddings.update(await asyncio.to_thread(
+            get_cached_embeddings, embeddings_model, embeddings_dimension, [text_sha256(text) for text in pending]
+        ))
+        pending = [text for text in pending if text_sha256(text) not in embeddings]
+
+    batches = make_batches(pending, max_tokens, max_inputs)
+    semaphore = asyncio.Semaphore(concurrency or EMBED_CONCURRENCY)
+    progress = tqdm(total=len(pending), disable=not show_progress)
+
+    async def run_batch(batch):
+        async with semaphore:
+            async for attempt in AsyncRetrying(
+                retry=retry_if_exception(_is_retryable),
+                wait=wait_random_exponential(multiplier=1, max=60),
+                stop=stop_after_attempt(EMBED_MAX_ATTEMPTS),
+                reraise=True,
+            ):
+                with attempt:
+                    vectors = await _create_embeddings(batch, http_session, base_url)
+        digests = [text_sha256(text) for text in batch]
+        if checkpoint_path:
+            _append_checkpoint(checkpoint_path, batch, vectors)
+        await asyncio.to_thread(store_embeddings, embeddings_model, embeddings_dimension, list(zip(digests, vectors)))
+        embeddings.update(zip(digests, vectors))
+        progress.update(len(batch))
+
+    try:
+        await asyncio.gather(*(run_batch(batch) for batch in batches))
+    finally:
+        progress.close()
+    return embeddings
 
-async def _create_embeddings(
-    input: str, http_session: aiohttp.ClientSession
-) -> openai.EmbeddingData:
-    results = await openai.create_embeddings(
-        input=[input],
-        model="text-embedding-3-small",
-        dimensions=embeddings_dimension,
-        http_session=http_session,
-    )
-    return results[0]
 
 async def process_files(raw_data_file: str, output_dir: str) -> None:
     raw_data = open(raw_data_file, "r").read()
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILE)
 
     async with aiohttp.ClientSession() as http_session:
         idx_builder = rag.annoy.IndexBuilder(f=embeddings_dimension, metric="angular")
@@ -31,10 +176,14 @@ async def process_files(raw_data_file: str, output_dir: str) -> None:
             p_uuid = uuid.uuid4()
             paragraphs_by_uuid[p_uuid] = p
 
-        for p_uuid, paragraph in tqdm(paragraphs_by_uuid.items()):
+        embeddings = await embed_paragraphs(
+            [paragraph for paragraph in paragraphs_by_uuid.values() if paragraph != ""],
+            http_session,
+            checkpoint_path=checkpoint_path,
+        )
+        for p_uuid, paragraph in paragraphs_by_uuid.items():
             if paragraph != "":
-                resp = await _create_embeddings(paragraph, http_session)
-                idx_builder.add_item(resp.embedding, p_uuid)
+                idx_builder.add_item(embeddings[text_sha256(paragraph)], p_uuid)
 
         idx_builder.build()
         idx_builder.save(os.path.join(output_dir, "vdb_data"))
@@ -42,3 +191,7 @@ async def process_files(raw_data_file: str, output_dir: str) -> None:
         # save data with pickle
         with open(os.path.join(output_dir, "my_data.pkl"), "wb") as f:
             pickle.dump(paragraphs_by_uuid, f)
+
+    # The index is complete; the next build starts from scratch
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
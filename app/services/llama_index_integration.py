@@ -1,38 +1,96 @@
+import asyncio
 from llama_index.core import (
     Document,
+    Settings,
     StorageContext,
     VectorStoreIndex,
     load_index_from_storage,
 )
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
 import os
 from PyPDF2 import PdfReader
 import docx
 from llama_index.core.node_parser import SimpleNodeParser
+from app.services.extraction import extract_files
+from app.services.embedding_cache import get_cached_embeddings, store_embeddings, text_sha256
 
-# Function to manually load documents from a directory
+
+# Embed model wrapper that serves document embeddings from the shared
+# embedding cache and only sends the misses to the wrapped model. Queries are
+# one-off, so they go straight through.
+class CachedEmbedding(BaseEmbedding):
+    _inner: BaseEmbedding = PrivateAttr()
+    _dimensions: int = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, **kwargs):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            callback_manager=inner.callback_manager,
+            **kwargs,
+        )
+        self._inner = inner
+        self._dimensions = getattr(inner, "dimensions", None) or 0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _get_query_embedding(self, query: str):
+        return self._inner._get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str):
+        return await self._inner._aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str):
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str):
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts):
+        digests = [text_sha256(text) for text in texts]
+        found = get_cached_embeddings(self.model_name, self._dimensions, digests)
+        missing = {digest: text for digest, text in zip(digests, texts) if digest not in found}
+        if missing:
+            vectors = self._inner._get_text_embeddings(list(missing.values()))
+            store_embeddings(self.model_name, self._dimensions, list(zip(missing, vectors)))
+            found.update(zip(missing, vectors))
+        return [found[digest] for digest in digests]
+
+    async def _aget_text_embeddings(self, texts):
+        digests = [text_sha256(text) for text in texts]
+        found = await asyncio.to_thread(get_cached_embeddings, self.model_name, self._dimensions, digests)
+        missing = {digest: text for digest, text in zip(digests, texts) if digest not in found}
+        if missing:
+            vectors = await self._inner._aget_text_embeddings(list(missing.values()))
+            await asyncio.to_thread(store_embeddings, self.model_name, self._dimensions, list(zip(missing, vectors)))
+            found.update(zip(missing, vectors))
+        return [found[digest] for digest in digests]
+
+
+def cached_embed_model():
+    embed_model = Settings.embed_model
+    return embed_model if isinstance(embed_model, CachedEmbedding) else CachedEmbedding(embed_model)
+
+
+# Function to manually load documents from a directory, extracting them in parallel
 def load_documents_from_directory(directory_path: str):
-    documents = []
-    for filename in os.listdir(directory_path):
-        file_path = os.path.join(directory_path, filename)
-        if filename.endswith(".txt"):
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-                documents.append(Document(text=content, metadata={"filename": filename}))
-        elif filename.endswith(".pdf"):
-            text = extract_text_from_pdf(file_path)
-            documents.append(Document(text=text, metadata={"filename": filename}))
-        elif filename.endswith(".docx"):
-            text = extract_text_from_docx(file_path)
-            documents.append(Document(text=text, metadata={"filename": filename}))
-    return documents
+    files = [
+        (filename, os.path.join(directory_path, filename))
+        for filename in sorted(os.listdir(directory_path))
+        if filename.endswith((".txt", ".pdf", ".docx"))
+    ]
+    result = extract_files(files)
+    for filename, error in result.errors.items():
+        print(f"Skipping {filename}: {error}")
+    return [Document(text=text, metadata={"filename": filename}) for filename, text in result.texts.items()]
 
 # Function to extract text from PDF
 def extract_text_from_pdf(pdf_path):
     reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() or ""
-    return text
+    return "".join(page.extract_text() or "" for page in reader.pages)
 
 # Function to extract text from DOCX
 def extract_text_from_docx(docx_path):
@@ -48,12 +106,20 @@ def process_files_with_llama_index(directory_path: str, output_dir: str):
     documents = load_documents_from_directory(directory_path)
 
     # Create a VectorStore index
-    index = VectorStoreIndex.from_documents(documents)
+    index = VectorStoreIndex.from_documents(documents, embed_model=cached_embed_model())
 
     # Save the index in the storage context
     index.storage_context.persist(output_dir)
 
 
+# Function to open a persisted index, or start an empty one when there is none yet
+def load_or_create_index(storage_dir: str):
+    if os.path.exists(os.path.join(storage_dir, "docstore.json")):
+        storage_context = StorageContext.from_defaults(persist_dir=storage_dir)
+        return load_index_from_storage(storage_context, embed_model=cached_embed_model())
+    return VectorStoreIndex([], embed_model=cached_embed_model())
+
+
 # Function to load and use an existing index
 def load_index_and_query(storage_dir: str, query: str, retrieval_len: int):
     """
@@ -0,0 +1,53 @@
+import json
+import os
+import zlib
+from datetime import datetime
+from bson import ObjectId
+
+# Rows are pulled from Mongo EXPORT_BATCH_SIZE at a time and written out in
+# chunks of roughly EXPORT_CHUNK_BYTES, so an export holds at most one batch
+# and one chunk in memory regardless of how many rows it streams.
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", str(64 * 1024)))
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def to_ndjson_line(document) -> bytes:
+    return (json.dumps(document, default=_json_default, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def wants_gzip(accept_encoding: str, gzip_param=None) -> bool:
+    """An explicit ?gzip= wins; otherwise follow the client's Accept-Encoding."""
+    if gzip_param is not None:
+        return gzip_param
+    return "gzip" in (accept_encoding or "").lower()
+
+
+def stream_ndjson(cursor, use_gzip: bool = False):
+    """Yield a Mongo cursor as newline-delimited JSON, optionally gzip-encoded."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+    buffer = bytearray()
+    try:
+        for document in cursor:
+            buffer += to_ndjson_line(document)
+            if len(buffer) >= EXPORT_CHUNK_BYTES:
+                chunk = bytes(buffer)
+                buffer.clear()
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+        chunk = bytes(buffer)
+        if compressor:
+            chunk = compressor.compress(chunk) + compressor.flush()
+        if chunk:
+            yield chunk
+    finally:
+        cursor.close()
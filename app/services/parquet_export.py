@@ -0,0 +1,233 @@
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+import pandas as pd
+from pymongo import ASCENDING, ReadPreference, UpdateOne
+
+# Incremental columnar export of the log collections for offline analysis.
+# Rows are written as Parquet files partitioned hive-style by date, user and
+# agent:
+#
+#   exports/<table>/date=YYYY-MM-DD/user_id=<user>/agent_id=<agent>/part-<run>-<n>.parquet
+#
+# Each collection keeps a watermark in `export_state` (the last exported
+# _id, or updated_at for chat logs, which are appended to in place), so a
+# run only reads what changed since the previous one. Reads go to a
+# secondary when the deployment has one.
+#
+# Chats are only exported once they have been idle for CHAT_EXPORT_IDLE_HOURS,
+# so a live conversation is written once rather than after every turn. Each
+# chat log records how many of its messages were exported (exported_messages),
+# and chat_messages rows, keyed by (chat_id, seq), are only written past that
+# point. A chat that resumes after being exported adds just its new messages
+# plus a fresh chat_logs row; readers keep the latest updated_at per chat_id.
+
+EXPORT_DIR = os.getenv("PARQUET_EXPORT_DIR", "./exports")
+EXPORT_STATE_COLLECTION = "export_state"
+EXPORT_ROWS_PER_FLUSH = int(os.getenv("PARQUET_EXPORT_ROWS_PER_FLUSH", "50000"))
+EXPORT_READ_BATCH_SIZE = 1000
+CHAT_EXPORT_IDLE_HOURS = float(os.getenv("CHAT_EXPORT_IDLE_HOURS", "24"))
+
+_export_lock = threading.Lock()
+
+
+def _call_log_rows(doc):
+    row = {k: v for k, v in doc.items() if k not in ("_id", "messages")}
+    row["_id"] = str(doc["_id"])
+    messages = [
+        {
+            "call_log_id": doc.get("call_log_id"),
+            "seq": seq,
+            "timestamp": message.get("timestamp"),
+            "speaker": message.get("speaker"),
+            "message": message.get("message"),
+            "tokens": message.get("tokens"),
+        }
+        for seq, message in enumerate(doc.get("messages") or [])
+    ]
+    return row, messages
+
+
+def _chat_log_rows(doc):
+    row = {k: v for k, v in doc.items() if k not in ("_id", "chat_data", "usage", "turns", "exported_messages")}
+    row["_id"] = str(doc["_id"])
+    chat_data = doc.get("chat_data") or []
+    already_exported = doc.get("exported_messages") or 0
+    messages = [
+        {"chat_id": doc.get("chat_id"), "seq": seq, "role": message.get("role"), "content": message.get("content")}
+        for seq, message in enumerate(chat_data)
+        if seq >= already_exported
+    ]
+    return row, messages
+
+
+def _mark_chat_messages_exported(db, docs):
+    # docs: (_id, number of messages exported so far) per chat log
+    if docs:
+        db["chat_logs"].bulk_write(
+            [UpdateOne({"_id": doc_id}, {"$set": {"exported_messages": count}}) for doc_id, count in docs],
+            ordered=False,
+        )
+
+
+def _call_message_rows(doc):
+    row = {k: v for k, v in doc.items() if k != "_id"}
+    row["_id"] = str(doc["_id"])
+    return row, []
+
+
+def _dynamic_data_rows(doc):
+    row = {"_id": str(doc["_id"]), "user_id": doc.get("user_id"), "agent_id": doc.get("agent_id")}
+    row["created_at"] = doc.get("created_at") or doc["_id"].generation_time.replace(tzinfo=None)
+    for key, value in (doc.get("data") or {}).items():
+        row[f"data.{key}"] = value
+    return row, []
+
+
+# collection -> (table, message table, partition date field, watermark field, row builder).
+# Call logs written before transcripts moved to call_messages still carry
+# their messages inline; those land in the same call_messages table.
+EXPORTS = {
+    "call_logs": ("call_logs", "call_messages", "start_time", "_id", _call_log_rows),
+    "call_messages": ("call_messages", None, "timestamp", "_id", _call_message_rows),
+    "chat_logs": ("chat_logs", "chat_messages", "created_at", "updated_at", _chat_log_rows),
+    "dynamic_data": ("dynamic_data", None, "created_at", "_id", _dynamic_data_rows),
+}
+
+# Collections whose documents keep changing: only documents whose watermark
+# is older than this are exported, and after_flush(db, docs) runs with
+# (_id, message count) of each exported document once its rows are on disk
+SETTLE_AFTER = {"chat_logs": timedelta(hours=CHAT_EXPORT_IDLE_HOURS)}
+AFTER_FLUSH = {"chat_logs": _mark_chat_messages_exported}
+
+
+def _partition_dir(table, date, user_id, agent_id):
+    day = date.strftime("%Y-%m-%d") if isinstance(date, datetime) else "unknown"
+    return os.path.join(EXPORT_DIR, table, f"date={day}", f"user_id={user_id or 'unknown'}", f"agent_id={agent_id or 'unknown'}")
+
+
+def _write_partitions(table, rows, part_name):
+    # rows: list of (partition key, row dict)
+    partitions = {}
+    for partition, row in rows:
+        partitions.setdefault(partition, []).append(row)
+    written = []
+    for (date, user_id, agent_id), partition_rows in partitions.items():
+        directory = _partition_dir(table, date, user_id, agent_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{part_name}.parquet")
+        # Mixed-type columns (e.g. free-form dynamic data) are stored as strings
+        frame = pd.DataFrame(partition_rows)
+        for column in frame.columns:
+            if frame[column].dtype == object:
+                frame[column] = frame[column].map(lambda v: v if v is None or isinstance(v, (str, datetime)) else str(v))
+        frame.to_parquet(path, index=False)
+        written.append(path)
+    return written
+
+
+def export_collection(db, collection_name: str, run_id: str):
+    """Export one collection from its watermark; returns the number of rows written."""
+    table, message_table, date_field, watermark_field, build_rows = EXPORTS[collection_name]
+    state = db[EXPORT_STATE_COLLECTION].find_one({"_id": collection_name}) or {}
+    watermark = state.get("watermark")
+
+    query = {watermark_field: {"$gt": watermark}} if watermark is not None else {watermark_field: {"$exists": True}}
+    if collection_name in SETTLE_AFTER:
+        query[watermark_field]["$lt"] = datetime.utcnow() - SETTLE_AFTER[collection_name]
+    after_flush = AFTER_FLUSH.get(collection_name)
+    collection = db[collection_name].with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+    cursor = collection.find(query).sort(watermark_field, ASCENDING).batch_size(EXPORT_READ_BATCH_SIZE)
+
+    exported = 0
+    flushes = 0
+    rows, message_rows, flushed_docs = [], [], []
+    last_value = None
+
+    def flush():
+        part_name = f"{run_id}-{flushes}"
+        _write_partitions(table, rows, part_name)
+        if message_table:
+            _write_partitions(message_table, message_rows, part_name)
+        if after_flush:
+            after_flush(db, flushed_docs)
+        # Advance only after the files are on disk; a crash re-exports at most one flush
+        db[EXPORT_STATE_COLLECTION].update_one(
+            {"_id": collection_name},
+            {"$set": {"watermark": last_value, "updated_at": datetime.utcnow(), "last_run_id": run_id}},
+            upsert=True,
+        )
+        rows.clear()
+        message_rows.clear()
+        flushed_docs.clear()
+
+    try:
+        for doc in cursor:
+            row, messages = build_rows(doc)
+            partition = (row.get(date_field), row.get("user_id"), row.get("agent_id"))
+            rows.append((partition, row))
+            message_rows.extend((partition, message) for message in messages)
+            if after_flush:
+                flushed_docs.append((doc["_id"], len(doc.get("chat_data") or [])))
+            last_value = doc[watermark_field]
+            exported += 1
+            if len(rows) >= EXPORT_ROWS_PER_FLUSH:
+                flush()
+                flushes += 1
+        if rows:
+            flush()
+    finally:
+        cursor.close()
+    return exported
+
+
+def run_parquet_export(db, collections=None):
+    """
+    Export every collection (or the given ones) incrementally. Returns the
+    rows written per collection, or None if another export is running.
+    """
+    if not _export_lock.acquire(blocking=False):
+        return None
+    try:
+        run_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        results = {}
+        for collection_name in collections or EXPORTS:
+            results[collection_name] = export_collection(db, collection_name, run_id)
+            print(f"Parquet export {run_id}: {collection_name} {results[collection_name]} rows")
+        return results
+    finally:
+        _export_lock.release()
+
+
+def export_running() -> bool:
+    return _export_lock.locked()
+
+
+def list_user_exports(user_id: str, table: str = None):
+    """Parquet files under any partition of this user, relative to EXPORT_DIR."""
+    files = []
+    tables = [table] if table else sorted(os.listdir(EXPORT_DIR)) if os.path.isdir(EXPORT_DIR) else []
+    user_partition = f"user_id={user_id}"
+    for table_name in tables:
+        table_dir = os.path.join(EXPORT_DIR, table_name)
+        if not os.path.isdir(table_dir):
+            continue
+        for date_dir in sorted(os.listdir(table_dir)):
+            user_dir = os.path.join(table_dir, date_dir, user_partition)
+            if not os.path.isdir(user_dir):
+                continue
+            for root, _, names in os.walk(user_dir):
+                for name in sorted(names):
+                    if name.endswith(".parquet"):
+                        files.append(os.path.relpath(os.path.join(root, name), EXPORT_DIR))
+    return files
+
+
+def resolve_export_path(relative_path: str):
+    """Absolute path of an export file, or None if it escapes EXPORT_DIR or does not exist."""
+    root = os.path.realpath(EXPORT_DIR)
+    path = os.path.realpath(os.path.join(root, relative_path))
+    if not path.startswith(root + os.sep) or not path.endswith(".parquet") or not os.path.isfile(path):
+        return None
+    return path
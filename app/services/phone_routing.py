@@ -0,0 +1,56 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from app.services.agent_cache import get_agent_by_phone
+
+# Characters that may appear in a human-entered phone number
+_PHONE_LIKE = re.compile(r'^[\d\s+\-().]+$')
+
+
+def normalize_e164(phone_number: Optional[str]) -> str:
+    """
+    Canonical form used for routing: '+' followed by digits only.
+    '00' international prefixes are folded into '+'. Values that are not
+    phone-like (e.g. web identities) are returned stripped but otherwise as-is.
+    """
+    if not phone_number:
+        return ""
+    value = phone_number.strip()
+    if not _PHONE_LIKE.match(value):
+        return value
+    digits = re.sub(r'\D', '', value)
+    if value.startswith('00'):
+        digits = digits[2:]
+    return f"+{digits}" if digits else ""
+
+
+@dataclass
+class AgentRoute:
+    user_id: str
+    agent: Dict[str, Any]
+    persist_dir: Optional[str]
+
+
+def get_persist_dir(user_id: str, agent_id: str) -> str:
+    return f"uploads/{user_id}/{agent_id}/lamadir"
+
+
+def resolve_phone_route(db, phone_number: str) -> Optional[AgentRoute]:
+    """
+    Resolve a dialed number to the agent serving it with one exact-match
+    lookup on the indexed `agents.phone_e164` field, through the agent cache.
+    """
+    phone_e164 = normalize_e164(phone_number)
+    if not phone_e164:
+        return None
+    agent = get_agent_by_phone(db, phone_e164)
+    if not agent:
+        return None
+    user_id = str(agent["user_id"])
+    persist_dir = None
+    if agent.get("rag_enabled", False):
+        persist_dir = get_persist_dir(user_id, agent["id"])
+        if not os.path.exists(persist_dir):
+            print(f"Persist directory not found: {persist_dir}")
+    return AgentRoute(user_id=user_id, agent=agent, persist_dir=persist_dir)
@@ -0,0 +1,197 @@
+import io
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from bson import json_util
+from pymongo import UpdateOne
+import zstandard
+from app.services.call_transcripts import CALL_MESSAGES_COLLECTION
+
+# Tiered retention. Call and chat logs older than a tenant's retention
+# period are moved out of Mongo into zstd-compressed JSONL segment files:
+#
+#   archive/<user_id>/<kind>/<YYYY-MM>/segment-<run>-<n>.jsonl.zst
+#
+# Every archived log keeps a small entry in `archived_logs` with its segment,
+# line number and the fields the usage rollups are built from, so rollups
+# survive a rebuild and a call can still be fetched by id. Entries are keyed
+# by the archived document's Mongo _id (source_id) as well as its log id: a
+# chat resumed under the same chat_id after archiving is a new document, and
+# archiving it again adds a second entry instead of replacing the first.
+#
+# Policy: users.retention_days if set, otherwise LOG_RETENTION_DAYS
+# (0 keeps logs forever).
+
+ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "./archive")
+ARCHIVED_LOGS_COLLECTION = "archived_logs"
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "0"))
+# Logs per segment file; also the unit of work between throttling pauses
+ARCHIVE_SEGMENT_SIZE = int(os.getenv("ARCHIVE_SEGMENT_SIZE", "2000"))
+ARCHIVE_BATCH_PAUSE = float(os.getenv("ARCHIVE_BATCH_PAUSE", "1.0"))
+ARCHIVE_ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "10"))
+
+# Fields kept on the archived_logs entry, enough to rebuild the usage rollups
+CALL_SUMMARY_FIELDS = (
+    "agent_id", "agent_name", "call_type", "start_time", "duration", "total_cost", "total_tokens_llm",
+    "total_tokens_stt", "total_tokens_tts", "llm_name", "call_end_reason",
+)
+CHAT_SUMMARY_FIELDS = ("agent_id", "agent_name", "created_at", "total_tokens", "cost_llm", "turns")
+
+# kind -> (collection, id field, age field, summary fields)
+ARCHIVE_KINDS = {
+    "call": ("call_logs", "call_log_id", "start_time", CALL_SUMMARY_FIELDS),
+    # Chats are aged by their last message so an active conversation is never archived
+    "chat": ("chat_logs", "chat_id", "updated_at", CHAT_SUMMARY_FIELDS),
+}
+
+
+def retention_cutoff(user, now=None):
+    """Logs older than the returned time are archived; None means keep forever."""
+    days = user.get("retention_days")
+    if days is None:
+        days = LOG_RETENTION_DAYS
+    if not days or days <= 0:
+        return None
+    return (now or datetime.utcnow()) - timedelta(days=days)
+
+
+def _write_segment(path, documents):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    compressor = zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL)
+    with open(tmp_path, "wb") as raw:
+        with compressor.stream_writer(raw) as writer:
+            for document in documents:
+                writer.write(json_util.dumps(document).encode("utf-8") + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+    # Only complete segments ever appear under their final name
+    os.replace(tmp_path, path)
+
+
+def read_segment_line(path, line_number: int):
+    """Decode one archived document from a segment by its line number."""
+    decompressor = zstandard.ZstdDecompressor()
+    with open(path, "rb") as raw:
+        with decompressor.stream_reader(raw) as reader:
+            for index, line in enumerate(io.TextIOWrapper(reader, encoding="utf-8")):
+                if index == line_number:
+                    return json_util.loads(line)
+    return None
+
+
+def _segment_path(user_id, kind, month, run_id, number):
+    return os.path.join(ARCHIVE_DIR, str(user_id), kind, month, f"segment-{run_id}-{number}.jsonl.zst")
+
+
+def archive_batch(db, user_id, kind, documents, run_id, number):
+    """
+    Write `documents` to segments, one per month they span, index them,
+    then delete the originals.
+    """
+    collection_name, id_field, age_field, summary_fields = ARCHIVE_KINDS[kind]
+
+    if kind == "call":
+        # Archived calls carry their transcript inline
+        call_ids = [doc[id_field] for doc in documents]
+        messages = {}
+        for message in db[CALL_MESSAGES_COLLECTION].find(
+            {"user_id": user_id, "call_log_id": {"$in": call_ids}}, {"_id": 0, "user_id": 0, "agent_id": 0}
+        ).sort("seq", 1):
+            messages.setdefault(message.pop("call_log_id"), []).append(message)
+        for doc in documents:
+            doc["messages"] = doc.get("messages") or messages.get(doc[id_field], [])
+
+    by_month = {}
+    for doc in documents:
+        by_month.setdefault(doc[age_field].strftime("%Y-%m"), []).append(doc)
+
+    entries = []
+    for month, month_documents in by_month.items():
+        # The month directory keeps same-numbered segments of one batch apart
+        path = _segment_path(user_id, kind, month, run_id, number)
+        _write_segment(path, month_documents)
+        for line_number, doc in enumerate(month_documents):
+            entry = {field: doc.get(field) for field in summary_fields}
+            entry.update({
+                "user_id": user_id,
+                "kind": kind,
+                "log_id": doc[id_field],
+                "source_id": doc["_id"],
+                "segment": os.path.relpath(path, ARCHIVE_DIR),
+                "line": line_number,
+                "archived_at": datetime.utcnow(),
+            })
+            # Keyed by source_id too, so re-archiving after a crash overwrites but a resumed chat adds
+            key = {"user_id": user_id, "kind": kind, "log_id": doc[id_field], "source_id": doc["_id"]}
+            entries.append(UpdateOne(key, {"$set": entry}, upsert=True))
+    db[ARCHIVED_LOGS_COLLECTION].bulk_write(entries, ordered=False)
+
+    db[collection_name].delete_many({"_id": {"$in": [doc["_id"] for doc in documents]}})
+    if kind == "call":
+        db[CALL_MESSAGES_COLLECTION].delete_many({"user_id": user_id, "call_log_id": {"$in": call_ids}})
+    return len(documents)
+
+
+def archive_user_logs(db, user, run_id, now=None):
+    cutoff = retention_cutoff(user, now)
+    if cutoff is None:
+        return {}
+    user_id = str(user["_id"])
+    archived = {}
+    for kind, (collection_name, _, age_field, _) in ARCHIVE_KINDS.items():
+        archived[kind] = 0
+        number = 0
+        while True:
+            # Oldest first, one segment's worth at a time; deleted rows drop out of the next query
+            documents = list(
+                db[collection_name].find({"user_id": user_id, age_field: {"$lt": cutoff}})
+                .sort(age_field, 1)
+                .limit(ARCHIVE_SEGMENT_SIZE)
+            )
+            if not documents:
+                break
+            archived[kind] += archive_batch(db, user_id, kind, documents, run_id, number)
+            number += 1
+            # Throttle so archiving never competes with live traffic for long
+            time.sleep(ARCHIVE_BATCH_PAUSE)
+    return archived
+
+
+def run_archival(db, user_id=None, now=None):
+    """Archive expired logs for every user (or one). Returns counts per user."""
+    run_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    query = {"_id": user_id} if user_id else {}
+    results = {}
+    for user in db.users.find(query, {"retention_days": 1}):
+        counts = archive_user_logs(db, user, run_id, now)
+        if any(counts.values()):
+            results[str(user["_id"])] = counts
+            print(f"Archived logs for user {user['_id']}: {json.dumps(counts)}")
+    return results
+
+
+def _read_entry(entry):
+    path = os.path.join(ARCHIVE_DIR, entry["segment"])
+    if not os.path.exists(path):
+        print(f"Archive segment missing: {path}")
+        return None
+    return read_segment_line(path, entry["line"])
+
+
+def find_archived_logs(db, user_id: str, kind: str, log_id: str):
+    """Every archived copy of a call or chat, oldest first (a resumed chat has several)."""
+    entries = db[ARCHIVED_LOGS_COLLECTION].find({"user_id": user_id, "kind": kind, "log_id": log_id}).sort("source_id", 1)
+    return [doc for doc in (_read_entry(entry) for entry in entries) if doc is not None]
+
+
+def find_archived_log(db, user_id: str, kind: str, log_id: str):
+    """Fetch the most recently created archived copy of a call or chat back from its segment, or None."""
+    entry = db[ARCHIVED_LOGS_COLLECTION].find_one(
+        {"user_id": user_id, "kind": kind, "log_id": log_id}, sort=[("source_id", -1)]
+    )
+    if not entry:
+        return None
+    return _read_entry(entry)
@@ -0,0 +1,65 @@
+import math
+from typing import Dict, Iterable, Optional
+
+# DDSketch-style quantile sketches. A value is counted in the logarithmic
+# bucket ceil(log_gamma(value)), so any quantile read back from the bucket
+# counts is within RELATIVE_ACCURACY of the true value. Sketches are plain
+# {bucket_key: count} maps: they are $inc'd into the usage rollups and two
+# sketches merge by adding their counts.
+#
+# Changing RELATIVE_ACCURACY changes the bucket keys; rebuild the rollups after.
+
+RELATIVE_ACCURACY = 0.02
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+# Zero and negative values (e.g. a free call) share one bucket
+ZERO_KEY = "z"
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def sketch_key(value: float) -> str:
+    if value is None or value <= 0:
+        return ZERO_KEY
+    return str(math.ceil(math.log(value) / _LOG_GAMMA))
+
+
+def _bucket_value(key: str) -> float:
+    if key == ZERO_KEY:
+        return 0.0
+    # Midpoint of (gamma^(i-1), gamma^i] that keeps the relative error bound
+    return 2 * _GAMMA ** int(key) / (_GAMMA + 1)
+
+
+def merge_sketches(sketches: Iterable[Dict[str, int]]) -> Dict[str, int]:
+    merged = {}
+    for sketch in sketches:
+        for key, count in (sketch or {}).items():
+            merged[key] = merged.get(key, 0) + count
+    return merged
+
+
+def sketch_count(sketch: Dict[str, int]) -> int:
+    return sum(sketch.values())
+
+
+def sketch_quantiles(sketch: Dict[str, int], quantiles: Iterable[float] = DEFAULT_QUANTILES) -> Dict[str, Optional[float]]:
+    """Read quantiles from bucket counts, e.g. {"p50": 31.2, "p99": 410.0}."""
+    total = sketch_count(sketch)
+    keys = sorted((key for key, count in sketch.items() if count > 0),
+                  key=lambda k: -math.inf if k == ZERO_KEY else int(k))
+    result = {}
+    for q in quantiles:
+        label = f"p{q * 100:g}"
+        if total == 0:
+            result[label] = None
+            continue
+        rank = q * (total - 1)
+        seen = 0
+        for key in keys:
+            seen += sketch[key]
+            if seen > rank:
+                result[label] = _bucket_value(key)
+                break
+    return result
@@ -0,0 +1,129 @@
+import html
+import re
+from app.services.call_transcripts import CALL_MESSAGES_COLLECTION
+
+# Full-text search over call transcripts (one call_messages document per
+# message) and chat logs (one document per chat). Both collections carry a
+# compound text index prefixed by user_id, so every search is confined to
+# one tenant's slice of the index.
+
+SNIPPET_RADIUS = 80
+MAX_SEARCH_OFFSET = 1000
+SOURCES = ("all", "calls", "chats")
+
+# Call transcripts say USER/AGENT, chat messages user/assistant
+_CHAT_ROLES = {"USER": "user", "AGENT": "assistant"}
+
+
+def search_terms(query: str):
+    return [term.lower() for term in re.findall(r"\w+", query)]
+
+
+def highlight(text: str, terms, radius: int = SNIPPET_RADIUS):
+    """
+    HTML-escaped excerpt of `text` around the first matching term, with
+    every term match wrapped in <em>. Matching is by word prefix, which
+    approximates the text index's stemming. Returns None when no term occurs
+    in the text.
+    """
+    if not text or not terms:
+        return None
+    pattern = re.compile(r"\b(" + "|".join(re.escape(term) for term in terms) + r")\w*", re.IGNORECASE)
+    first = pattern.search(text)
+    if not first:
+        return None
+    start = max(first.start() - radius, 0)
+    end = min(first.end() + radius, len(text))
+    # Transcript text is user-controlled: escape everything except our own tags
+    window = text[start:end]
+    parts, position = [], 0
+    for match in pattern.finditer(window):
+        parts.append(html.escape(window[position:match.start()]))
+        parts.append(f"<em>{html.escape(match.group(0))}</em>")
+        position = match.end()
+    parts.append(html.escape(window[position:]))
+    excerpt = "".join(parts)
+    return ("…" if start > 0 else "") + excerpt + ("…" if end < len(text) else "")
+
+
+def _search_calls(db, user_id, query, terms, agent_id, speaker, start, end, fetch):
+    match = {"user_id": user_id, "$text": {"$search": query}}
+    if agent_id:
+        match["agent_id"] = agent_id
+    if speaker:
+        match["speaker"] = speaker.upper()
+    if start or end:
+        match["timestamp"] = {k: v for k, v in (("$gte", start), ("$lt", end)) if v}
+    projection = {"score": {"$meta": "textScore"}, "user_id": 1, "agent_id": 1, "call_log_id": 1, "seq": 1, "speaker": 1, "timestamp": 1, "message": 1}
+    cursor = db[CALL_MESSAGES_COLLECTION].find(match, projection).sort([("score", {"$meta": "textScore"})]).limit(fetch)
+    results = []
+    for doc in cursor:
+        results.append({
+            "source": "call",
+            "call_log_id": doc.get("call_log_id"),
+            "agent_id": doc.get("agent_id"),
+            "seq": doc.get("seq"),
+            "speaker": doc.get("speaker"),
+            "timestamp": doc.get("timestamp"),
+            "score": doc["score"],
+            "snippet": highlight(doc.get("message"), terms) or html.escape((doc.get("message") or "")[:2 * SNIPPET_RADIUS]),
+        })
+    return results
+
+
+def _search_chats(db, user_id, query, terms, agent_id, speaker, start, end, fetch):
+    match = {"user_id": user_id, "$text": {"$search": query}}
+    if agent_id:
+        match["agent_id"] = agent_id
+    if start or end:
+        match["created_at"] = {k: v for k, v in (("$gte", start), ("$lt", end)) if v}
+    role = _CHAT_ROLES.get(speaker.upper(), speaker.lower()) if speaker else None
+    projection = {"score": {"$meta": "textScore"}, "chat_id": 1, "agent_id": 1, "created_at": 1, "chat_data": 1}
+    cursor = db["chat_logs"].find(match, projection).sort([("score", {"$meta": "textScore"})]).limit(fetch)
+    results = []
+    for doc in cursor:
+        # The index matches whole chats; report the messages that contain a term
+        for seq, message in enumerate(doc.get("chat_data") or []):
+            if role and message.get("role") != role:
+                continue
+            snippet = highlight(message.get("content"), terms)
+            if snippet:
+                results.append({
+                    "source": "chat",
+                    "chat_id": doc.get("chat_id"),
+                    "agent_id": doc.get("agent_id"),
+                    "seq": seq,
+                    "speaker": message.get("role"),
+                    "timestamp": doc.get("created_at"),
+                    "score": doc["score"],
+                    "snippet": snippet,
+                })
+    return results
+
+
+def search_transcripts(db, user_id: str, query: str, agent_id=None, speaker=None, start=None, end=None,
+                       source: str = "all", offset: int = 0, limit: int = 20):
+    """
+    Messages matching `query`, best text score first. Pages are addressed by
+    offset (capped at MAX_SEARCH_OFFSET); each source is asked for
+    offset + limit hits and the merged list is sliced.
+    """
+    if source not in SOURCES:
+        raise ValueError(f"source must be one of {', '.join(SOURCES)}")
+    if offset > MAX_SEARCH_OFFSET:
+        raise ValueError(f"offset must be at most {MAX_SEARCH_OFFSET}")
+    terms = search_terms(query)
+    if not terms:
+        raise ValueError("Query has no searchable terms")
+
+    fetch = offset + limit + 1
+    results = []
+    if source in ("all", "calls"):
+        results += _search_calls(db, user_id, query, terms, agent_id, speaker, start, end, fetch)
+    if source in ("all", "chats"):
+        results += _search_chats(db, user_id, query, terms, agent_id, speaker, start, end, fetch)
+    results.sort(key=lambda result: result["score"], reverse=True)
+
+    page = results[offset:offset + limit]
+    next_offset = offset + limit if len(results) > offset + limit else None
+    return {"query": query, "items": page, "offset": offset, "limit": limit, "next_offset": next_offset}
@@ -0,0 +1,112 @@
+import csv
+import hashlib
+import io
+import os
+import re
+import uuid
+from typing import List
+from aiofile import async_open
+from fastapi import HTTPException, UploadFile
+
+# Uploaded files are copied to disk in fixed-size chunks with async file I/O,
+# hashing as they go, so an upload holds one chunk in memory whatever its
+# size. Files land under a temporary name and are only renamed into place
+# once every file of the request is within the size limits.
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(50 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(200 * 1024 * 1024)))
+MAX_CSV_BYTES = int(os.getenv("MAX_CSV_BYTES", str(20 * 1024 * 1024)))
+# Room for multipart boundaries, part headers and form fields around the file bytes
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Upload routes and the largest body each accepts
+_UPLOAD_ROUTES = (
+    (re.compile(r"/users/[^/]+/agents/[^/]+/upload/?"), MAX_UPLOAD_REQUEST_BYTES),
+    (re.compile(r"/campaigns/[^/]+/import_csv/?"), MAX_CSV_BYTES),
+)
+
+
+def _too_large(detail: str):
+    return HTTPException(status_code=413, detail=detail)
+
+
+def request_body_limit(path: str):
+    """
+    Largest request body accepted for an upload route, or None for any other
+    route. Checked against Content-Length before the body is read, since
+    Starlette spools the whole multipart body before the handler runs.
+    """
+    for pattern, limit in _UPLOAD_ROUTES:
+        if pattern.fullmatch(path):
+            return limit + MULTIPART_OVERHEAD_BYTES
+    return None
+
+
+async def stream_upload_to_file(upload: UploadFile, path: str, max_bytes: int):
+    """Copy an upload to `path` chunk by chunk. Returns (size, sha256); raises 413 past max_bytes."""
+    digest = hashlib.sha256()
+    size = 0
+    async with async_open(path, "wb") as out:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large(f"{upload.filename} is larger than {max_bytes} bytes")
+            digest.update(chunk)
+            await out.write(chunk)
+    return size, digest.hexdigest()
+
+
+async def save_uploads(files: List[UploadFile], directory: str):
+    """
+    Save every upload into `directory` under its own filename, enforcing the
+    per-file and per-request limits. Nothing is left behind on failure.
+    """
+    os.makedirs(directory, exist_ok=True)
+    staged = []
+    saved = []
+    total = 0
+    try:
+        for upload in files:
+            filename = os.path.basename(upload.filename)
+            tmp_path = os.path.join(directory, f".{filename}.{uuid.uuid4().hex}.part")
+            staged.append(tmp_path)
+            remaining = MAX_UPLOAD_REQUEST_BYTES - total
+            size, sha256 = await stream_upload_to_file(upload, tmp_path, min(MAX_UPLOAD_FILE_BYTES, remaining))
+            total += size
+            saved.append({"filename": filename, "size": size, "sha256": sha256, "tmp_path": tmp_path})
+    except BaseException:
+        for tmp_path in staged:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+
+    for entry in saved:
+        os.replace(entry.pop("tmp_path"), os.path.join(directory, entry["filename"]))
+    return saved
+
+
+def read_csv_phone_numbers(upload: UploadFile, max_bytes: int = MAX_CSV_BYTES):
+    """
+    Collect the phone_number column of an uploaded CSV, reading the spooled
+    upload line by line instead of decoding it whole. Blocking; run it in a thread.
+    """
+    upload.file.seek(0, os.SEEK_END)
+    if upload.file.tell() > max_bytes:
+        raise _too_large(f"{upload.filename} is larger than {max_bytes} bytes")
+    upload.file.seek(0)
+
+    text = io.TextIOWrapper(upload.file, encoding="utf-8", newline="")
+    try:
+        phone_numbers = []
+        for row in csv.DictReader(text):
+            phone_number = row.get('phone_number')
+            if phone_number:
+                phone_numbers.append(phone_number.strip())
+        return phone_numbers
+    finally:
+        # Leave the underlying file for the framework to close
+        text.detach()
@@ -0,0 +1,224 @@
+from datetime import datetime
+from itertools import chain
+from pymongo import UpdateOne
+from app.services.sketches import sketch_key
+from app.services.retention import ARCHIVED_LOGS_COLLECTION
+
+# Pre-aggregated usage: one document per (user, agent, channel, granularity,
+# bucket). Writers $inc the hourly and daily bucket of every call and chat as
+# it is logged, so the dashboard reads O(buckets) documents instead of
+# rescanning call_logs and chat_logs. Each bucket also carries quantile
+# sketches (see app.services.sketches): duration, tokens and cost per call,
+# and chat_turn_tokens and chat_turn_cost per chat turn. Chats are sketched
+# per turn because a chat is never known to be finished, and they are kept
+# apart from the per-call sketches so the two units never mix.
+
+ROLLUPS_COLLECTION = "usage_rollups"
+STATE_COLLECTION = "usage_state"
+ROLLUP_STATE_ID = "usage_rollups"
+
+GRANULARITIES = ("hour", "day")
+
+# Chats have no audio; their duration is estimated from tokens (~100 tokens a minute)
+CHAT_TOKENS_PER_MINUTE = 100
+CHAT_CHANNEL = "chat"
+CHAT_PROVIDER = "LLM"
+
+REBUILD_BATCH_SIZE = 1000
+# Float noise left when summing per-turn costs back to a chat's cost_llm
+LEGACY_COST_EPSILON = 1e-9
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def escape_key(key) -> str:
+    # Provider names and end reasons become field names inside the bucket
+    # document, where '.' and a leading '$' are not allowed.
+    key = str(key).replace(".", "．")
+    return "＄" + key[1:] if key.startswith("$") else key
+
+
+def unescape_key(key: str) -> str:
+    return key.replace("．", ".").replace("＄", "$")
+
+
+def call_usage(call_log):
+    """Rollup increments for one call log document."""
+    duration = call_log.get("duration") or 0
+    cost = call_log.get("total_cost") or 0
+    tokens = sum(call_log.get(field) or 0 for field in ("total_tokens_llm", "total_tokens_stt", "total_tokens_tts"))
+    return {
+        "channel": call_log.get("call_type") or "call",
+        "timestamp": call_log["start_time"],
+        "inc": {
+            "conversations": 1,
+            "duration": duration,
+            "minutes": duration / 60,
+            "tokens_llm": call_log.get("total_tokens_llm") or 0,
+            "tokens_stt": call_log.get("total_tokens_stt") or 0,
+            "tokens_tts": call_log.get("total_tokens_tts") or 0,
+            "cost": cost,
+            f"cost_by_provider.{escape_key(call_log.get('llm_name') or 'Unknown')}": cost,
+            f"end_reasons.{escape_key(call_log.get('call_end_reason') or 'Completed')}": 1,
+            f"sketches.duration.{sketch_key(duration)}": 1,
+            f"sketches.tokens.{sketch_key(tokens)}": 1,
+            f"sketches.cost.{sketch_key(cost)}": 1,
+        },
+    }
+
+
+def chat_usage(timestamp: datetime, tokens, cost, new_conversation: bool = True):
+    """
+    Rollup increments for a chat turn. A new chat counts as a conversation;
+    follow-up turns only add their tokens and cost to the bucket they happen in.
+    """
+    tokens = tokens or 0
+    cost = cost or 0
+    return {
+        "channel": CHAT_CHANNEL,
+        "timestamp": timestamp,
+        "inc": {
+            "conversations": 1 if new_conversation else 0,
+            "minutes": tokens / CHAT_TOKENS_PER_MINUTE,
+            "tokens_llm": tokens,
+            "cost": cost,
+            f"cost_by_provider.{CHAT_PROVIDER}": cost,
+            f"sketches.chat_turn_tokens.{sketch_key(tokens)}": 1,
+            f"sketches.chat_turn_cost.{sketch_key(cost)}": 1,
+        },
+    }
+
+
+def chat_turn(timestamp: datetime, tokens, cost):
+    """Per-turn usage kept on the chat log, so a rebuild replays chats turn by turn."""
+    return {"timestamp": timestamp, "tokens": tokens or 0, "cost": cost or 0}
+
+
+def chat_log_usages(chat_log):
+    """Rollup increments for every turn of a stored chat log."""
+    turns = list(chat_log.get("turns") or [])
+    # Usage from before turns were recorded (the whole chat, for a chat that
+    # never resumed) is replayed as one turn at created_at
+    legacy_tokens = (chat_log.get("total_tokens") or 0) - sum(turn.get("tokens") or 0 for turn in turns)
+    legacy_cost = (chat_log.get("cost_llm") or 0) - sum(turn.get("cost") or 0 for turn in turns)
+    if not turns or legacy_tokens > 0 or legacy_cost > LEGACY_COST_EPSILON:
+        turns.insert(0, chat_turn(chat_log["created_at"], max(legacy_tokens, 0), max(legacy_cost, 0)))
+    return [
+        chat_usage(turn["timestamp"], turn.get("tokens"), turn.get("cost"), new_conversation=(i == 0))
+        for i, turn in enumerate(turns)
+    ]
+
+
+def _bucket_updates(user_id, agent_id, agent_name, usage):
+    updates = []
+    for granularity in GRANULARITIES:
+        key = {
+            "user_id": user_id,
+            "granularity": granularity,
+            "bucket_start": bucket_start(usage["timestamp"], granularity),
+            "agent_id": agent_id,
+            "channel": usage["channel"],
+        }
+        update = {"$inc": usage["inc"]}
+        if agent_name:
+            update["$set"] = {"agent_name": agent_name}
+        updates.append(UpdateOne(key, update, upsert=True))
+    return updates
+
+
+def record_usage(db, user_id, agent_id, agent_name, usage):
+    """Add one call or chat turn to its hourly and daily buckets."""
+    if not user_id or not usage.get("timestamp"):
+        return
+    try:
+        db[ROLLUPS_COLLECTION].bulk_write(_bucket_updates(user_id, agent_id, agent_name, usage), ordered=False)
+        bump_usage_version(db, user_id)
+    except Exception as e:
+        # The log itself is already stored; a rebuild repairs the rollups
+        print(f"Error updating usage rollups for user {user_id}: {e}")
+
+
+def _version_id(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def bump_usage_version(db, user_id):
+    """Mark the user's usage as changed so cached dashboards get recomputed."""
+    db[STATE_COLLECTION].update_one({"_id": _version_id(user_id)}, {"$inc": {"version": 1}}, upsert=True)
+
+
+def get_usage_version(db, user_id) -> int:
+    state = db[STATE_COLLECTION].find_one({"_id": _version_id(user_id)}, {"version": 1})
+    return state["version"] if state else 0
+
+
+def record_call(db, call_log):
+    record_usage(db, call_log.get("user_id"), call_log.get("agent_id"), call_log.get("agent_name"), call_usage(call_log))
+
+
+def rollups_ready(db) -> bool:
+    """Rollups are only read once a rebuild has backfilled the history."""
+    return db[STATE_COLLECTION].find_one({"_id": ROLLUP_STATE_ID}, {"_id": 1}) is not None
+
+
+def rebuild_usage_rollups(db, user_id=None):
+    """
+    Recompute the rollups from call_logs and chat_logs (plus the archived
+    ones), for one user or for everyone. Run it while the log processor is stopped: live $inc writes
+    that land during the rebuild are dropped along with the old buckets.
+    """
+    query = {"user_id": user_id} if user_id else {}
+    db[ROLLUPS_COLLECTION].delete_many(query)
+
+    written = {"call_logs": 0, "chat_logs": 0}
+    batch = []
+
+    def flush():
+        if batch:
+            db[ROLLUPS_COLLECTION].bulk_write(batch, ordered=False)
+            batch.clear()
+
+    call_projection = {
+        "_id": 0, "user_id": 1, "agent_id": 1, "agent_name": 1, "call_type": 1, "start_time": 1,
+        "duration": 1, "total_cost": 1, "total_tokens_llm": 1, "total_tokens_stt": 1,
+        "total_tokens_tts": 1, "llm_name": 1, "call_end_reason": 1,
+    }
+    # Logs moved to cold archive segments keep their rollup fields in archived_logs
+    archived_calls = db[ARCHIVED_LOGS_COLLECTION].find(dict(query, kind="call"), call_projection)
+    for call_log in chain(db["call_logs"].find(query, call_projection).batch_size(REBUILD_BATCH_SIZE), archived_calls):
+        if not call_log.get("user_id") or not call_log.get("start_time"):
+            continue
+        batch.extend(_bucket_updates(call_log["user_id"], call_log.get("agent_id"), call_log.get("agent_name"), call_usage(call_log)))
+        written["call_logs"] += 1
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            flush()
+
+    chat_projection = {
+        "_id": 0, "user_id": 1, "agent_id": 1, "agent_name": 1, "created_at": 1, "total_tokens": 1,
+        "cost_llm": 1, "turns": 1,
+    }
+    archived_chats = db[ARCHIVED_LOGS_COLLECTION].find(dict(query, kind="chat"), chat_projection)
+    for chat_log in chain(db["chat_logs"].find(query, chat_projection).batch_size(REBUILD_BATCH_SIZE), archived_chats):
+        if not chat_log.get("user_id") or not chat_log.get("created_at"):
+            continue
+        for usage in chat_log_usages(chat_log):
+            batch.extend(_bucket_updates(chat_log["user_id"], chat_log.get("agent_id"), chat_log.get("agent_name"), usage))
+        written["chat_logs"] += 1
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            flush()
+    flush()
+
+    if user_id:
+        bump_usage_version(db, user_id)
+    else:
+        db[STATE_COLLECTION].update_many({"_id": {"$regex": "^user:"}}, {"$inc": {"version": 1}})
+        db[STATE_COLLECTION].update_one(
+            {"_id": ROLLUP_STATE_ID},
+            {"$set": {"built_at": datetime.utcnow()}},
+            upsert=True,
+        )
+    return written
@@ -1,7 +1,6 @@
 import os
 from typing import Optional, List
 import asyncio
-from app.services.livkit_rag import process_files
 
 def extract_text_from_file(filename: str, content: bytes) -> Optional[str]:
     _, ext = os.path.splitext(filename)
@@ -13,10 +12,8 @@ def extract_text_from_file(filename: str, content: bytes) -> Optional[str]:
         from io import BytesIO
         from PyPDF2 import PdfReader
         reader = PdfReader(BytesIO(content))
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text()
-        return text
+        # Join once; repeated += copies the whole text for every page
+        return "".join(page.extract_text() or "" for page in reader.pages)
     elif ext == ".docx":
         # Implement DOCX text extraction
         from io import BytesIO
@@ -34,19 +31,22 @@ def delete_directory(path: str):
 
 async def re_embed_files(agent_dir: str, filenames: List[str]):
     files_dir = os.path.join(agent_dir, "files")
-    combined_text = ""
+    texts = []
     for filename in filenames:
         file_path = os.path.join(files_dir, filename)
         with open(file_path, "rb") as f:
             content = f.read()
             text = extract_text_from_file(filename, content)
             if text:
-                combined_text += text + "\n"
+                texts.append(text + "\n")
+    combined_text = "".join(texts)
 
     # Save raw data
     raw_data_file = os.path.join(agent_dir, "raw_data.txt")
     with open(raw_data_file, "w") as f:
         f.write(combined_text)
 
-    # Re-process the files using Livkit code
+    # Re-process the files using Livkit code; imported here so extraction
+    # workers, which only need extract_text_from_file, skip the LiveKit stack
+    from app.services.livkit_rag import process_files
     await process_files(raw_data_file, agent_dir)
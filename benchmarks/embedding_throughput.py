@@ -0,0 +1,93 @@
+"""
+Embedding throughput of the LiveKit RAG builder against a local stub server.
+
+The stub speaks the /embeddings API with a fixed per-request latency plus a
+small per-input cost, so the numbers show what batching and concurrency save
+in round-trips rather than what a real provider charges.
+
+    python -m benchmarks.embedding_throughput --paragraphs 5000 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import aiohttp
+from aiohttp import web
+
+# Keep benchmark vectors out of the real embedding cache
+os.environ.setdefault("EMBEDDING_CACHE_PATH", os.path.join(tempfile.mkdtemp(), "embedding_cache.sqlite3"))
+
+from app.services import livkit_rag  # noqa: E402
+
+
+def stub_app(latency: float, per_input: float, fail_rate: float):
+    async def embeddings(request):
+        body = await request.json()
+        inputs = body["input"]
+        await asyncio.sleep(latency + per_input * len(inputs))
+        if random.random() < fail_rate:
+            return web.json_response({"error": "rate limited"}, status=429)
+        dimensions = body.get("dimensions", livkit_rag.embeddings_dimension)
+        return web.json_response({
+            "data": [
+                {"index": i, "embedding": [random.random() for _ in range(dimensions)]}
+                for i in range(len(inputs))
+            ],
+        })
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/v1/embeddings", embeddings)
+    return app
+
+
+def make_paragraphs(count: int, prefix: str):
+    # A distinct prefix per scenario, so no scenario is served from the cache
+    words = "the call agent customer order refund invoice product support schedule".split()
+    return [f"{prefix} {i} " + " ".join(random.choice(words) for _ in range(random.randint(20, 120))) for i in range(count)]
+
+
+async def run(args):
+    runner = web.AppRunner(stub_app(args.latency, args.per_input, args.fail_rate))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    base_url = f"http://127.0.0.1:{args.port}/v1"
+
+    scenarios = [
+        ("sequential, 1 input per request", dict(max_inputs=1, concurrency=1)),
+        ("batched, concurrency 1", dict(max_tokens=args.batch_tokens, concurrency=1)),
+        (f"batched, concurrency {args.concurrency}", dict(max_tokens=args.batch_tokens, concurrency=args.concurrency)),
+    ]
+    try:
+        async with aiohttp.ClientSession() as http_session:
+            for name, options in scenarios:
+                if options.get("max_inputs") == 1 and args.skip_sequential:
+                    continue
+                paragraphs = make_paragraphs(args.paragraphs, name)
+                started = time.perf_counter()
+                embeddings = await livkit_rag.embed_paragraphs(
+                    paragraphs, http_session, base_url=base_url, show_progress=False, **options
+                )
+                elapsed = time.perf_counter() - started
+                print(f"{name:<36} {len(embeddings):>6} paragraphs  {elapsed:8.2f}s  {len(embeddings) / elapsed:10.1f}/s")
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding throughput against a stub server")
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per request")
+    parser.add_argument("--per-input", type=float, default=0.0005, help="Extra seconds per input")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--batch-tokens", type=int, default=livkit_rag.EMBED_BATCH_TOKENS)
+    parser.add_argument("--concurrency", type=int, default=livkit_rag.EMBED_CONCURRENCY)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--skip-sequential", action="store_true")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -67,6 +67,7 @@ setup(
         'llama-parse==0.5.5',
         'lxml==5.3.0',
         'marshmallow==3.22.0',
+        'motor==3.5.1',
         'mpmath==1.3.0',
         'multidict==6.1.0',
         'mypy-extensions==1.0.0',
@@ -81,6 +82,7 @@ setup(
         'pillow==10.3.0',
         'protobuf==5.28.1',
         'psutil==5.9.8',
+        'pyarrow==17.0.0',
         'pycares==4.4.0',
         'pycparser==2.22',
         'pydantic==2.9.1',
@@ -117,6 +119,7 @@ setup(
         'watchfiles==0.24.0',
         'wrapt==1.16.0',
         'yarl==1.11.1',
+        'zstandard==0.23.0',
         'marshmallow==3.22.0',
         'mpmath==1.3.0',
         'multidict==6.1.0',
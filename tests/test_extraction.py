@@ -0,0 +1,39 @@
+import time
+from app.services import extraction
+
+
+def _slow_extract(seconds):
+    time.sleep(seconds)
+    return "too late", seconds
+
+
+def test_extract_files_reads_text_files(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("hello world", encoding="utf-8")
+
+    result = extraction.extract_files([("notes.txt", str(path))], workers=1)
+
+    assert result.texts == {"notes.txt": "hello world"}
+    assert result.errors == {}
+    assert result.timings["notes.txt"]["parts"] == 1
+
+
+def test_extract_files_reports_timeouts_and_stops_workers(tmp_path, monkeypatch):
+    slow, fast = tmp_path / "slow.txt", tmp_path / "fast.txt"
+    slow.write_text("slow", encoding="utf-8")
+    fast.write_text("fast", encoding="utf-8")
+
+    def submit(pool, filename, path):
+        if filename == "slow.txt":
+            return [pool.submit(_slow_extract, 30)]
+        return [pool.submit(extraction._extract_file, filename, path)]
+
+    monkeypatch.setattr(extraction, "_submit", submit)
+    started = time.monotonic()
+
+    result = extraction.extract_files([("fast.txt", str(fast)), ("slow.txt", str(slow))], workers=2, timeout=0.5)
+
+    assert result.texts == {"fast.txt": "fast"}
+    assert result.errors == {"slow.txt": "Extraction timed out after 0.5s"}
+    # The stuck worker was terminated rather than waited for
+    assert time.monotonic() - started < 20